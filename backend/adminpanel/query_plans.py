@@ -0,0 +1,40 @@
+from blog.models import BlogPost, Comment
+from blog.query_plans import hot_query
+
+from .views import _blog_comments, _blog_list, _comment_list
+
+
+@hot_query('adminpanel: blog list')
+def blog_list():
+    return _blog_list()[:20]
+
+
+@hot_query('adminpanel: blog list by status')
+def blog_list_by_status():
+    return _blog_list(status_filter='draft')[:20]
+
+
+@hot_query('adminpanel: blog list by category')
+def blog_list_by_category():
+    return _blog_list(category_filter='1')[:20]
+
+
+@hot_query('adminpanel: comment moderation')
+def comment_moderation():
+    return _comment_list()[:20]
+
+
+@hot_query('adminpanel: comment moderation by status')
+def comment_moderation_by_status():
+    return _comment_list(status_filter='pending')[:20]
+
+
+@hot_query('adminpanel: comments of a post')
+def post_comments():
+    return _blog_comments(BlogPost(id=1))
+
+
+@hot_query('adminpanel: comment counts by status')
+def comment_counts():
+    # What comment_management counts for each status
+    return Comment.objects.filter(status='pending')
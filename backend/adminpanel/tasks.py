@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+
+from blog.models import BlogPost
+from taskqueue.queue import task
+
+User = get_user_model()
+
+
+@task(max_attempts=5)
+def delete_post(post_id):
+    # Queryset deletes still send the per-object signals that keep search,
+    # category counters and the API cache in sync.
+    BlogPost.objects.filter(id=post_id).delete()
+
+
+@task(max_attempts=5)
+def delete_user(user_id):
+    User.objects.filter(id=user_id).delete()
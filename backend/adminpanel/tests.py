@@ -1,3 +1,99 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import BlogPost, Category, Comment
+from taskqueue.models import Task
+from taskqueue.queue import claim, run_task
+
+User = get_user_model()
+
+
+@override_settings(TASKS_EAGER=False)
+class DeferredDeleteTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='password123', is_staff=True,
+        )
+        self.client.force_login(self.admin)
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='password123')
+        self.post = BlogPost.objects.create(title='Going away', content='Body', author=self.author, status='published')
+
+    def run_queued_tasks(self):
+        for task_id in claim(10):
+            self.assertEqual(run_task(task_id), 'succeeded')
+
+    def test_delete_blog_unpublishes_and_queues_delete(self):
+        response = self.client.post(reverse('adminpanel:delete_blog', args=[self.post.id]))
+        self.assertRedirects(response, reverse('adminpanel:blog_management'), fetch_redirect_response=False)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.status, 'draft')
+        self.client.post(reverse('adminpanel:delete_blog', args=[self.post.id]))
+        self.assertEqual(Task.objects.count(), 1)
+
+        self.run_queued_tasks()
+        self.assertFalse(BlogPost.objects.filter(id=self.post.id).exists())
+
+    def test_delete_user_deactivates_unpublishes_and_queues_delete(self):
+        category = Category.objects.create(name='Gone soon')
+        BlogPost.objects.filter(id=self.post.id).update(category=category)
+        Category.recount_posts()
+        self.client.post(reverse('adminpanel:delete_user', args=[self.author.id]))
+        self.author.refresh_from_db()
+        self.post.refresh_from_db()
+        category.refresh_from_db()
+        self.assertFalse(self.author.is_active)
+        self.assertEqual(self.post.status, 'draft')
+        self.assertEqual(category.published_post_count, 0)
+        self.assertEqual(self.client.get(reverse('blog:post_detail', args=[self.post.slug])).status_code, 404)
+
+        self.run_queued_tasks()
+        self.assertFalse(User.objects.filter(id=self.author.id).exists())
+        self.assertFalse(BlogPost.objects.filter(id=self.post.id).exists())
+
+    @override_settings(TASKS_EAGER=True)
+    def test_deletes_right_away_without_a_worker(self):
+        response = self.client.post(reverse('adminpanel:delete_blog', args=[self.post.id]), follow=True)
+        self.assertFalse(BlogPost.objects.filter(id=self.post.id).exists())
+        self.assertContains(response, 'has been deleted.')
+
+
+class CommentModerationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='password123', is_staff=True,
+        )
+        self.client.force_login(self.admin)
+        self.post = BlogPost.objects.create(title='Discussed', content='Body', author=self.admin, status='published')
+        self.comment = Comment.objects.create(post=self.post, author=self.admin, content='First')
+
+    def test_moderation_advances_updated_at(self):
+        # Post detail Last-Modified headers follow the comments' updated_at
+        for name in ('adminpanel:approve_comment', 'adminpanel:reject_comment'):
+            earlier = timezone.now() - timedelta(days=1)
+            Comment.objects.filter(id=self.comment.id).update(updated_at=earlier)
+            self.client.post(reverse(name, args=[self.post.id, self.comment.id]))
+            self.comment.refresh_from_db()
+            self.assertGreater(self.comment.updated_at, earlier, name)
+
+
+@override_settings(REQUEST_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='password123', is_staff=True,
+        )
+        self.client.force_login(self.admin)
+        categories = [Category.objects.create(name=f'Topic {i}') for i in range(10)]
+        for i, category in enumerate(categories):
+            post = BlogPost.objects.create(title=f'Post {i}', content='Body', author=self.admin, category=category)
+            parent = Comment.objects.create(post=post, author=self.admin, content='Question')
+            Comment.objects.create(post=post, author=self.admin, content='Answer', parent=parent)
+
+    def test_management_pages_stay_within_budget(self):
+        # Over budget raises BudgetExceeded, listing the repeated queries
+        for name in ('adminpanel:category_management', 'adminpanel:comment_management'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200, name)
@@ -8,7 +8,11 @@ from django.core.paginator import Paginator
 from django.db.models import Q
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
+from backend.instrumentation import budget
+from blog import api_cache
 from blog.models import BlogPost, Category, BlogPostAttachment, Comment
+from . import tasks
 import json
 
 User = get_user_model()
@@ -162,9 +166,25 @@ def delete_user(request, user_id):
         messages.error(request, 'You cannot delete a superuser.')
         return redirect('adminpanel:user_management')
     
-    username = user.username
-    user.delete()
-    messages.success(request, f'User {username} has been deleted successfully.')
+    # Deleting cascades through all of the user's posts, comments and likes;
+    # lock the account and unpublish the posts now, and let a worker do the
+    # deletion.
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    published = BlogPost.objects.filter(author=user, status='published')
+    category_ids = list(published.exclude(category=None).values_list('category_id', flat=True).distinct())
+    if published.update(status='draft', updated_at=timezone.now()):
+        Category.recount_posts(Category.objects.filter(id__in=category_ids))
+        api_cache.bump_generation()
+    # Row ids can be reused on SQLite, so the key also carries the join time
+    task = tasks.delete_user.enqueue(
+        user_id=user.id,
+        idempotency_key=f'delete-user:{user.id}:{user.date_joined.timestamp()}',
+    )
+    if task.status == 'succeeded':
+        messages.success(request, f'User {user.username} has been deleted.')
+    else:
+        messages.success(request, f'User {user.username} has been deactivated, their posts unpublished, and will be deleted shortly.')
     return redirect('adminpanel:user_management')
 
 
@@ -261,14 +281,7 @@ def unblock_user(request, user_id):
 
 # BLOG MANAGEMENT VIEWS
 
-@login_required
-@user_passes_test(is_admin)
-def blog_management(request):
-    """Blog management page"""
-    search_query = request.GET.get('search', '')
-    status_filter = request.GET.get('status', 'all')
-    category_filter = request.GET.get('category', 'all')
-    
+def _blog_list(search_query='', status_filter='all', category_filter='all'):
     blogs = BlogPost.objects.all().select_related('author', 'category').order_by('-created_at')
     
     if search_query:
@@ -283,6 +296,18 @@ def blog_management(request):
     
     if category_filter != 'all':
         blogs = blogs.filter(category_id=category_filter)
+    return blogs
+
+
+@login_required
+@user_passes_test(is_admin)
+def blog_management(request):
+    """Blog management page"""
+    search_query = request.GET.get('search', '')
+    status_filter = request.GET.get('status', 'all')
+    category_filter = request.GET.get('category', 'all')
+    
+    blogs = _blog_list(search_query, status_filter, category_filter)
     
     paginator = Paginator(blogs, 20)
     page_number = request.GET.get('page')
@@ -351,13 +376,10 @@ def create_blog(request):
                 featured_image=featured_image
             )
             
-            attachments = request.FILES.getlist('attachments')
-            for attachment in attachments:
-                BlogPostAttachment.objects.create(
-                    post=blog,
-                    file=attachment,
-                    title=attachment.name
-                )
+            BlogPostAttachment.objects.bulk_create([
+                BlogPostAttachment(post=blog, file=attachment, title=attachment.name)
+                for attachment in request.FILES.getlist('attachments')
+            ])
             
             messages.success(request, f'Blog post "{title}" created successfully!')
             return redirect('adminpanel:blog_detail', blog_id=blog.id)
@@ -368,12 +390,16 @@ def create_blog(request):
     return render(request, 'adminpanel/create_blog.html', {'categories': categories})
 
 
+def _blog_comments(blog):
+    return blog.comments.all().select_related('author').order_by('-created_at')
+
+
 @login_required
 @user_passes_test(is_admin)
 def blog_detail(request, blog_id):
     blog = get_object_or_404(BlogPost, id=blog_id)
     attachments = blog.attachments.all()
-    comments = blog.comments.all().select_related('author').order_by('-created_at')
+    comments = _blog_comments(blog)
     
     context = {
         'blog': blog,
@@ -390,7 +416,7 @@ def approve_comment(request, blog_id, comment_id):
     blog = get_object_or_404(BlogPost, id=blog_id)
     comment = get_object_or_404(Comment, id=comment_id, post=blog)
     comment.status = 'approved'
-    comment.save(update_fields=['status'])
+    comment.save(update_fields=['status', 'updated_at'])
     messages.success(request, 'Comment approved.')
     return redirect('adminpanel:blog_detail', blog_id=blog.id)
 
@@ -402,19 +428,13 @@ def reject_comment(request, blog_id, comment_id):
     blog = get_object_or_404(BlogPost, id=blog_id)
     comment = get_object_or_404(Comment, id=comment_id, post=blog)
     comment.status = 'rejected'
-    comment.save(update_fields=['status'])
+    comment.save(update_fields=['status', 'updated_at'])
     messages.success(request, 'Comment rejected.')
     return redirect('adminpanel:blog_detail', blog_id=blog.id)
 
 
-@login_required
-@user_passes_test(is_admin)
-def comment_management(request):
-    search_query = request.GET.get('search', '')
-    status_filter = request.GET.get('status', 'all')
-    post_filter = request.GET.get('post', 'all')
-    
-    comments = Comment.objects.all().select_related('author', 'post').order_by('-created_at')
+def _comment_list(search_query='', status_filter='all', post_filter='all'):
+    comments = Comment.objects.all().select_related('author', 'post', 'parent__author').order_by('-created_at')
     
     if search_query:
         comments = comments.filter(
@@ -428,6 +448,18 @@ def comment_management(request):
     
     if post_filter != 'all':
         comments = comments.filter(post_id=post_filter)
+    return comments
+
+
+@budget(queries=14)
+@login_required
+@user_passes_test(is_admin)
+def comment_management(request):
+    search_query = request.GET.get('search', '')
+    status_filter = request.GET.get('status', 'all')
+    post_filter = request.GET.get('post', 'all')
+    
+    comments = _comment_list(search_query, status_filter, post_filter)
     
     paginator = Paginator(comments, 20)
     page_number = request.GET.get('page')
@@ -461,7 +493,8 @@ def comment_management(request):
 def bulk_approve_comments(request):
     comment_ids = request.POST.getlist('comment_ids')
     if comment_ids:
-        updated = Comment.objects.filter(id__in=comment_ids).update(status='approved')
+        updated = Comment.objects.filter(id__in=comment_ids).update(status='approved', updated_at=timezone.now())
+        api_cache.bump_generation()
         messages.success(request, f'{updated} comments approved successfully.')
     else:
         messages.warning(request, 'No comments selected.')
@@ -474,7 +507,8 @@ def bulk_approve_comments(request):
 def bulk_reject_comments(request):
     comment_ids = request.POST.getlist('comment_ids')
     if comment_ids:
-        updated = Comment.objects.filter(id__in=comment_ids).update(status='rejected')
+        updated = Comment.objects.filter(id__in=comment_ids).update(status='rejected', updated_at=timezone.now())
+        api_cache.bump_generation()
         messages.success(request, f'{updated} comments rejected successfully.')
     else:
         messages.warning(request, 'No comments selected.')
@@ -548,13 +582,10 @@ def edit_blog(request, blog_id):
             blog.save()
             
             # Handle new attachments
-            attachments = request.FILES.getlist('attachments')
-            for attachment in attachments:
-                BlogPostAttachment.objects.create(
-                    post=blog,
-                    file=attachment,
-                    title=attachment.name
-                )
+            BlogPostAttachment.objects.bulk_create([
+                BlogPostAttachment(post=blog, file=attachment, title=attachment.name)
+                for attachment in request.FILES.getlist('attachments')
+            ])
             
             messages.success(request, f'Blog post "{blog.title}" updated successfully!')
             return redirect('adminpanel:blog_detail', blog_id=blog.id)
@@ -575,9 +606,18 @@ def edit_blog(request, blog_id):
 @require_POST
 def delete_blog(request, blog_id):
     blog = get_object_or_404(BlogPost, id=blog_id)
-    title = blog.title
-    blog.delete()
-    messages.success(request, f'Blog post "{title}" has been deleted successfully.')
+    # Unpublish right away; the cascading delete runs in a worker
+    if blog.status != 'draft':
+        blog.status = 'draft'
+        blog.save(update_fields=['status', 'updated_at'])
+    task = tasks.delete_post.enqueue(
+        post_id=blog.id,
+        idempotency_key=f'delete-post:{blog.id}:{blog.created_at.timestamp()}',
+    )
+    if task.status == 'succeeded':
+        messages.success(request, f'Blog post "{blog.title}" has been deleted.')
+    else:
+        messages.success(request, f'Blog post "{blog.title}" has been unpublished and will be deleted shortly.')
     return redirect('adminpanel:blog_management')
 
 
@@ -593,6 +633,7 @@ def delete_attachment(request, blog_id, attachment_id):
 
 # CATEGORY MANAGEMENT VIEWS
 
+@budget(queries=6)
 @login_required
 @user_passes_test(is_admin)
 def category_management(request):
@@ -606,10 +647,6 @@ def category_management(request):
             Q(description__icontains=search_query)
         )
     
-    # Add post count for each category
-    for category in categories:
-        category.post_count = category.posts.count()
-    
     context = {
         'categories': categories,
         'search_query': search_query,
@@ -0,0 +1,104 @@
+"""
+Primary/replica database routing.
+
+Views decorated with @replica_reads read the blog's tables from a random
+one of DATABASE_REPLICAS; every other read, and every write, goes to the
+primary ('default'). Replicas may lag behind the primary, so a request
+stays on the primary for its remaining reads once it has written, and a
+visitor who has just written (any unsafe request) gets a cookie keeping
+them on the primary for DATABASE_REPLICA_PIN seconds, long enough for
+replication to catch up with what they wrote.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class _Routing:
+    __slots__ = ('pinned',)
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+
+
+# Set while a @replica_reads view runs; sync_to_async carries it along
+_routing = ContextVar('db_routing', default=None)
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _pinned(request):
+    return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+
+def replica_reads(view):
+    """Let `view` read from the replicas, unless the visitor has just written."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = _routing.set(_Routing(_pinned(request)))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _routing.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _routing.set(_Routing(_pinned(request)))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _routing.reset(token)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    # Sessions and users always come from the primary, so logins and
+    # logouts take effect at once
+    route_app_labels = {'blog'}
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        replicas = _replicas()
+        if routing is None or routing.pinned or not replicas or model._meta.app_label not in self.route_app_labels:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary through replication
+        if db in _replicas():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """Keep visitors who have just written on the primary for a while."""
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS and _replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'DATABASE_REPLICA_PIN', 10),
+                httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
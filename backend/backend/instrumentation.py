@@ -0,0 +1,254 @@
+"""
+Per-request query and latency instrumentation.
+
+RequestInstrumentationMiddleware counts the SQL queries of every request
+and times them and the whole request. It keeps per-URL-name totals in
+`stats`, and adds a Server-Timing header when SERVER_TIMING is on.
+Queries that repeat with only their parameters changing (more than
+REQUEST_DUPLICATE_QUERY_THRESHOLD times) are reported by fingerprint, as
+they usually mean an N+1 loop.
+
+Views declare what they may spend with @budget(queries=..., ms=...).
+Views without a declaration fall back to REQUEST_QUERY_BUDGET and
+REQUEST_TIME_BUDGET_MS. Requests over budget, or with duplicated queries,
+are logged. With REQUEST_BUDGET_STRICT on (for tests), a view that runs
+more queries than it declared raises BudgetExceeded instead.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+class Budget:
+    __slots__ = ('queries', 'ms')
+
+    def __init__(self, queries=None, ms=None):
+        self.queries = queries
+        self.ms = ms
+
+
+def budget(queries=None, ms=None):
+    """Declare that a view runs at most `queries` queries and takes at most `ms` milliseconds."""
+    def decorate(view):
+        view.request_budget = Budget(queries, ms)
+        return view
+    return decorate
+
+
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def fingerprint(sql):
+    """`sql` with literals and IN lists of any length normalized away."""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _LITERAL.sub('?', sql)
+
+
+class Recording:
+    """The queries of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.budget = None
+
+    def add(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        if not sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        threshold = getattr(settings, 'REQUEST_DUPLICATE_QUERY_THRESHOLD', 3)
+        return {sql: count for sql, count in self.fingerprints.most_common() if count > threshold}
+
+
+_recording = ContextVar('request_recording', default=None)
+
+
+def _record(execute, sql, params, many, context):
+    recording = _recording.get()
+    if recording is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recording.add(sql, time.perf_counter() - started)
+
+
+def _install(connection, **kwargs):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+# Connections are per thread (and async views query from worker threads),
+# so the wrapper goes onto every connection as it is opened
+connection_created.connect(_install)
+
+
+class RouteStats:
+    __slots__ = ('requests', 'queries', 'sql_time', 'wall_time', 'max_queries', 'over_budget', 'duplicated')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.wall_time = 0.0
+        self.max_queries = 0
+        self.over_budget = 0
+        self.duplicated = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Stats:
+    """Totals per URL name, for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, name, recording, wall_time, over_budget):
+        with self._lock:
+            route = self._routes.get(name)
+            if route is None:
+                route = self._routes[name] = RouteStats()
+            route.requests += 1
+            route.queries += recording.queries
+            route.sql_time += recording.sql_time
+            route.wall_time += wall_time
+            route.max_queries = max(route.max_queries, recording.queries)
+            route.over_budget += bool(over_budget)
+            route.duplicated += bool(recording.duplicates())
+
+    def snapshot(self):
+        with self._lock:
+            return {name: route.as_dict() for name, route in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+stats = Stats()
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for connection in connections.all():
+            _install(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION_ENABLED', True):
+            started = time.perf_counter()
+            response = self.get_response(request)
+            return self.record_metrics(request, response, time.perf_counter() - started)
+        recording = Recording()
+        token = _recording.set(recording)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recording.reset(token)
+        return self.finish(request, response, recording)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION_ENABLED', True):
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            return self.record_metrics(request, response, time.perf_counter() - started)
+        recording = Recording()
+        token = _recording.set(recording)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recording.reset(token)
+        return self.finish(request, response, recording)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        recording = _recording.get()
+        if recording is not None:
+            recording.budget = getattr(view_func, 'request_budget', None)
+
+    @staticmethod
+    def view_name(request):
+        match = request.resolver_match
+        return match.view_name if match else '<unresolved>'
+
+    def record_metrics(self, request, response, wall_time):
+        # Without instrumentation queries go uncounted, but responses still are
+        metrics.record_request(self.view_name(request), request.method, response.status_code, wall_time)
+        return response
+
+    def finish(self, request, response, recording):
+        wall_time = time.perf_counter() - recording.started
+        name = self.view_name(request)
+        declared = recording.budget or Budget()
+        query_budget = declared.queries
+        if query_budget is None:
+            query_budget = getattr(settings, 'REQUEST_QUERY_BUDGET', 50)
+        time_budget = declared.ms
+        if time_budget is None:
+            time_budget = getattr(settings, 'REQUEST_TIME_BUDGET_MS', 500)
+        over_budget = []
+        if recording.queries > query_budget:
+            over_budget.append(f'{recording.queries} queries (budget {query_budget})')
+        if wall_time * 1000 > time_budget:
+            over_budget.append(f'{wall_time * 1000:.0f} ms (budget {time_budget} ms)')
+        duplicates = ''.join(f'\n  {count}x {sql}' for sql, count in recording.duplicates().items())
+        stats.add(name, recording, wall_time, over_budget)
+        metrics.record_request(
+            name, request.method, response.status_code, wall_time, recording.queries, recording.sql_time,
+        )
+
+        if (
+            declared.queries is not None and recording.queries > declared.queries
+            and getattr(settings, 'REQUEST_BUDGET_STRICT', False)
+        ):
+            raise BudgetExceeded(
+                f'{name} ran {recording.queries} queries, over its budget of {declared.queries}{duplicates}'
+            )
+        if over_budget or duplicates:
+            logger.warning(
+                '%s %s (%s): %s%s', request.method, request.path, name,
+                ', '.join(over_budget) or 'within budget', duplicates,
+            )
+        if getattr(settings, 'SERVER_TIMING', False):
+            timing = (
+                f'db;dur={recording.sql_time * 1000:.1f};desc="{recording.queries} queries", '
+                f'total;dur={wall_time * 1000:.1f}'
+            )
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        return response
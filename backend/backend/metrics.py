@@ -0,0 +1,288 @@
+"""
+Prometheus metrics for the site, served as text at /metrics/.
+
+Counters and histograms live in a dict per process, so recording costs a
+lock and a few additions and never touches the disk. When METRICS_DIR is
+set, every process also writes its totals to a file of its own there every
+METRICS_FLUSH_INTERVAL seconds (and at exit), and the endpoint adds up the
+files of all processes, so any worker can answer a scrape for the whole
+server. Files of stopped processes are kept, so their counts never vanish;
+clear the directory when deploying. Without METRICS_DIR the endpoint
+reports its own process only.
+
+Request latency, status codes and query counts are recorded per URL name
+by backend.instrumentation, with URL names outside METRICS_NAMESPACES
+grouped as 'other'. METRICS_TOKEN, when set, has to be sent as a bearer
+token to read the endpoint; without it only logged-in staff can read it.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._stopped = threading.Event()
+        self._path = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', '')
+
+    def ensure_flusher(self):
+        if self._flusher is not None or not self.directory:
+            return
+        with self._flush_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name='metrics-flusher', daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to write metrics to %s', self.directory)
+
+    def flush(self):
+        """Write this process's totals to its file in METRICS_DIR."""
+        directory = self.directory
+        if not directory:
+            return
+        with self._flush_lock:
+            if self._path is None:
+                os.makedirs(directory, exist_ok=True)
+                # The start time keeps a recycled pid from taking over a dead process's file
+                self._path = os.path.join(directory, f'{os.getpid()}-{time.time_ns()}.json')
+            temporary = f'{self._path}.tmp'
+            with open(temporary, 'w') as f:
+                json.dump({name: list(values.items()) for name, values in self.snapshot().items()}, f)
+            os.replace(temporary, self._path)
+
+    def collect(self):
+        """Totals across every process that has written to METRICS_DIR, or of this process alone."""
+        directory = self.directory
+        if not directory:
+            return self.snapshot()
+        self.flush()
+        totals = {name: {} for name in self.metrics}
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as f:
+                    written = json.load(f)
+            except (OSError, ValueError):
+                continue  # Removed while being read
+            for name, values in written.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue  # Written by an older release
+                for labels, value in values:
+                    metric.merge(totals[name], tuple(labels), value)
+        return totals
+
+    def after_fork(self):
+        # Forked workers start over with their own counts, file and flusher
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._path = None
+        self.reset()
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to write metrics at shutdown')
+
+
+registry = Registry()
+atexit.register(registry.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.after_fork)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: self._copy(value) for labels, value in self._values.items()}
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+        registry.ensure_flusher()
+
+    @staticmethod
+    def merge(totals, labels, value):
+        totals[labels] = totals.get(labels, 0) + value
+
+    def samples(self, values):
+        for labels, value in values.items():
+            yield self.name, labels, (), value
+
+
+class Histogram(Metric):
+    """Observations counted in buckets, stored per bucket and added up for exposition."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One count per bucket, one above the last bucket, then the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+        registry.ensure_flusher()
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    @staticmethod
+    def merge(totals, labels, value):
+        counts = totals.get(labels)
+        if counts is None:
+            totals[labels] = list(value)
+        else:
+            totals[labels] = [a + b for a, b in zip(counts, value)]
+
+    def samples(self, values):
+        for labels, counts in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', labels, (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', labels, (), counts[-1]
+            yield f'{self.name}_count', labels, (), cumulative
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return f'{value:.1f}'
+    return repr(value)
+
+
+def exposition(totals=None):
+    """`totals` (by default, collect()) in the Prometheus text format."""
+    totals = registry.collect() if totals is None else totals
+    lines = []
+    for name, metric in registry.metrics.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for sample, labels, extra, value in metric.samples(dict(sorted(totals.get(name, {}).items()))):
+            pairs = [*zip(metric.labelnames, labels), *extra]
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in pairs)
+            lines.append(f'{sample}{{{label_text}}} {_format_value(value)}' if label_text
+                         else f'{sample} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+def record_request(view_name, method, status, duration, queries=None, query_time=None):
+    """
+    Count a response of the view named `view_name` (URL names outside
+    METRICS_NAMESPACES count as 'other'). `queries` and `query_time` are
+    None when queries were not counted.
+    """
+    namespace, colon, _ = view_name.partition(':')
+    view = view_name if colon and namespace in settings.METRICS_NAMESPACES else 'other'
+    method = method if method in _METHODS else 'other'
+    REQUESTS.inc(view, method, str(status))
+    REQUEST_LATENCY.observe(duration, view, method)
+    if queries is not None:
+        DB_QUERIES.inc(view, amount=queries)
+        DB_TIME.inc(view, amount=query_time)
+
+
+def _can_scrape(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+@require_GET
+def metrics_view(request):
+    if not _can_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
+
+
+REQUESTS = Counter('django_http_requests_total', 'Responses by URL name, method and status code',
+                   ('view', 'method', 'status'))
+REQUEST_LATENCY = Histogram('django_http_request_duration_seconds', 'Time to respond, by URL name and method',
+                            ('view', 'method'))
+DB_QUERIES = Counter('django_db_queries_total', 'SQL queries run while responding, by URL name', ('view',))
+DB_TIME = Counter('django_db_query_duration_seconds_total', 'Time spent in SQL queries, by URL name', ('view',))
+POST_VIEWS = Counter('blog_post_views_total', 'Post views counted')
+LIKES = Counter('blog_likes_total', 'Posts liked and unliked', ('action',))
+COMMENTS = Counter('blog_comments_total', 'Comments posted')
+API_CACHE = Counter('blog_api_cache_requests_total', 'JSON API response cache lookups', ('result',))
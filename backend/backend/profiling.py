@@ -0,0 +1,216 @@
+"""
+On-demand profiling of selected requests.
+
+With REQUEST_PROFILING_ENABLED on, ProfilingMiddleware profiles a request
+when it carries a valid signed X-Profile header (see make_token and
+`manage.py profile_token`), when its URL name is in
+REQUEST_PROFILING_URL_NAMES, or at random for REQUEST_PROFILING_SAMPLE_RATE
+of requests. Profiles are written to REQUEST_PROFILING_DIR, which keeps the
+newest REQUEST_PROFILING_MAX_FILES; `manage.py aggregate_profiles` sums up
+the top functions across them.
+
+Two profilers are available. 'sample' looks at the request thread's stack
+every REQUEST_PROFILING_INTERVAL seconds from a second thread and writes the
+stacks it saw, one `frame;frame;... count` line each; the request itself
+runs at full speed. 'cprofile' traces every call with cProfile and writes
+pstats files, with exact call counts but a slower request. With profiling
+disabled the middleware removes itself at startup, so it costs nothing.
+Async views run on the event loop thread, which neither profiler sees.
+"""
+import cProfile
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+MODES = ('sample', 'cprofile')
+EXTENSIONS = {'sample': '.stacks', 'cprofile': '.prof'}
+_SALT = 'backend.profiling'
+
+
+def make_token(mode=None):
+    """A value for the X-Profile header, valid for REQUEST_PROFILING_TOKEN_MAX_AGE seconds."""
+    mode = mode or settings.REQUEST_PROFILING_MODE
+    if mode not in MODES:
+        raise ValueError(f'Unknown profiling mode {mode!r}, expected one of {", ".join(MODES)}')
+    return signing.TimestampSigner(salt=_SALT).sign(mode)
+
+
+def _token_mode(token):
+    try:
+        mode = signing.TimestampSigner(salt=_SALT).unsign(token, max_age=settings.REQUEST_PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return mode if mode in MODES else None
+
+
+def _label(code):
+    # Same format as pstats, so both kinds of profile aggregate alike
+    return f'{code.co_filename}:{code.co_firstlineno}({code.co_name})'
+
+
+class Sampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.mode = settings.REQUEST_PROFILING_MODE
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        self.url_names = frozenset(settings.REQUEST_PROFILING_URL_NAMES)
+        self.directory = settings.REQUEST_PROFILING_DIR
+        self.max_files = settings.REQUEST_PROFILING_MAX_FILES
+        self.interval = settings.REQUEST_PROFILING_INTERVAL
+
+    def __call__(self, request):
+        mode, requested = self.select(request)
+        if mode is None:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one cProfile at a time per process
+                return self.get_response(request)
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        else:
+            profiler = Sampler(self.interval)
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+
+        name = self.save(request, profiler, mode, time.perf_counter() - started)
+        if requested:
+            response[f'{HEADER}-Id'] = name
+        return response
+
+    def select(self, request):
+        """The profiler to run for `request` (or None) and whether the header asked for it."""
+        token = request.headers.get(HEADER)
+        if token:
+            mode = _token_mode(token)
+            if mode is not None:
+                return mode, True
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.mode, False
+        if self.url_names and self.url_name(request) in self.url_names:
+            return self.mode, False
+        return None, False
+
+    @staticmethod
+    def url_name(request):
+        try:
+            return resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+
+    def save(self, request, profiler, mode, elapsed):
+        name = (self.url_name(request) or 'unresolved').replace(':', '.')
+        filename = (
+            f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{elapsed * 1000:.0f}ms-{os.getpid()}'
+            f'-{random.randrange(16 ** 4):04x}{EXTENSIONS[mode]}'
+        )
+        path = os.path.join(self.directory, filename)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if mode == 'cprofile':
+                profiler.dump_stats(path)
+            else:
+                profiler.dump(path)
+            self.rotate()
+        except OSError:
+            logger.exception('Could not save the profile of %s %s', request.method, request.path)
+        return filename
+
+    def rotate(self):
+        profiles = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(tuple(EXTENSIONS.values()))),
+            key=lambda entry: entry.stat().st_mtime_ns,
+        )
+        for entry in profiles[:max(len(profiles) - self.max_files, 0)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # Another process rotated it first
+
+
+def profile_paths(directory, name=None):
+    """The profiles in `directory`, oldest first, optionally only those of URL names containing `name`."""
+    if not os.path.isdir(directory):
+        return []
+    paths = [
+        entry.path for entry in os.scandir(directory)
+        if entry.name.endswith(tuple(EXTENSIONS.values())) and (not name or name.replace(':', '.') in entry.name)
+    ]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def load_samples(paths):
+    """Sample counts per function across `paths`: (samples, own, total)."""
+    own = Counter()
+    total = Counter()
+    samples = 0
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if not stack:
+                    continue
+                count = int(count)
+                frames = stack.split(';')
+                samples += count
+                own[frames[-1]] += count
+                for frame in set(frames):
+                    total[frame] += count
+    return samples, own, total
@@ -48,9 +48,12 @@ INSTALLED_APPS = [
     'userapp',
     'blog',
     'adminpanel',
+    'taskqueue',
 ]
 
 MIDDLEWARE = [
+    'backend.instrumentation.RequestInstrumentationMiddleware',
+    'backend.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.db_router.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -91,6 +95,60 @@ DATABASES = {
     }
 }
 
+# SQLite tuning
+# Every new connection runs the SQLITE_PRAGMAS. SQLITE_WAL=True switches the
+# database to WAL, which lets reads carry on while a write commits, with
+# synchronous=NORMAL, durable enough in WAL mode. WAL is stored in the
+# database file and leaves -wal/-shm files beside it, so it is off by default
+# to keep the checked-in dev database untouched; deployments turn it on.
+# Transactions BEGIN IMMEDIATE, taking the write lock up front: a deferred
+# transaction that reads and then writes fails with "database is locked" as
+# soon as another connection has written, without waiting. Read-only
+# atomic() blocks on the primary take the write lock too; replicas are
+# unaffected. Lock waits give up after SQLITE_BUSY_TIMEOUT seconds.
+# Connections persist for DB_CONN_MAX_AGE seconds. SQLITE_TUNING=False keeps
+# Django's defaults.
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'True').lower() == 'true'
+SQLITE_WAL = os.getenv('SQLITE_WAL', 'False').lower() == 'true'
+SQLITE_PRAGMAS = {
+    # Negative sizes are in KiB
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
+}
+if SQLITE_WAL:
+    SQLITE_PRAGMAS.update(journal_mode='WAL', synchronous=os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '20'))
+SQLITE_TRANSACTION_MODE = os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE')
+if SQLITE_TUNING:
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': SQLITE_TRANSACTION_MODE,
+        },
+    })
+
+# Read replicas
+# SQLITE_REPLICAS names SQLite files (comma-separated) holding copies of the
+# primary database, kept current outside Django (e.g. by Litestream or
+# LiteFS). The blog list, category and detail pages and the public JSON API
+# read from them; writes, and reads elsewhere, go to the primary. Replica
+# connections are read-only. After any POST a visitor reads from the primary
+# for DATABASE_REPLICA_PIN seconds, to see their own writes.
+DATABASE_ROUTERS = ['backend.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+for _number, _path in enumerate(filter(None, os.getenv('SQLITE_REPLICAS', '').split(',')), 1):
+    _options = dict(DATABASES['default'].get('OPTIONS', {}))
+    _options['init_command'] = ';'.join(filter(None, [_options.get('init_command'), 'PRAGMA query_only=1']))
+    DATABASES[f'replica{_number}'] = {
+        **DATABASES['default'], 'NAME': _path, 'OPTIONS': _options, 'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{_number}')
+DATABASE_REPLICA_PIN = int(os.getenv('DATABASE_REPLICA_PIN', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -189,6 +247,147 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Blog view counter
+# Post views are buffered per process and written back in one batched UPDATE
+# every BLOG_VIEW_COUNT_FLUSH_INTERVAL seconds (0 disables the timer) or as
+# soon as BLOG_VIEW_COUNT_BATCH_SIZE views are pending.
+BLOG_VIEW_COUNT_FLUSH_INTERVAL = float(os.getenv('BLOG_VIEW_COUNT_FLUSH_INTERVAL', '5'))
+BLOG_VIEW_COUNT_BATCH_SIZE = int(os.getenv('BLOG_VIEW_COUNT_BATCH_SIZE', '100'))
+# A visitor's views of the same post count once per 1-2 BLOG_VIEWED_POSTS_WINDOW
+# seconds, tracked in a cookie holding two Bloom filters of BLOG_VIEWED_POSTS_BITS.
+BLOG_VIEWED_POSTS_WINDOW = int(os.getenv('BLOG_VIEWED_POSTS_WINDOW', '86400'))
+BLOG_VIEWED_POSTS_BITS = 2048
+
+# Write queue
+# Likes, comments and view count flushes are handed to one writer thread per
+# process, which commits whatever has queued up in one transaction of at most
+# BLOG_WRITE_QUEUE_BATCH_SIZE writes. Past BLOG_WRITE_QUEUE_MAX_SIZE queued
+# writes, or after waiting BLOG_WRITE_QUEUE_TIMEOUT seconds, a request writes
+# inline instead.
+BLOG_WRITE_QUEUE_ENABLED = os.getenv('BLOG_WRITE_QUEUE_ENABLED', 'True').lower() == 'true'
+BLOG_WRITE_QUEUE_BATCH_SIZE = int(os.getenv('BLOG_WRITE_QUEUE_BATCH_SIZE', '100'))
+BLOG_WRITE_QUEUE_MAX_SIZE = int(os.getenv('BLOG_WRITE_QUEUE_MAX_SIZE', '1000'))
+BLOG_WRITE_QUEUE_TIMEOUT = float(os.getenv('BLOG_WRITE_QUEUE_TIMEOUT', '5'))
+
+# Related posts
+# manage.py build_related_posts computes the top-K most similar posts for
+# every published post; saves then refresh a single post against the vectors
+# persisted in BLOG_RELATED_POSTS_INDEX_DIR by the last build. Builds rank
+# similarities in blocks of at most BLOG_RELATED_POSTS_BLOCK_MEMORY bytes.
+BLOG_RELATED_POSTS_TOP_K = 5
+BLOG_RELATED_POSTS_DIMENSIONS = 256
+BLOG_RELATED_POSTS_INCREMENTAL = True
+BLOG_RELATED_POSTS_BLOCK_MEMORY = 64 * 1024 * 1024
+BLOG_RELATED_POSTS_INDEX_DIR = BASE_DIR / 'var' / 'related_posts'
+
+# Featured image variants
+# Resized copies of featured images (name -> max width in pixels) in every
+# format of BLOG_IMAGE_FORMATS, generated by BLOG_IMAGE_WORKERS background
+# threads after a post's image changes. manage.py build_image_variants
+# backfills existing posts.
+BLOG_IMAGE_VARIANTS = {'thumbnail': 320, 'card': 640, 'hero': 1280}
+BLOG_IMAGE_FORMATS = ('webp', 'jpeg')
+BLOG_IMAGE_QUALITY = 80
+BLOG_IMAGE_WORKERS = int(os.getenv('BLOG_IMAGE_WORKERS', '2'))
+BLOG_IMAGE_ASYNC = True
+
+# Background tasks
+# Work queued through taskqueue is stored in the database and run by
+# `manage.py run_workers`. Failed tasks are retried up to TASKS_MAX_ATTEMPTS
+# times, waiting TASKS_RETRY_BACKOFF * 2^(attempt - 1) seconds (jittered,
+# capped at TASKS_RETRY_BACKOFF_MAX). Running tasks older than
+# TASKS_LEASE_TIMEOUT seconds are assumed lost and retried. TASKS_EAGER runs
+# tasks inline at enqueue time, for development without a worker; it is on
+# by default with DEBUG, so production (DEBUG off) needs run_workers.
+TASKS_EAGER = os.getenv('TASKS_EAGER', str(DEBUG)).lower() == 'true'
+TASKS_MAX_ATTEMPTS = 3
+TASKS_RETRY_BACKOFF = 5
+TASKS_RETRY_BACKOFF_MAX = 600
+TASKS_LEASE_TIMEOUT = 600
+
+# Async API
+# Serve the public JSON API from the native async views in blog.async_views.
+# Enable when running under an ASGI server (uvicorn backend.asgi:application);
+# under WSGI each async view would need its own event loop.
+BLOG_ASYNC_API = os.getenv('BLOG_ASYNC_API', 'False').lower() == 'true'
+
+# Bulk export
+# /api/export/posts/ streams every published post with its full content.
+# Clients send BLOG_EXPORT_TOKEN as a bearer token; logged-in staff can
+# always use it, and while the token is unset only they can.
+BLOG_EXPORT_TOKEN = os.getenv('BLOG_EXPORT_TOKEN', '')
+
+# Caches
+# The public JSON API caches responses in BLOG_API_CACHE_ALIAS. Local memory is
+# per process, and writes only invalidate the cache of the process that made
+# them, so deployments with several workers must point it at a shared backend,
+# e.g. BLOG_API_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with BLOG_API_CACHE_LOCATION=/var/tmp/dailyscribbles-api-cache.
+# `manage.py check --deploy` warns (blog.W001) while it is local memory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'blog_api': {
+        'BACKEND': os.getenv('BLOG_API_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('BLOG_API_CACHE_LOCATION', 'blog-api'),
+    },
+}
+BLOG_API_CACHE_ALIAS = 'blog_api'
+BLOG_API_CACHE_ENABLED = os.getenv('BLOG_API_CACHE_ENABLED', 'True').lower() == 'true'
+BLOG_API_CACHE_TIMEOUT = int(os.getenv('BLOG_API_CACHE_TIMEOUT', '300'))
+
+# Request instrumentation
+# Every request's SQL queries are counted and timed per URL name. Views
+# declare budgets with @backend.instrumentation.budget; the rest get
+# REQUEST_QUERY_BUDGET queries and REQUEST_TIME_BUDGET_MS milliseconds.
+# Requests over budget, or repeating one query more than
+# REQUEST_DUPLICATE_QUERY_THRESHOLD times (N+1), are logged as warnings.
+# REQUEST_BUDGET_STRICT makes a view over its declared query budget raise,
+# for tests. SERVER_TIMING adds a Server-Timing header with the numbers.
+# REQUEST_INSTRUMENTATION_ENABLED=False stops counting queries; /metrics/
+# still counts responses and their latency.
+REQUEST_INSTRUMENTATION_ENABLED = os.getenv('REQUEST_INSTRUMENTATION_ENABLED', 'True').lower() == 'true'
+REQUEST_QUERY_BUDGET = int(os.getenv('REQUEST_QUERY_BUDGET', '50'))
+REQUEST_TIME_BUDGET_MS = int(os.getenv('REQUEST_TIME_BUDGET_MS', '500'))
+REQUEST_DUPLICATE_QUERY_THRESHOLD = 3
+REQUEST_BUDGET_STRICT = os.getenv('REQUEST_BUDGET_STRICT', 'False').lower() == 'true'
+SERVER_TIMING = os.getenv('SERVER_TIMING', str(DEBUG)).lower() == 'true'
+
+# Metrics
+# /metrics/ serves Prometheus metrics: latency histograms, status codes and
+# query counts per URL name of the METRICS_NAMESPACES apps, and counters of
+# post views, likes, comments and API cache lookups. With several worker
+# processes, point METRICS_DIR at a directory they share (cleared at each
+# deploy); each process writes its totals there every METRICS_FLUSH_INTERVAL
+# seconds and scrapes add them up. Scrapers send METRICS_TOKEN as a bearer
+# token; while it is unset only logged-in staff can read /metrics/.
+METRICS_NAMESPACES = ('blog', 'userapp', 'adminpanel')
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Request profiling
+# With REQUEST_PROFILING_ENABLED, requests are profiled when they carry a
+# signed X-Profile header (`manage.py profile_token`), when their URL name is
+# in REQUEST_PROFILING_URL_NAMES (comma-separated), or at random for
+# REQUEST_PROFILING_SAMPLE_RATE of them. 'sample' mode records the stack every
+# REQUEST_PROFILING_INTERVAL seconds; 'cprofile' traces every call, slowing
+# the request down. The newest REQUEST_PROFILING_MAX_FILES profiles are kept
+# in REQUEST_PROFILING_DIR; `manage.py aggregate_profiles` sums them up.
+REQUEST_PROFILING_ENABLED = os.getenv('REQUEST_PROFILING_ENABLED', 'False').lower() == 'true'
+REQUEST_PROFILING_MODE = os.getenv('REQUEST_PROFILING_MODE', 'sample')
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv('REQUEST_PROFILING_SAMPLE_RATE', '0'))
+REQUEST_PROFILING_URL_NAMES = [name for name in os.getenv('REQUEST_PROFILING_URL_NAMES', '').split(',') if name]
+REQUEST_PROFILING_INTERVAL = 0.005
+REQUEST_PROFILING_DIR = os.getenv('REQUEST_PROFILING_DIR', str(BASE_DIR / 'var' / 'profiles'))
+REQUEST_PROFILING_MAX_FILES = int(os.getenv('REQUEST_PROFILING_MAX_FILES', '200'))
+REQUEST_PROFILING_TOKEN_MAX_AGE = 3600
+
+# Batch API
+# Upper bound on the slugs one /api/posts-batch/ request may ask for.
+BLOG_API_BATCH_MAX_SLUGS = int(os.getenv('BLOG_API_BATCH_MAX_SLUGS', '100'))
+
 # Cloud Storage Configuration
 USE_S3 = os.getenv('USE_S3', 'False').lower() == 'true'
 
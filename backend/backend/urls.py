@@ -21,6 +21,8 @@ from django.conf.urls.static import static
 
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from backend.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('adminpanel/', include('adminpanel.urls')),
@@ -30,6 +32,8 @@ urlpatterns = [
     # JWT token endpoints
     path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    # Prometheus scrape endpoint
+    path('metrics/', metrics_view, name='metrics'),
     path('', include('blog.urls')),
 ]
 
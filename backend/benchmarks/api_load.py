@@ -0,0 +1,236 @@
+"""
+Load benchmark of the public JSON API under WSGI and ASGI.
+
+Seeds a scratch copy of the database, then for each mode starts a server
+(gunicorn with threaded workers running the sync views, uvicorn running the
+async views from blog.async_views), drives it with many concurrent
+keep-alive connections and reports requests/sec and latency percentiles.
+The request mix is weighted towards the list and detail endpoints and
+each connection keeps its session cookie, like a browser would.
+
+    cd backend
+    pip install gunicorn uvicorn
+    python -m benchmarks.api_load --concurrency 200 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(db_path, posts, categories, words_per_post=400):
+    """Copy the dev database, migrate it and top it up with synthetic posts."""
+    shutil.copy(os.path.join(BACKEND_DIR, 'db.sqlite3'), db_path)
+    os.environ['BENCHMARK_DB'] = db_path
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    from blog import importer
+    from blog.models import BlogPost
+
+    User = get_user_model()
+    author, _ = User.objects.get_or_create(username='bench', defaults={'email': 'bench@example.com'})
+    missing = posts - BlogPost.objects.filter(status='published').count()
+    if missing > 0:
+        rng = random.Random(0)
+        words = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor'.split()
+        records = (
+            {
+                'title': f'Benchmark post {i}',
+                'content': ' '.join(rng.choice(words) for _ in range(words_per_post)),
+                'author': author.username,
+                'category': f'Category {i % categories}',
+                'status': 'published',
+            }
+            for i in range(missing)
+        )
+        importer.PostImporter(create_categories=True).run(records)
+    return list(BlogPost.objects.filter(status='published').values_list('slug', flat=True))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(mode, port, workers, threads):
+    if mode == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', 'backend.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+            '--worker-class', 'gthread', '--threads', str(threads),
+            '--log-level', 'warning',
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'backend.asgi:application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+        '--log-level', 'warning', '--no-access-log',
+    ]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client with a cookie jar of one session."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+        self.cookie = None
+
+    async def request(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        headers = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+        if self.cookie:
+            headers += f'Cookie: {self.cookie}\r\n'
+        self.writer.write((headers + '\r\n').encode())
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        close = False
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name = name.lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                close = True
+            elif name == 'set-cookie' and value.strip().startswith('sessionid='):
+                self.cookie = value.strip().split(';')[0]
+        await self.reader.readexactly(length)
+        if close:
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def drive(port, paths, weights, concurrency, duration, warmup):
+    latencies = []
+    errors = Counter()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def client():
+        conn = Connection(port)
+        rng = random.Random()
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            path = rng.choices(paths, weights)[0]()
+            try:
+                status = await conn.request(path)
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+                status = type(e).__name__
+                await conn.close()
+            elapsed = time.perf_counter() - now
+            if now >= measure_from:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors[status] += 1
+        await conn.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def percentile(values, p):
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modes', default='wsgi,asgi', help='Comma-separated: wsgi, asgi')
+    parser.add_argument('--concurrency', type=int, default=200, help='Concurrent connections')
+    parser.add_argument('--duration', type=float, default=20, help='Measured seconds per mode')
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Server processes')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--cache', action='store_true', help='Leave the API response cache enabled')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        slugs = seed(os.path.join(scratch, 'db.sqlite3'), args.posts, args.categories)
+        pages = max(1, len(slugs) // 10)
+        paths = [
+            lambda: f'/api/blog/api/posts/?page={random.randint(1, min(pages, 20))}',
+            lambda: f'/api/blog/api/posts/{random.choice(slugs)}/',
+            lambda: '/api/blog/api/categories/',
+        ]
+        weights = [4, 5, 1]
+
+        print(f'{len(slugs)} posts, {args.concurrency} connections, {args.workers} workers, '
+              f'{args.duration:.0f}s per mode, cache {"on" if args.cache else "off"}')
+        print(f'{"mode":<6}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+        for mode in args.modes.split(','):
+            port = free_port()
+            env = dict(
+                os.environ,
+                BLOG_ASYNC_API='True' if mode == 'asgi' else 'False',
+                BLOG_API_CACHE_ENABLED='True' if args.cache else 'False',
+                SQLITE_WAL='True',
+            )
+            server = subprocess.Popen(
+                server_command(mode, port, args.workers, args.threads), cwd=BACKEND_DIR, env=env,
+            )
+            try:
+                wait_for_port(port)
+                latencies, errors = asyncio.run(
+                    drive(port, paths, weights, args.concurrency, args.duration, args.warmup)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            total_errors = sum(errors.values())
+            if not latencies:
+                print(f'{mode:<6}{"no successful requests":>36}{total_errors:>8}')
+            else:
+                rps = len(latencies) / args.duration
+                p50, p95, p99 = (percentile(latencies, p) * 1000 for p in (50, 95, 99))
+                print(f'{mode:<6}{rps:>9.0f}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{total_errors:>8}')
+            if errors:
+                print('      errors: ' + ', '.join(f'{kind} x{count}' for kind, count in errors.most_common()))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Latency, query count and memory of every view of blog, userapp and adminpanel.
+
+For each scale (total rows, split across the tables by
+blog.fixture_generator.counts_for_rows) this generates a database with
+`manage.py generate_fixtures` (kept in --cache-dir, so later runs at the
+same scale and seed reuse it), then requests every view through the test
+client: once to count its queries, once under tracemalloc for its peak
+memory and then --iterations times (or for --max-seconds) for latency.
+Each request runs in a transaction that is rolled back, so views that
+write or delete see the same data every time. Reports p50/p95/p99 latency,
+queries and peak memory per view, and warns about URL names without a case
+here.
+
+--output writes the results as JSON; --compare checks them against such a
+baseline and exits with status 1 when a view got slower at p95 by more
+than --tolerance, runs more queries, or uses more than --tolerance more
+memory.
+
+    cd backend
+    python -m benchmarks.endpoints --scales 1k,100k --output baseline.json
+    python -m benchmarks.endpoints --scales 1k,100k --compare baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from importlib import import_module
+
+from .api_load import BACKEND_DIR, percentile
+
+APPS = ('blog', 'userapp', 'adminpanel')
+PASSWORD = 'benchmark-password'
+
+
+class Case:
+    def __init__(self, method='GET', args=None, data=None, query='', user='reader', json_body=False):
+        self.method = method
+        self.args = args or (lambda data: [])
+        self.data = data or (lambda data: {})
+        self.query = query
+        self.user = user
+        self.json_body = json_body
+
+
+def _comment_ids(data):
+    return {'comment_ids': data['pending_comment_ids']}
+
+
+# URL name -> how to request it. Pages that also accept a POST (forms) are
+# timed rendering the GET.
+CASES = {
+    'blog:post_list': Case(),
+    'blog:post_detail': Case(args=lambda data: [data['popular_slug']]),
+    'blog:category_posts': Case(args=lambda data: [data['category_slug']]),
+    'blog:add_comment': Case('POST', args=lambda data: [data['popular_slug']],
+                             data=lambda data: {'content': 'Nice'}),
+    'blog:toggle_like': Case('POST', args=lambda data: [data['popular_slug']]),
+    'blog:api-posts-list': Case(user=None),
+    'blog:api-posts-export': Case(user='admin'),
+    'blog:api-posts-batch': Case(user=None, query='slugs={batch_slugs}'),
+    'blog:api-post-detail': Case(args=lambda data: [data['popular_slug']], user=None),
+    'blog:api-categories-list': Case(user=None),
+    'blog:api-add-comment': Case('POST', args=lambda data: [data['popular_slug']], json_body=True,
+                                 data=lambda data: {'content': 'Nice'}),
+    'userapp:login': Case(user=None),
+    'userapp:register': Case(user=None),
+    'userapp:logout': Case(),
+    'userapp:api-login': Case('POST', user=None, json_body=True,
+                              data=lambda data: {'username': 'bench-reader', 'password': PASSWORD}),
+    'userapp:api-register': Case('POST', user=None, json_body=True, data=lambda data: {
+        'username': 'bench-new', 'email': 'bench-new@example.com', 'password': PASSWORD,
+        'first_name': 'Bench', 'last_name': 'New',
+    }),
+    'userapp:api-logout': Case('POST'),
+    'adminpanel:dashboard': Case(user='admin'),
+    'adminpanel:login': Case(user=None),
+    'adminpanel:logout': Case(user='admin'),
+    'adminpanel:user_management': Case(user='admin'),
+    'adminpanel:create_user': Case(user='admin'),
+    'adminpanel:user_detail': Case(args=lambda data: [data['quiet_user_id']], user='admin'),
+    'adminpanel:delete_user': Case('POST', args=lambda data: [data['quiet_user_id']], user='admin'),
+    'adminpanel:block_user': Case('POST', args=lambda data: [data['quiet_user_id']], user='admin'),
+    'adminpanel:unblock_user': Case('POST', args=lambda data: [data['quiet_user_id']], user='admin'),
+    'adminpanel:blog_management': Case(user='admin'),
+    'adminpanel:create_blog': Case(user='admin'),
+    'adminpanel:blog_detail': Case(args=lambda data: [data['popular_id']], user='admin'),
+    'adminpanel:edit_blog': Case(args=lambda data: [data['popular_id']], user='admin'),
+    'adminpanel:delete_blog': Case('POST', args=lambda data: [data['popular_id']], user='admin'),
+    'adminpanel:delete_attachment': Case('POST', args=lambda data: [data['popular_id'], data['attachment_id']],
+                                         user='admin'),
+    'adminpanel:approve_comment': Case('POST', args=lambda data: [data['comment_post_id'], data['comment_id']],
+                                       user='admin'),
+    'adminpanel:reject_comment': Case('POST', args=lambda data: [data['comment_post_id'], data['comment_id']],
+                                      user='admin'),
+    'adminpanel:comment_management': Case(user='admin'),
+    'adminpanel:bulk_approve_comments': Case('POST', data=_comment_ids, user='admin'),
+    'adminpanel:bulk_reject_comments': Case('POST', data=_comment_ids, user='admin'),
+    'adminpanel:delete_comment': Case('POST', args=lambda data: [data['comment_id']], user='admin'),
+    'adminpanel:category_management': Case(user='admin'),
+    'adminpanel:create_category': Case(user='admin'),
+    'adminpanel:edit_category': Case(args=lambda data: [data['category_id']], user='admin'),
+    'adminpanel:delete_category': Case('POST', args=lambda data: [data['category_id']], user='admin'),
+}
+
+
+def parse_scale(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def prepare_database(scale, seed, cache_dir):
+    """A migrated database with fixtures for `scale` rows, generated once per scale and seed."""
+    path = os.path.join(cache_dir, f'endpoints-{scale}-{seed}.sqlite3')
+    if not os.path.exists(path):
+        building = f'{path}.building'
+        shutil.copy(os.path.join(BACKEND_DIR, 'db.sqlite3'), building)
+        os.environ.update(BENCHMARK_DB=building, DJANGO_SETTINGS_MODULE='benchmarks.settings')
+        import django
+        django.setup()
+        from django.core.management import call_command
+        from django.db import connection
+
+        call_command('migrate', verbosity=0)
+        call_command('generate_fixtures', rows=scale, seed=seed, verbosity=0)
+        connection.close()
+        os.replace(building, path)
+    return path
+
+
+def bench_data():
+    """Users and ids the cases request, picked the same way at every scale."""
+    from django.contrib.auth import get_user_model
+    from blog.models import BlogPost, BlogPostAttachment, Category, Comment
+
+    User = get_user_model()
+    reader, _ = User.objects.get_or_create(username='bench-reader', defaults={'email': 'bench-reader@example.com'})
+    admin, _ = User.objects.get_or_create(username='bench-admin', defaults={
+        'email': 'bench-admin@example.com', 'is_staff': True, 'is_superuser': True,
+    })
+    for user in (reader, admin):
+        user.set_password(PASSWORD)
+        user.save()
+    published = BlogPost.objects.filter(status='published')
+    popular = published.order_by('-like_count', 'pk').first()
+    comment = Comment.objects.filter(post=popular).order_by('pk').first()
+    # Deleting the row leaves files alone, so no file is needed
+    attachment, _ = BlogPostAttachment.objects.get_or_create(
+        post=popular, title='Benchmark attachment', defaults={'file': 'blog/attachments/benchmark.txt'},
+    )
+    pending = list(Comment.objects.filter(status='pending').order_by('pk').values_list('pk', flat=True)[:20])
+    category = Category.objects.order_by('-published_post_count', 'pk').first()
+    return {
+        'reader': reader,
+        'admin': admin,
+        'popular_slug': popular.slug,
+        'popular_id': popular.pk,
+        'batch_slugs': ','.join(published.order_by('-like_count', 'pk').values_list('slug', flat=True)[:20]),
+        'category_slug': category.slug,
+        'category_id': category.pk,
+        'comment_id': comment.pk,
+        'attachment_id': attachment.pk,
+        'comment_post_id': popular.pk,
+        'pending_comment_ids': pending,
+        'quiet_user_id': User.objects.filter(username__startswith='fixture-user-').order_by('-pk')
+        .values_list('pk', flat=True).first(),
+    }
+
+
+def run_scale(db_path, iterations, max_seconds, only):
+    os.environ.update(
+        BENCHMARK_DB=db_path,
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        BLOG_VIEW_COUNT_FLUSH_INTERVAL='0',
+        BLOG_API_CACHE_ENABLED='False',
+        REQUEST_INSTRUMENTATION_ENABLED='False',
+    )
+    import django
+    django.setup()
+    from django.db import connection, transaction
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    data = bench_data()
+
+    def request(name, case, measure=nullcontext):
+        client = Client(HTTP_HOST='127.0.0.1')
+        with transaction.atomic():
+            if case.user:
+                client.force_login(data[case.user])
+            url = reverse(name, args=case.args(data))
+            if case.query:
+                url += '?' + case.query.format(**data)
+            body = case.data(data)
+            with measure():
+                started = time.perf_counter()
+                if case.method == 'GET':
+                    response = client.get(url)
+                elif case.json_body:
+                    response = client.post(url, json.dumps(body), content_type='application/json')
+                else:
+                    response = client.post(url, body)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return response.status_code, elapsed
+
+    @contextmanager
+    def peak_memory():
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    results = {}
+    for name, case in CASES.items():
+        if only and not any(part in name for part in only):
+            continue
+        status, _ = request(name, case)  # Warm up caches and imports
+        queries = CaptureQueriesContext(connection)
+        request(name, case, lambda: queries)
+        # Read now: the next request clears the query log
+        query_count = len(queries)
+        peaks = []
+        request(name, case, peak_memory)
+
+        latencies = []
+        deadline = time.perf_counter() + max_seconds
+        while len(latencies) < iterations and (len(latencies) < 3 or time.perf_counter() < deadline):
+            latencies.append(request(name, case)[1])
+        results[name] = {
+            'status': status,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries': query_count,
+            'peak_kib': round(peaks[0] / 1024),
+            'iterations': len(latencies),
+        }
+    return results, uncovered_names()
+
+
+def uncovered_names():
+    from django.urls import URLResolver
+
+    def names(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from names(pattern.url_patterns, namespace)
+            elif pattern.name:
+                yield f'{namespace}:{pattern.name}'
+
+    found = set()
+    for app in APPS:
+        urls = import_module(f'{app}.urls')
+        found.update(names(urls.urlpatterns, urls.app_name))
+    return found - set(CASES)
+
+
+def compare(results, baseline, tolerance):
+    """Human-readable regressions of `results` against `baseline`."""
+    regressions = []
+    for scale, views in results.items():
+        for name, now in views.items():
+            before = baseline.get(scale, {}).get(name)
+            if before is None:
+                continue
+            if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{scale} {name}: p95 {before["p95_ms"]} -> {now["p95_ms"]} ms')
+            if now['queries'] > before['queries']:
+                regressions.append(f'{scale} {name}: {before["queries"]} -> {now["queries"]} queries')
+            if now['peak_kib'] > before['peak_kib'] * (1 + tolerance):
+                regressions.append(f'{scale} {name}: peak memory {before["peak_kib"]} -> {now["peak_kib"]} KiB')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', default='1k,100k,1M', help='Comma-separated total row counts, e.g. 1k,100k,1M')
+    parser.add_argument('--iterations', type=int, default=30, help='Timed requests per view')
+    parser.add_argument('--max-seconds', type=float, default=10, help='Stop timing a view after this long')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache-dir', default=os.path.join(BACKEND_DIR, 'var', 'benchmarks'),
+                        help='Where generated databases are kept between runs')
+    parser.add_argument('--only', default='', help='Comma-separated parts of URL names to run')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 and memory growth')
+    args = parser.parse_args()
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    only = [part for part in args.only.split(',') if part]
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for label in args.scales.split(','):
+        scale = parse_scale(label)
+        # A fresh process per step: Django reads BENCHMARK_DB once
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            db_path = pool.apply(prepare_database, (scale, args.seed, args.cache_dir))
+            views, uncovered = pool.apply(run_scale, (db_path, args.iterations, args.max_seconds, only))
+        results[label] = views
+        print(f'\n{label} rows')
+        print(f'{"view":<38}{"status":>7}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>8}{"peak KiB":>9}')
+        for name, row in views.items():
+            print(f'{name:<38}{row["status"]:>7}{row["p50_ms"]:>9.1f}{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}'
+                  f'{row["queries"]:>8}{row["peak_kib"]:>9}')
+        if uncovered:
+            print(f'No case for: {", ".join(sorted(uncovered))}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
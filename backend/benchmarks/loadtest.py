@@ -0,0 +1,440 @@
+"""
+Mixed-traffic load test of the whole site, behind `manage.py loadtest`.
+
+Starts a server on a scratch copy of the database (topped up with
+`generate_fixtures` rows, or the dev database as it is) and drives it with
+simulated visitors over keep-alive HTTP connections. Each visitor has its
+own cookies and picks its next action at random by weight: browsing the
+post list, reading posts (popular ones more often), category pages,
+searches, the JSON API, liking, commenting and logging in, using the same
+forms, CSRF tokens and sessions as a browser. Visitors who like or comment
+log in first, as one of the load test accounts.
+
+Concurrency ramps up in stages; visitors of earlier stages carry on into
+the next. Each stage reports successful responses per second, latency
+percentiles, the error rate and how many "database is locked" errors the
+server logged. The saturation point is the last stage before throughput
+stops growing, p95 latency goes over its limit or errors pile up.
+
+The load generator runs in the same machine as the server, so on small
+machines it competes with the server for CPU; keep that in mind when
+reading absolute numbers.
+"""
+import asyncio
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, deque
+from urllib.parse import urlencode
+
+from .api_load import BACKEND_DIR, percentile, server_command
+
+PASSWORD = 'loadtest-password'
+SERVERS = ('runserver', 'gunicorn', 'uvicorn')
+DEFAULT_MIX = 'browse=30,read=35,category=10,search=5,api=5,like=6,comment=4,login=5'
+SEARCH_WORDS = ('python', 'garden', 'coffee', 'travel', 'music', 'recipe', 'budget', 'review')
+# Logged once per failed request; the sqlite3 error it wraps is logged too, without the prefix
+LOCKED = re.compile(r'^django\.db\.utils\.OperationalError: database (table )?is locked')
+
+
+def parse_mix(text):
+    """'browse=30,read=35,...' as {action: weight}; unknown actions and bad weights raise ValueError."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ACTIONS:
+            raise ValueError(f'Unknown action {name!r}, expected some of {", ".join(ACTIONS)}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f'Weight of {name} is not a number: {weight!r}') from None
+        if mix[name] < 0:
+            raise ValueError(f'Weight of {name} is negative')
+    if not sum(mix.values()):
+        raise ValueError('The mix has no action with a positive weight')
+    return mix
+
+
+def prepare(source, db_path, users):
+    """Copy `source` to `db_path`, migrate it and add the load test accounts; returns what visitors request."""
+    shutil.copy(source, db_path)
+    os.environ.update(BENCHMARK_DB=db_path, DJANGO_SETTINGS_MODULE='benchmarks.settings')
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+    from django.db import connection
+
+    from blog.models import BlogPost, Category
+
+    call_command('migrate', verbosity=0)
+    User = get_user_model()
+    password = make_password(PASSWORD)
+    usernames = [f'loadtest-user-{i}' for i in range(users)]
+    User.objects.bulk_create(
+        [User(username=name, email=f'{name}@example.com', password=password) for name in usernames],
+        ignore_conflicts=True,
+    )
+    User.objects.filter(username__in=usernames).update(password=password, is_active=True)
+    data = {
+        'usernames': usernames,
+        # Most popular first, so skewed picks favour them
+        'slugs': list(
+            BlogPost.objects.filter(status='published').order_by('-like_count', '-view_count', 'pk')
+            .values_list('slug', flat=True)[:5000]
+        ),
+        'categories': list(
+            Category.objects.filter(published_post_count__gt=0).order_by('-published_post_count', 'pk')
+            .values_list('slug', flat=True)
+        ),
+    }
+    connection.close()
+    return data
+
+
+def start_server(kind, port, db_path, workers, threads):
+    env = dict(
+        os.environ,
+        BENCHMARK_DB=db_path,
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        BLOG_ASYNC_API='True' if kind == 'uvicorn' else 'False',
+        SQLITE_WAL='True',
+        PYTHONUNBUFFERED='1',
+    )
+    if kind == 'runserver':
+        command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+    else:
+        command = server_command('wsgi' if kind == 'gunicorn' else 'asgi', port, workers, threads)
+    return subprocess.Popen(
+        command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+
+
+class ServerLog:
+    """Reads a server's stderr in a thread, counting SQLite lock errors and keeping the last lines."""
+
+    def __init__(self, stream):
+        self.locked = 0
+        self.tail = deque(maxlen=30)
+        self._thread = threading.Thread(target=self._run, args=(stream,), name='loadtest-server-log', daemon=True)
+        self._thread.start()
+
+    def _run(self, stream):
+        # Reading also keeps the pipe from filling up and blocking the server
+        for line in iter(stream.readline, b''):
+            line = line.decode('utf-8', 'replace').rstrip()
+            self.tail.append(line)
+            if LOCKED.match(line):
+                self.locked += 1
+
+
+class Session:
+    """HTTP/1.1 client with the cookie jar of one visitor, keeping its connection open unless told not to."""
+
+    def __init__(self, port, keep_alive=True):
+        self.port = port
+        self.keep_alive = keep_alive
+        self.reader = self.writer = None
+        self.cookies = {}
+
+    async def request(self, method, path, data=None, headers=None):
+        body = urlencode(data).encode() if data is not None else b''
+        lines = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1']
+        if not self.keep_alive:
+            lines.append('Connection: close')
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{name}={value}' for name, value in self.cookies.items()))
+        if method == 'POST':
+            lines.append(f'Content-Length: {len(body)}')
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+            lines.append(f'X-CSRFToken: {self.cookies.get("csrftoken", "")}')
+        lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+        reused = self.writer is not None
+        try:
+            return await self._exchange(message)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+        # The server closed the idle connection; try once more on a new one
+        return await self._exchange(message)
+
+    async def _exchange(self, message):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.writer.write(message)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name, value = name.lower(), value.strip()
+            if name == 'set-cookie':
+                self._set_cookie(value)
+            else:
+                headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while size := int((await self.reader.readline()).split(b';')[0], 16):
+                body += await self.reader.readexactly(size)
+                await self.reader.readline()
+            await self.reader.readline()
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        if not self.keep_alive or headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, headers, body
+
+    def _set_cookie(self, value):
+        pair, _, attributes = value.partition(';')
+        name, _, cookie = pair.strip().partition('=')
+        if 'max-age=0' in attributes.lower().replace(' ', '') or cookie in ('', '""'):
+            self.cookies.pop(name, None)
+        else:
+            self.cookies[name] = cookie
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+class Stage:
+    """Responses of one concurrency level, counted from the end of its warmup."""
+
+    def __init__(self, concurrency, duration):
+        self.concurrency = concurrency
+        self.duration = duration
+        self.latencies = {}  # action -> seconds of each successful response
+        self.errors = Counter()  # (action, status code or exception name) -> count
+        self.locked = 0
+
+    def add(self, action, elapsed, status):
+        if isinstance(status, int) and status < 400:
+            self.latencies.setdefault(action, []).append(elapsed)
+        else:
+            self.errors[action, str(status)] += 1
+
+    @property
+    def successes(self):
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    @property
+    def requests(self):
+        return self.successes + sum(self.errors.values())
+
+    @property
+    def throughput(self):
+        return self.successes / self.duration
+
+    @property
+    def error_rate(self):
+        return sum(self.errors.values()) / self.requests if self.requests else 0.0
+
+    def percentiles(self, action=None):
+        """p50, p95 and p99 in milliseconds, of one action or all of them."""
+        values = self.latencies.get(action, []) if action else [
+            value for latencies in self.latencies.values() for value in latencies
+        ]
+        if not values:
+            return None, None, None
+        return tuple(percentile(values, p) * 1000 for p in (50, 95, 99))
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles()
+        return {
+            'concurrency': self.concurrency,
+            'requests': self.requests,
+            'throughput': self.throughput,
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'error_rate': self.error_rate,
+            'locked': self.locked,
+            'errors': {f'{action} {kind}': count for (action, kind), count in self.errors.most_common()},
+            'actions': {
+                action: dict(zip(('p50_ms', 'p95_ms', 'p99_ms'), self.percentiles(action)), requests=len(values))
+                for action, values in sorted(self.latencies.items())
+            },
+        }
+
+
+def saturation_point(stages, max_p95_ms, max_error_rate, min_gain=0.05):
+    """
+    Index of the last stage the server kept up with, and why the next one
+    was too much (None when no stage was). A stage is too much when its
+    error rate is over `max_error_rate`, its p95 is over `max_p95_ms`, or
+    its throughput is less than `min_gain` above the previous good stage.
+    """
+    best = None
+    for index, stage in enumerate(stages):
+        p95 = stage.percentiles()[1]
+        if p95 is None:
+            return best, f'no successful responses at {stage.concurrency} visitors'
+        if stage.error_rate > max_error_rate:
+            return best, f'{stage.error_rate:.1%} errors at {stage.concurrency} visitors'
+        if p95 > max_p95_ms:
+            return best, f'p95 of {p95:.0f} ms at {stage.concurrency} visitors'
+        if best is not None and stage.throughput < stages[best].throughput * (1 + min_gain):
+            return best, (f'throughput grew less than {min_gain:.0%} from {stages[best].concurrency} '
+                          f'to {stage.concurrency} visitors')
+        best = index
+    return best, None
+
+
+class Visitor:
+    def __init__(self, port, username, data, rng, keep_alive=True):
+        from blog.fixture_generator import Distribution
+
+        self.session = Session(port, keep_alive)
+        self.username = username
+        self.rng = rng
+        self.slugs = data['slugs']
+        self.categories = data['categories']
+        self.pick_post = Distribution(len(self.slugs), 1.0, rng) if self.slugs else None
+        self.pick_category = Distribution(len(self.categories), 1.0, rng) if self.categories else None
+        self.logged_in = False
+        self.stage = None
+
+    async def fetch(self, action, method, path, data=None, headers=None):
+        started = time.perf_counter()
+        try:
+            status, _, _ = await self.session.request(method, path, data, headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            status = type(e).__name__
+            await self.session.close()
+        if self.stage is not None:
+            self.stage.add(action, time.perf_counter() - started, status)
+        return status
+
+    def post_slug(self):
+        return self.slugs[self.pick_post.pick()] if self.pick_post else None
+
+    async def browse(self):
+        page = 1 + min(int(self.rng.expovariate(1.0)), 9)
+        await self.fetch('browse', 'GET', f'/?page={page}')
+
+    async def read(self):
+        slug = self.post_slug()
+        await self.fetch('read', 'GET', f'/post/{slug}/' if slug else '/')
+
+    async def category(self):
+        if self.pick_category is None:
+            return await self.browse()
+        await self.fetch('category', 'GET', f'/category/{self.categories[self.pick_category.pick()]}/')
+
+    async def search(self):
+        await self.fetch('search', 'GET', f'/?q={self.rng.choice(SEARCH_WORDS)}')
+
+    async def api(self):
+        slug = self.post_slug()
+        if slug and self.rng.random() < 0.5:
+            await self.fetch('api', 'GET', f'/api/blog/api/posts/{slug}/')
+        else:
+            await self.fetch('api', 'GET', f'/api/blog/api/posts/?page={1 + min(int(self.rng.expovariate(1.0)), 9)}')
+
+    async def login(self):
+        if self.logged_in:
+            await self.fetch('login', 'GET', '/auth/logout/')
+            self.logged_in = False
+        # The form sets the CSRF cookie the POST has to send back
+        await self.fetch('login', 'GET', '/auth/login/')
+        status = await self.fetch('login', 'POST', '/auth/login/', {
+            'username': self.username,
+            'password': PASSWORD,
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+        })
+        self.logged_in = status == 302
+
+    async def like(self):
+        slug = self.post_slug()
+        if not self.logged_in:
+            await self.login()
+        if slug and self.logged_in:
+            await self.fetch('like', 'POST', f'/post/{slug}/like/', headers={'X-Requested-With': 'XMLHttpRequest'})
+
+    async def comment(self):
+        slug = self.post_slug()
+        if not self.logged_in:
+            await self.login()
+        if slug and self.logged_in:
+            await self.fetch('comment', 'POST', f'/post/{slug}/comment/', {
+                'content': f'Load test comment {self.rng.randrange(10 ** 6)}',
+                'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+            })
+
+
+ACTIONS = {
+    'browse': Visitor.browse,
+    'read': Visitor.read,
+    'category': Visitor.category,
+    'search': Visitor.search,
+    'api': Visitor.api,
+    'like': Visitor.like,
+    'comment': Visitor.comment,
+    'login': Visitor.login,
+}
+
+
+async def ramp(port, data, mix, levels, duration, warmup, think_time, keep_alive=True, server_log=None, seed=None,
+               progress=None):
+    """Run one stage per concurrency in `levels`; returns the Stages."""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    visitors = []
+    tasks = []
+    stages = []
+    stop = asyncio.Event()
+
+    async def visit(visitor):
+        while not stop.is_set():
+            await ACTIONS[visitor.rng.choices(names, weights)[0]](visitor)
+            if think_time:
+                await asyncio.sleep(visitor.rng.expovariate(1 / think_time))
+
+    try:
+        for concurrency in levels:
+            while len(visitors) < concurrency:
+                visitor = Visitor(port, data['usernames'][len(visitors) % len(data['usernames'])], data,
+                                  random.Random(rng.random()), keep_alive)
+                visitors.append(visitor)
+                tasks.append(asyncio.create_task(visit(visitor)))
+            await asyncio.sleep(warmup)
+            stage = Stage(concurrency, duration)
+            locked = server_log.locked if server_log else 0
+            for visitor in visitors:
+                visitor.stage = stage
+            await asyncio.sleep(duration)
+            for visitor in visitors:
+                visitor.stage = None
+            # Give the server a moment to log errors of the last responses
+            await asyncio.sleep(0.2)
+            stage.locked = (server_log.locked if server_log else 0) - locked
+            stages.append(stage)
+            if progress is not None:
+                progress(stage)
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for visitor in visitors:
+            await visitor.session.close()
+    return stages
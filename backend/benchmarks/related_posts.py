@@ -0,0 +1,83 @@
+"""
+Build-time benchmark for the related-posts index.
+
+Generates a synthetic corpus with a Zipf-distributed vocabulary and times
+each stage of blog.related (term counting, TF-IDF fit, projection, top-k
+search) without touching the database.
+
+    cd backend
+    python -m benchmarks.related_posts --posts 100000
+"""
+import argparse
+import os
+import resource
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+import numpy as np  # noqa: E402
+
+from blog import related  # noqa: E402
+
+
+def word(i):
+    # Letters only, so the tokenizer keeps every synthetic word
+    letters = []
+    i += 26 * 27
+    while i:
+        i, r = divmod(i, 26)
+        letters.append(chr(ord('a') + r))
+    return ''.join(letters)
+
+
+def synthetic_corpus(n_posts, vocabulary_size, words_per_post, seed=0):
+    rng = np.random.default_rng(seed)
+    words = np.array([word(i) for i in range(vocabulary_size)])
+    # Shift Zipf draws so very common words don't dominate every post
+    ranks = np.minimum(rng.zipf(1.2, size=(n_posts, words_per_post)) + 20, vocabulary_size) - 1
+    for row in ranks:
+        content = ' '.join(words[row])
+        yield content[:60], content[:300], content
+
+
+def timed(label, func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    print(f'{label:<22}{elapsed:>9.2f}s')
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=30000)
+    parser.add_argument('--words', type=int, default=300, help='Words per post')
+    parser.add_argument('--dimensions', type=int, default=related.DEFAULT_DIMENSIONS)
+    parser.add_argument('--top-k', type=int, default=related.DEFAULT_TOP_K)
+    args = parser.parse_args()
+
+    print(f'{args.posts} posts, {args.vocabulary} terms, {args.words} words/post, '
+          f'{args.dimensions} dimensions, top {args.top_k}')
+
+    corpus = list(synthetic_corpus(args.posts, args.vocabulary, args.words))
+    table = related.TermTable()
+    docs, t_terms = timed('term counts', lambda: [table.encode(related.document_terms(*doc)) for doc in corpus])
+    del corpus
+    vectorizer, t_fit = timed(
+        'tf-idf fit', related.Vectorizer(dimensions=args.dimensions).fit, docs, table.terms()
+    )
+    matrix, t_transform = timed('transform/project', vectorizer.transform, docs)
+    _, t_knn = timed('top-k search', related.top_k_neighbours, matrix, args.top_k)
+
+    total = t_terms + t_fit + t_transform + t_knn
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{"total":<22}{total:>9.2f}s')
+    print(f'{"peak RSS":<22}{peak_mb:>8.0f}MB')
+
+
+if __name__ == '__main__':
+    main()
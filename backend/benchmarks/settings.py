@@ -0,0 +1,20 @@
+"""
+Settings for benchmark servers: the project settings with DEBUG off and the
+database pointed at the scratch copy named by BENCHMARK_DB.
+"""
+import os
+
+from backend.settings import *  # noqa: F401,F403
+from backend.settings import DATABASES
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+DATABASES['default']['NAME'] = os.environ['BENCHMARK_DB']
+
+# Server errors go to stderr so they show up next to the results
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {'django.request': {'handlers': ['console'], 'level': 'ERROR'}},
+}
@@ -0,0 +1,79 @@
+"""
+Memory and latency of one 100-post API page with and without sparse fieldsets.
+
+Seeds a scratch copy of the database and builds the posts list payload
+three ways: loading every column with the author and category joins (the
+old list query), the default list query that defers `content`, and a
+`fields=` subset that needs neither the body nor any join. Reports the
+median time to query and serialize a page, the peak memory allocated
+while doing it and the size of the JSON.
+
+    cd backend
+    python -m benchmarks.sparse_fields --posts 2000 --words 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from .api_load import seed
+
+
+def build_page(queryset, fields, per_page):
+    from blog.api_helpers import post_summary
+
+    return [post_summary(post, fields=fields) for post in queryset[:per_page]]
+
+
+def measure(build, repeat):
+    build()  # warm up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    payload = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, len(json.dumps({'posts': payload}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=1500, help='Words per post body')
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--fields', default='id,title,slug,like_count')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        seed(os.path.join(scratch, 'db.sqlite3'), args.posts, 10, words_per_post=args.words)
+        from blog import fieldsets
+        from blog.models import BlogPost
+
+        published = BlogPost.objects.filter(status='published').order_by('-created_at', '-id')
+        fields = fieldsets.parse_fields(args.fields, fieldsets.LIST_FIELDS)
+        variants = [
+            ('all columns', published.select_related('author', 'category'), None),
+            ('defer content', fieldsets.project(published, None, defer=['content']), None),
+            (f'fields={args.fields}', fieldsets.project(published, fields), fields),
+        ]
+
+        print(f'{args.per_page} posts per page, {args.words} words per body, median of {args.repeat}')
+        print(f'{"query":<36}{"ms":>8}{"peak KB":>10}{"JSON KB":>10}')
+        for label, queryset, variant_fields in variants:
+            elapsed, peak, size = measure(lambda: build_page(queryset, variant_fields, args.per_page), args.repeat)
+            print(f'{label:<36}{elapsed * 1000:>8.2f}{peak / 1024:>10.0f}{size / 1024:>10.1f}')
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Lock-error benchmark for concurrent writes to SQLite, with and without tuning.
+
+Seeds a scratch database, then for each mode starts worker processes whose
+threads drive the real views through the test client: toggling likes,
+posting comments, reading posts (with a small view-count batch, so views
+keep flushing UPDATEs) and listing posts. One more process keeps importing
+posts in large batches, like `manage.py import_posts` running during the
+day. Reports operations/sec, latency percentiles and how many requests
+and import batches failed with "database is locked".
+`stock` runs with Django's SQLite defaults (SQLITE_TUNING=False), `tuned`
+with the WAL/IMMEDIATE/pragma settings of backend/settings.py. Each mode
+starts from its own copy of the seeded database, since WAL mode is
+persistent.
+
+    cd backend
+    python -m benchmarks.sqlite_locks --processes 4 --threads 4 --duration 15
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from .api_load import percentile, seed
+
+ACTIONS = ('like', 'comment', 'detail', 'list')
+WEIGHTS = (3, 2, 4, 1)
+
+
+def create_users(count):
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    users = [User(username=f'locker{i}', email=f'locker{i}@example.com') for i in range(count)]
+    for user in users:
+        user.set_unusable_password()
+    User.objects.bulk_create(users, ignore_conflicts=True)
+    return list(User.objects.filter(username__startswith='locker').values_list('id', flat=True)[:count])
+
+
+def setup_django(db_path, tuned):
+    os.environ.update(
+        BENCHMARK_DB=db_path,
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        SQLITE_TUNING='True' if tuned else 'False',
+        SQLITE_WAL='True' if tuned else 'False',
+        BLOG_API_CACHE_ENABLED='False',
+        BLOG_VIEW_COUNT_BATCH_SIZE='5',
+        BLOG_VIEW_COUNT_FLUSH_INTERVAL='0',
+    )
+    import django
+    django.setup()
+
+
+def run_importer(db_path, tuned, duration, batch_size):
+    setup_django(db_path, tuned)
+    from django.db import connection
+    from blog import importer
+
+    outcomes = Counter()
+    stop_at = time.perf_counter() + duration
+    batch = 0
+    while time.perf_counter() < stop_at:
+        records = [
+            {'title': f'Imported {batch}-{i}', 'content': 'imported words ' * 200, 'author': 'bench',
+             'status': 'published'}
+            for i in range(batch_size)
+        ]
+        try:
+            importer.PostImporter(batch_size=batch_size).run(records)
+            outcomes['import ok'] += 1
+        except Exception as e:
+            outcomes['import locked' if 'locked' in str(e) else f'import {type(e).__name__}'] += 1
+        batch += 1
+    connection.close()
+    return [], outcomes
+
+
+def run_worker(db_path, tuned, threads, duration, slugs, user_ids):
+    setup_django(db_path, tuned)
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+
+    User = get_user_model()
+    latencies = []
+    outcomes = Counter()
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def request(client, action, slug):
+        if action == 'like':
+            return client.post(f'/post/{slug}/like/', headers={'X-Requested-With': 'XMLHttpRequest'})
+        if action == 'comment':
+            return client.post(
+                f'/api/blog/api/posts/{slug}/comment/',
+                json.dumps({'content': 'Benchmark comment'}), content_type='application/json',
+            )
+        if action == 'detail':
+            return client.get(f'/api/blog/api/posts/{slug}/')
+        return client.get('/api/blog/api/posts/')
+
+    def drive(user_id):
+        client = Client(HTTP_HOST='127.0.0.1')
+        client.force_login(User.objects.get(id=user_id))
+        rng = random.Random(user_id)
+        while time.perf_counter() < stop_at:
+            action = rng.choices(ACTIONS, WEIGHTS)[0]
+            started = time.perf_counter()
+            try:
+                response = request(client, action, rng.choice(slugs))
+                outcome = 'ok' if response.status_code < 400 else f'http {response.status_code}'
+                if response.status_code == 500 and b'locked' in response.content:
+                    outcome = 'locked'
+            except Exception as e:
+                outcome = 'locked' if 'locked' in str(e) else type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == 'ok':
+                    latencies.append(elapsed)
+        connection.close()
+
+    workers = [threading.Thread(target=drive, args=(user_id,)) for user_id in user_ids]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, outcomes
+
+
+def run_mode(mode, seeded, scratch, args, slugs, user_ids):
+    db_path = os.path.join(scratch, f'{mode}.sqlite3')
+    shutil.copy(seeded, db_path)
+    tuned = mode == 'tuned'
+    if tuned:
+        # Deployments switch the file to WAL once, on migrate's connection;
+        # dozens of workers switching it at the same moment would contend
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+    per_process = [user_ids[i::args.processes] for i in range(args.processes)]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.processes + 1) as pool:
+        importing = pool.apply_async(run_importer, (db_path, tuned, args.duration, args.import_batch))
+        results = pool.starmap(run_worker, [
+            (db_path, tuned, args.threads, args.duration, slugs, ids) for ids in per_process
+        ])
+        results.append(importing.get())
+    latencies = [latency for result, _ in results for latency in result]
+    outcomes = sum((outcome for _, outcome in results), Counter())
+    return latencies, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modes', default='stock,tuned', help='Comma-separated: stock, tuned')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='Client threads per process')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per mode')
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--import-batch', type=int, default=1000, help='Posts per import transaction')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        seeded = os.path.join(scratch, 'seed.sqlite3')
+        os.environ['SQLITE_TUNING'] = 'False'
+        # Few posts, so writers contend for the same rows and pages
+        slugs = seed(seeded, args.posts, 5)[:50]
+        user_ids = create_users(args.processes * args.threads)
+        from django.db import connection
+        connection.close()
+
+        print(f'{args.processes} processes x {args.threads} threads, {args.duration:.0f}s per mode, '
+              f'mix {dict(zip(ACTIONS, WEIGHTS))}')
+        print(f'{"mode":<7}{"ops/s":>8}{"p50 ms":>9}{"p99 ms":>9}{"locked":>8}{"lock %":>8}  other errors')
+        for mode in args.modes.split(','):
+            latencies, outcomes = run_mode(mode, seeded, scratch, args, slugs, user_ids)
+            total = sum(outcomes.values())
+            locked = outcomes.pop('locked', 0)
+            outcomes.pop('ok', None)
+            p50 = percentile(latencies, 50) * 1000 if latencies else 0
+            p99 = percentile(latencies, 99) * 1000 if latencies else 0
+            print(f'{mode:<7}{total / args.duration:>8.0f}{p50:>9.1f}{p99:>9.1f}{locked:>8}'
+                  f'{100 * locked / max(total, 1):>7.1f}%  {dict(outcomes) or ""}')
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
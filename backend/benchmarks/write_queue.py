@@ -0,0 +1,145 @@
+"""
+Write throughput of likes and comments with and without the write queue.
+
+Seeds a scratch database, then for each mode starts worker processes whose
+threads (200 in total by default) keep toggling likes and posting comments
+through the real views. `direct` writes from every request thread
+(BLOG_WRITE_QUEUE_ENABLED=False); `queued` hands the writes to each
+process's writer thread, which commits them in batches. Both run with the
+SQLite tuning of backend/settings.py, and each starts from its own copy of
+the seeded database. Reports writes/sec, latency percentiles and errors.
+
+    cd backend
+    python -m benchmarks.write_queue --processes 4 --writers 200 --duration 15
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from .api_load import percentile, seed
+from .sqlite_locks import create_users
+
+
+def run_worker(db_path, queued, duration, slugs, user_ids):
+    os.environ.update(
+        BENCHMARK_DB=db_path,
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        BLOG_WRITE_QUEUE_ENABLED='True' if queued else 'False',
+        BLOG_API_CACHE_ENABLED='False',
+    )
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from blog.write_queue import write_queue
+
+    User = get_user_model()
+    latencies = []
+    outcomes = Counter()
+    lock = threading.Lock()
+    stop_at = None
+
+    def start_clock():
+        nonlocal stop_at
+        stop_at = time.perf_counter() + duration
+
+    # Everyone logs in before the clock starts
+    ready = threading.Barrier(len(user_ids), action=start_clock)
+
+    def write(client, rng):
+        slug = rng.choice(slugs)
+        if rng.random() < 0.5:
+            return client.post(f'/post/{slug}/like/', headers={'X-Requested-With': 'XMLHttpRequest'})
+        return client.post(
+            f'/api/blog/api/posts/{slug}/comment/',
+            json.dumps({'content': 'Benchmark comment'}), content_type='application/json',
+        )
+
+    def drive(user_id):
+        client = Client(HTTP_HOST='127.0.0.1')
+        client.force_login(User.objects.get(id=user_id))
+        rng = random.Random(user_id)
+        ready.wait()
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = write(client, rng)
+                outcome = 'ok' if response.status_code < 400 else f'http {response.status_code}'
+                if response.status_code == 500 and b'locked' in response.content:
+                    outcome = 'locked'
+            except Exception as e:
+                outcome = 'locked' if 'locked' in str(e) else type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == 'ok':
+                    latencies.append(elapsed)
+        connection.close()
+
+    workers = [threading.Thread(target=drive, args=(user_id,)) for user_id in user_ids]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    write_queue.stop()
+    return latencies, outcomes
+
+
+def run_mode(mode, seeded, scratch, args, slugs, user_ids):
+    db_path = os.path.join(scratch, f'{mode}.sqlite3')
+    shutil.copy(seeded, db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+    per_process = [user_ids[i::args.processes] for i in range(args.processes)]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(run_worker, [
+            (db_path, mode == 'queued', args.duration, slugs, ids) for ids in per_process
+        ])
+    latencies = [latency for result, _ in results for latency in result]
+    outcomes = sum((outcome for _, outcome in results), Counter())
+    return latencies, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modes', default='direct,queued', help='Comma-separated: direct, queued')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=200, help='Concurrent writers across all processes')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per mode')
+    parser.add_argument('--posts', type=int, default=200)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='blog-bench-')
+    try:
+        seeded = os.path.join(scratch, 'seed.sqlite3')
+        # Few posts, so writers contend for the same rows and pages
+        slugs = seed(seeded, args.posts, 5)[:50]
+        user_ids = create_users(args.writers)
+        from django.db import connection
+        connection.close()
+
+        print(f'{args.writers} writers in {args.processes} processes, {args.duration:.0f}s per mode, '
+              f'half likes, half comments')
+        print(f'{"mode":<8}{"writes/s":>9}{"p50 ms":>9}{"p99 ms":>9}  errors')
+        for mode in args.modes.split(','):
+            latencies, outcomes = run_mode(mode, seeded, scratch, args, slugs, user_ids)
+            ok = outcomes.pop('ok', 0)
+            p50 = percentile(latencies, 50) * 1000 if latencies else 0
+            p99 = percentile(latencies, 99) * 1000 if latencies else 0
+            print(f'{mode:<8}{ok / args.duration:>9.0f}{p50:>9.1f}{p99:>9.1f}  {dict(outcomes) or ""}')
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.utils import timezone
+from . import api_cache
 from .models import Category, BlogPost, BlogPostAttachment, Comment, Like
 
 
@@ -9,8 +11,9 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     
     def post_count(self, obj):
-        return obj.posts.count()
+        return obj.total_post_count
     post_count.short_description = 'Posts'
+    post_count.admin_order_field = 'total_post_count'
 
 
 class BlogPostAttachmentInline(admin.TabularInline):
@@ -58,12 +61,14 @@ class CommentAdmin(admin.ModelAdmin):
     content_preview.short_description = 'Content Preview'
     
     def approve_comments(self, request, queryset):
-        queryset.update(status='approved')
+        queryset.update(status='approved', updated_at=timezone.now())
+        api_cache.bump_generation()
         self.message_user(request, f"{queryset.count()} comments approved.")
     approve_comments.short_description = "Approve selected comments"
     
     def reject_comments(self, request, queryset):
-        queryset.update(status='rejected')
+        queryset.update(status='rejected', updated_at=timezone.now())
+        api_cache.bump_generation()
         self.message_user(request, f"{queryset.count()} comments rejected.")
     reject_comments.short_description = "Reject selected comments"
 
@@ -0,0 +1,126 @@
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+from backend import metrics
+
+GENERATION_KEY = 'blog-api:generation'
+# Bumped by view count flushes and likes. Payloads are cached without
+# current counters, so this only feeds the list ETag.
+COUNTERS_KEY = 'blog-api:counters'
+
+
+class CacheStats:
+    """Per-process hit/miss counters for the API response cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        metrics.API_CACHE.inc('hit' if hit else 'miss')
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[getattr(settings, 'BLOG_API_CACHE_ALIAS', 'default')]
+
+
+def get_generation(cache=None, key=GENERATION_KEY):
+    cache = cache or get_cache()
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted counter never rewinds to a
+        # generation that still has entries in the cache.
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(cache=None, key=GENERATION_KEY):
+    cache = cache or get_cache()
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_generation(key=GENERATION_KEY):
+    """Invalidate every cached API response at once, or bump another generation `key`."""
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def make_key(request, generation, validators=()):
+    match = request.resolver_match
+    query = urlencode(sorted((k, sorted(v)) for k, v in request.GET.lists()), doseq=True)
+    raw = f'{match.view_name}|{sorted(match.kwargs.items())}|{query}|{validators}'
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'blog-api:{generation}:{digest}'
+
+
+def get_or_build(request, build, validators=()):
+    """
+    Return the cached payload for this request, calling build() on a miss.
+
+    Keys combine the URL name and arguments, the normalized query string and
+    the current generation, so bump_generation() makes every older entry
+    unreachable without having to find and delete it. Views answering
+    conditional GETs also pass the database `validators` their ETag is built
+    from, so a cached body always matches the ETag sent with it, even when
+    another process made the change.
+    """
+    if not getattr(settings, 'BLOG_API_CACHE_ENABLED', True):
+        return build()
+    cache = get_cache()
+    key = make_key(request, get_generation(cache), validators)
+    data = cache.get(key)
+    stats.record(hit=data is not None)
+    if data is None:
+        data = build()
+        cache.set(key, data, getattr(settings, 'BLOG_API_CACHE_TIMEOUT', 300))
+    return data
+
+
+async def aget_or_build(request, build, validators=()):
+    """Async version of get_or_build(); build() must return an awaitable."""
+    if not getattr(settings, 'BLOG_API_CACHE_ENABLED', True):
+        return await build()
+    cache = get_cache()
+    key = make_key(request, await aget_generation(cache), validators)
+    data = await cache.aget(key)
+    stats.record(hit=data is not None)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, getattr(settings, 'BLOG_API_CACHE_TIMEOUT', 300))
+    return data
@@ -0,0 +1,249 @@
+"""
+Helpers shared by the JSON API views in blog.views and their async
+versions in blog.async_views: the conditional GET validators, the
+published posts querysets, request parsing and the response payloads.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.http import JsonResponse
+
+from . import api_cache, fieldsets, search
+from .models import BlogPost, Like
+
+
+# Conditional GET validators
+# These run before the view; when the client's ETag/Last-Modified still
+# matches, Django answers 304 without calling the view at all.
+def _make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _has_pending_messages(request):
+    storage = getattr(request, '_messages', None)
+    return bool(storage is not None and len(storage))
+
+
+def post_validators_query(slug):
+    approved = Q(comments__status='approved')
+    return (
+        BlogPost.objects.filter(slug=slug, status='published')
+        .annotate(
+            last_comment_at=Max('comments__updated_at', filter=approved),
+            approved_comments=Count('comments', filter=approved),
+        )
+        .values('id', 'updated_at', 'like_count', 'view_count', 'last_comment_at', 'approved_comments')
+    )
+
+
+def post_validators(request, slug):
+    if not hasattr(request, '_post_validators'):
+        request._post_validators = post_validators_query(slug).first()
+    return request._post_validators
+
+
+def post_etag(request, slug):
+    row = post_validators(request, slug)
+    if row is None or _has_pending_messages(request):
+        return None
+    # The page shows the viewer's like state and login-dependent controls
+    user_id = request.user.pk if request.user.is_authenticated else None
+    return _make_etag(
+        row['id'], row['updated_at'], row['like_count'], row['view_count'],
+        row['last_comment_at'], row['approved_comments'], user_id,
+        request.GET.get('fields', ''),
+    )
+
+
+def post_last_modified(request, slug):
+    row = post_validators(request, slug)
+    if row is None or _has_pending_messages(request):
+        return None
+    return max(filter(None, (row['updated_at'], row['last_comment_at'])))
+
+
+def post_cache_validators(row):
+    """What a cached detail payload is built from, out of its validators row."""
+    return (row['updated_at'], row['last_comment_at'], row['approved_comments'])
+
+
+def posts_list_validators_query():
+    """The latest updated_at of the published posts, from the end of an index."""
+    return BlogPost.objects.filter(status='published').order_by('-updated_at').values_list('updated_at', flat=True)
+
+
+def posts_list_validators(request):
+    if not hasattr(request, '_posts_list_validators'):
+        request._posts_list_validators = (
+            api_cache.get_generation(),
+            api_cache.get_generation(key=api_cache.COUNTERS_KEY),
+            posts_list_validators_query().first(),
+        )
+    return request._posts_list_validators
+
+
+def posts_list_cache_validators(request):
+    """The list ETag's database validator, for the cache key (counters are not cached)."""
+    return (posts_list_validators(request)[2],)
+
+
+def posts_list_etag(request):
+    # The API cache generation is bumped by every write a list can show,
+    # and the counters generation by view count flushes and likes, which
+    # leave cached payloads alone. The latest updated_at also catches edits
+    # made without signals; it is read from an index, where counting or
+    # summing over all published posts would read every one of them.
+    query = sorted((k, sorted(v)) for k, v in request.GET.lists())
+    return _make_etag(*posts_list_validators(request), query)
+
+
+def published_posts(request):
+    # Built once per request
+    if not hasattr(request, '_published_posts'):
+        posts = BlogPost.objects.filter(status='published')
+
+        # Apply filters
+        category = request.GET.get('category')
+        if category:
+            posts = posts.filter(category__slug=category)
+
+        search_query = request.GET.get('search')
+        if search_query:
+            posts = search.search_posts(posts, search_query)
+        request._published_posts = posts
+    return request._published_posts
+
+
+def filter_published_posts(request, fields=None):
+    # Lists never show the body, so it is not loaded by default
+    return fieldsets.project(published_posts(request), fields, defer=['content'])
+
+
+def parse_fields(request, allowed):
+    try:
+        return fieldsets.parse_fields(request.GET.get('fields'), allowed), None
+    except fieldsets.InvalidFields as e:
+        return None, JsonResponse({'error': str(e)}, status=400)
+
+
+def parse_slugs(request):
+    slugs = list(dict.fromkeys(slug.strip() for slug in request.GET.get('slugs', '').split(',') if slug.strip()))
+    limit = getattr(settings, 'BLOG_API_BATCH_MAX_SLUGS', 100)
+    if not slugs:
+        return None, JsonResponse({'error': 'slugs is required'}, status=400)
+    if len(slugs) > limit:
+        return None, JsonResponse({'error': f'At most {limit} slugs per request'}, status=400)
+    return slugs, None
+
+
+# View and like counters change on every view count flush and like, far
+# more often than anything else in a payload. Cached payloads are never
+# invalidated for them; each request reads the current counters instead.
+COUNTERS = ('view_count', 'like_count')
+
+
+def wanted_counters(fields):
+    return [name for name in COUNTERS if fields is None or name in fields]
+
+
+def counters_query(names, key, values):
+    """(key, *counters) rows of the posts whose `key` column is in `values`."""
+    return BlogPost.objects.filter(**{f'{key}__in': values}).values_list(key, *names)
+
+
+def set_counters(posts_by_key, names, rows):
+    """Overwrite the cached counters of the payloads in `posts_by_key`."""
+    for key, *values in rows:
+        if key in posts_by_key:
+            posts_by_key[key].update(zip(names, values))
+
+
+def set_post_counters(post_data, row):
+    """Current counters of a detail payload, from its validators row."""
+    for name in COUNTERS:
+        if name in post_data:
+            post_data[name] = row[name]
+
+
+def post_summary(post, fields=None, with_snippet=False):
+    data = fieldsets.serialize_post(post, fields or fieldsets.LIST_FIELDS)
+    if with_snippet:
+        data['snippet'] = search.snippet(post)
+    return data
+
+
+# List payloads also carry the ids of their posts, whatever the fields, to
+# look their counters up by; the views pop them before responding.
+def cursor_page_payload(posts_data, next_cursor, post_ids):
+    return {
+        'posts': posts_data,
+        'post_ids': post_ids,
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None,
+    }
+
+
+def numbered_page_payload(posts_data, page_obj, post_ids):
+    return {
+        'posts': posts_data,
+        'post_ids': post_ids,
+        'total_pages': page_obj.paginator.num_pages,
+        'current_page': page_obj.number,
+        'has_next': page_obj.has_next(),
+        'has_previous': page_obj.has_previous(),
+    }
+
+
+def related_summary(posts):
+    return [{'id': p.id, 'title': p.title, 'slug': p.slug} for p in posts]
+
+
+def posts_batch_payload(batch, related_posts):
+    posts = {}
+    for slug in batch.slugs:
+        detail = batch.details.get(slug)
+        if detail is None:
+            posts[slug] = {'error': 'Not found'}
+            continue
+        posts[slug] = detail.to_dict()
+        if detail.wants('related_posts'):
+            posts[slug]['related_posts'] = related_summary(related_posts.get(detail.post.id, []))
+    return {'posts': posts}
+
+
+def found_posts(data):
+    """The payloads of the posts a batch found, by slug."""
+    return {slug: post for slug, post in data['posts'].items() if 'error' not in post}
+
+
+def batch_likes_query(request, fields, data):
+    """Slugs of the found posts the user liked, or None when not needed."""
+    if not request.user.is_authenticated or (fields is not None and 'is_liked' not in fields):
+        return None
+    found = list(found_posts(data))
+    return Like.objects.filter(user=request.user, post__slug__in=found).values_list('post__slug', flat=True)
+
+
+def category_summary(category):
+    return {
+        'id': category.id,
+        'name': category.name,
+        'slug': category.slug,
+        'description': category.description,
+        'post_count': category.published_post_count,
+    }
+
+
+def comment_created_payload(comment):
+    return {
+        'success': True,
+        'message': 'Comment submitted successfully',
+        'comment': {
+            'id': comment.id,
+            'author': comment.author.username,
+            'content': comment.content,
+            'status': comment.status,
+            'created_at': comment.created_at.isoformat(),
+        }
+    }
@@ -0,0 +1,206 @@
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from . import fieldsets
+from .models import BlogPost, BlogPostAttachment, Comment, Like
+
+
+class PostDetailAssembler:
+    """
+    Loads everything a post detail page needs in a fixed number of queries,
+    independent of how many comments the post has:
+
+    1. the post with its author and category
+    2. its attachments
+    3. all approved comments and replies, with authors
+    4. whether the current user liked the post (authenticated users only)
+
+    Shared by blog_detail_view and api_post_detail so the HTML and JSON
+    representations are built from the same data. With `fields` (a sparse
+    fieldset of the API), only the columns and queries those fields need
+    are loaded.
+    """
+
+    def __init__(self, slug, user=None, fields=None):
+        self.slug = slug
+        self.user = user
+        self.fields = fields
+        self.post = None
+        self.attachments = []
+        self.comments = []
+        self.is_liked = False
+
+    def wants(self, name):
+        return self.fields is None or name in self.fields
+
+    def _post_queryset(self):
+        return fieldsets.project(BlogPost.objects.all(), self.fields)
+
+    def _comments_queryset(self):
+        return (
+            Comment.objects.filter(post=self.post, status='approved')
+            .select_related('author')
+            .order_by('created_at', 'id')
+        )
+
+    def _like_queryset(self):
+        return Like.objects.filter(user=self.user, post=self.post)
+
+    def _wants_like_state(self):
+        return self.wants('is_liked') and self.user is not None and self.user.is_authenticated
+
+    def assemble(self):
+        self.post = get_object_or_404(self._post_queryset(), slug=self.slug, status='published')
+        if self.wants('attachments'):
+            self.attachments = list(self.post.attachments.all())
+        if self.wants('comments'):
+            self.comments = self._build_comment_tree(list(self._comments_queryset()))
+        if self._wants_like_state():
+            self.is_liked = self._like_queryset().exists()
+        return self
+
+    async def aassemble(self):
+        """Async version of assemble(), using the same queries."""
+        try:
+            self.post = await self._post_queryset().aget(slug=self.slug, status='published')
+        except BlogPost.DoesNotExist:
+            raise Http404('No BlogPost matches the given query.')
+        if self.wants('attachments'):
+            self.attachments = [attachment async for attachment in self.post.attachments.all()]
+        if self.wants('comments'):
+            self.comments = self._build_comment_tree([comment async for comment in self._comments_queryset()])
+        if self._wants_like_state():
+            self.is_liked = await self._like_queryset().aexists()
+        return self
+
+    def _build_comment_tree(self, approved):
+        by_id = {comment.id: comment for comment in approved}
+        top_level = []
+        for comment in approved:
+            comment.approved_replies = []
+        for comment in approved:
+            if comment.parent_id is None:
+                top_level.append(comment)
+            elif comment.parent_id in by_id:
+                by_id[comment.parent_id].approved_replies.append(comment)
+        return top_level
+
+    def get_context(self):
+        return {
+            'post': self.post,
+            'attachments': self.attachments,
+            'comments': self.comments,
+            'is_liked': self.is_liked,
+        }
+
+    def to_dict(self):
+        """The API payload, without related_posts (added by the views)."""
+        fields = self.fields or fieldsets.DETAIL_FIELDS
+        data = fieldsets.serialize_post(self.post, fields)
+        if 'is_liked' in fields:
+            data['is_liked'] = self.is_liked
+        if 'attachments' in fields:
+            data['attachments'] = [
+                {
+                    'id': attachment.id,
+                    'title': attachment.title,
+                    'url': attachment.file.url,
+                }
+                for attachment in self.attachments
+            ]
+        if 'comments' in fields:
+            data['comments'] = [self._comment_to_dict(comment) for comment in self.comments]
+        return data
+
+    def _comment_to_dict(self, comment):
+        return {
+            'id': comment.id,
+            'author': comment.author.username,
+            'content': comment.content,
+            'created_at': comment.created_at.isoformat(),
+            'replies': [
+                {
+                    'id': reply.id,
+                    'author': reply.author.username,
+                    'content': reply.content,
+                    'created_at': reply.created_at.isoformat(),
+                }
+                for reply in comment.approved_replies
+            ],
+        }
+
+
+class PostBatchAssembler:
+    """
+    Loads several posts by slug for the batch API in a fixed number of
+    queries, however many slugs are asked for: the posts, then all their
+    attachments, then all their approved comments. Each found post gets a
+    PostDetailAssembler in `details`, so it serializes like the detail API.
+    """
+
+    def __init__(self, slugs, fields=None):
+        self.slugs = slugs
+        self.fields = fields
+        self.details = {}
+
+    def wants(self, name):
+        return self.fields is None or name in self.fields
+
+    def _posts_queryset(self):
+        # Only the unique slug index is used: filtering on status too lets
+        # SQLite, without ANALYZE statistics, walk every published post in
+        # the (status, created_at) index instead. Status is checked in
+        # _published(). Results are keyed by slug, so it is always loaded.
+        posts = BlogPost.objects.filter(slug__in=self.slugs).order_by()
+        return fieldsets.project(posts, self.fields, extra=['slug', 'status'])
+
+    @staticmethod
+    def _published(posts):
+        return [post for post in posts if post.status == 'published']
+
+    def _attachments_queryset(self, post_ids):
+        return BlogPostAttachment.objects.filter(post_id__in=post_ids).order_by('id')
+
+    def _comments_queryset(self, post_ids):
+        return (
+            Comment.objects.filter(post_id__in=post_ids, status='approved')
+            .select_related('author')
+            .order_by('created_at', 'id')
+        )
+
+    def assemble(self):
+        posts = self._published(self._posts_queryset())
+        post_ids = [post.id for post in posts]
+        attachments = list(self._attachments_queryset(post_ids)) if posts and self.wants('attachments') else []
+        comments = list(self._comments_queryset(post_ids)) if posts and self.wants('comments') else []
+        return self._group(posts, attachments, comments)
+
+    async def aassemble(self):
+        """Async version of assemble(), using the same queries."""
+        posts = self._published([post async for post in self._posts_queryset()])
+        post_ids = [post.id for post in posts]
+        attachments, comments = [], []
+        if posts and self.wants('attachments'):
+            attachments = [attachment async for attachment in self._attachments_queryset(post_ids)]
+        if posts and self.wants('comments'):
+            comments = [comment async for comment in self._comments_queryset(post_ids)]
+        return self._group(posts, attachments, comments)
+
+    def _group(self, posts, attachments, comments):
+        by_post = {}
+        for post in posts:
+            detail = PostDetailAssembler(post.slug, fields=self.fields)
+            detail.post = post
+            by_post[post.id] = detail
+            self.details[post.slug] = detail
+        for attachment in attachments:
+            by_post[attachment.post_id].attachments.append(attachment)
+        approved = {}
+        for comment in comments:
+            approved.setdefault(comment.post_id, []).append(comment)
+        for post_id, post_comments in approved.items():
+            by_post[post_id].comments = by_post[post_id]._build_comment_tree(post_comments)
+        return self
+
+    def posts(self):
+        return [detail.post for detail in self.details.values()]
@@ -0,0 +1,252 @@
+"""
+Native async versions of the public JSON API views, for ASGI servers.
+
+Responses are identical to the sync views in blog.views; both use the
+serializers and conditional GET validators of blog.api_helpers and the
+same cache keys. Selected in blog/urls.py when BLOG_ASYNC_API is enabled.
+
+Django's condition() decorator computes ETags synchronously before the
+view runs, so @prefetch loads what the validators need (the validator
+rows and the cache generation, the user and the session) with the async
+ORM and cache API first and memoizes it on the request where the sync
+validators find it.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from backend.db_router import replica_reads
+from backend.instrumentation import budget
+
+from . import api_cache, fieldsets, related
+from .api_helpers import (
+    batch_likes_query, category_summary, comment_created_payload, counters_query, cursor_page_payload,
+    filter_published_posts, found_posts, numbered_page_payload, parse_fields, parse_slugs, post_cache_validators,
+    post_etag, post_last_modified, post_summary, post_validators_query, posts_batch_payload,
+    posts_list_cache_validators, posts_list_etag, posts_list_validators_query, published_posts, related_summary,
+    set_counters, set_post_counters, wanted_counters,
+)
+from .assemblers import PostBatchAssembler, PostDetailAssembler
+from .models import BlogPost, Category, Comment, Like
+from .pagination import InvalidCursor, apaginate_by_cursor
+from .view_counter import view_counter
+from .viewed_posts import ViewedPosts
+from .write_queue import write_queue
+
+
+def prefetch(loader):
+    """Await loader(request, ...) before running the decorated async view."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            await loader(request, *args, **kwargs)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def _load_user_and_session(request):
+    # request.user and the session (read by the messages framework) are lazy
+    # and would hit the database from sync code inside the event loop;
+    # resolve both up front.
+    request.user = await request.auser()
+    await request.session.akeys()
+
+
+async def _afilter_published_posts(request, fields=None):
+    if not hasattr(request, '_published_posts'):
+        # Checking for the FTS index introspects the database, which has no async API
+        await sync_to_async(published_posts)(request)
+    return filter_published_posts(request, fields)
+
+
+async def _load_posts_list_validators(request):
+    await _load_user_and_session(request)
+    request._posts_list_validators = (
+        await api_cache.aget_generation(),
+        await api_cache.aget_generation(key=api_cache.COUNTERS_KEY),
+        await posts_list_validators_query().afirst(),
+    )
+
+
+async def _load_post_validators(request, slug):
+    await _load_user_and_session(request)
+    request._post_validators = await post_validators_query(slug).afirst()
+
+
+async def _aposts_list_data(request, fields):
+    posts = await _afilter_published_posts(request, fields)
+    with_snippet = bool(request.GET.get('search'))
+
+    per_page = int(request.GET.get('per_page', 10))
+
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        if with_snippet:
+            # Keyset pages follow (created_at, id), which would lose the search ranking
+            raise InvalidCursor('Cursor pagination is not available with search')
+        page_posts, next_cursor = await apaginate_by_cursor(posts, cursor, per_page)
+        return cursor_page_payload(
+            [post_summary(post, fields, with_snippet) for post in page_posts], next_cursor,
+            [post.id for post in page_posts],
+        )
+
+    page = int(request.GET.get('page', 1))
+    paginator = Paginator(posts, per_page)
+    # Count asynchronously; the paginator then only needs its cached count
+    paginator.count = await posts.acount()
+    page_obj = paginator.get_page(page)
+    page_posts = [post async for post in page_obj.object_list]
+    return numbered_page_payload(
+        [post_summary(post, fields, with_snippet) for post in page_posts], page_obj,
+        [post.id for post in page_posts],
+    )
+
+
+@budget(queries=8)
+@replica_reads
+@prefetch(_load_posts_list_validators)
+@condition(etag_func=posts_list_etag)
+async def api_posts_list(request):
+    fields, error = parse_fields(request, fieldsets.LIST_FIELDS)
+    if error:
+        return error
+    try:
+        data = await api_cache.aget_or_build(
+            request, lambda: _aposts_list_data(request, fields), posts_list_cache_validators(request),
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    post_ids = data.pop('post_ids')
+    counters = wanted_counters(fields)
+    if counters and post_ids:
+        rows = [row async for row in counters_query(counters, 'id', post_ids)]
+        set_counters(dict(zip(post_ids, data['posts'])), counters, rows)
+    return JsonResponse(data)
+
+
+async def _apost_detail_data(slug, fields):
+    detail = await PostDetailAssembler(slug, fields=fields).aassemble()
+    post_data = detail.to_dict()
+    if detail.wants('related_posts'):
+        post_data['related_posts'] = related_summary(await related.arelated_posts_for(detail.post))
+    return post_data
+
+
+@budget(queries=10)
+@replica_reads
+@prefetch(_load_post_validators)
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
+async def api_post_detail(request, slug):
+    fields, error = parse_fields(request, fieldsets.DETAIL_FIELDS)
+    if error:
+        return error
+    row = request._post_validators
+    if row is None:
+        # Checked before the cache, which may still hold an unpublished or
+        # deleted post
+        raise Http404('No BlogPost matches the given query.')
+    post_data = await api_cache.aget_or_build(
+        request, lambda: _apost_detail_data(slug, fields), post_cache_validators(row),
+    )
+    set_post_counters(post_data, row)
+    post_id = row['id']
+
+    viewed = ViewedPosts.from_request(request)
+    if post_id not in viewed:
+        # A full buffer flushes with a sync UPDATE
+        await sync_to_async(view_counter.increment)(post_id)
+        viewed.add(post_id)
+
+    if request.user.is_authenticated and 'is_liked' in post_data:
+        post_data['is_liked'] = await Like.objects.filter(user=request.user, post_id=post_id).aexists()
+
+    return viewed.save(JsonResponse(post_data))
+
+
+async def _aposts_batch_data(slugs, fields):
+    batch = await PostBatchAssembler(slugs, fields=fields).aassemble()
+    related_posts = await related.arelated_posts_for_many(batch.posts()) if batch.wants('related_posts') else {}
+    return posts_batch_payload(batch, related_posts)
+
+
+@budget(queries=10)
+@replica_reads
+@require_GET
+async def api_posts_batch(request):
+    slugs, error = parse_slugs(request)
+    if error:
+        return error
+    fields, error = parse_fields(request, fieldsets.DETAIL_FIELDS)
+    if error:
+        return error
+    request.user = await request.auser()
+    data = await api_cache.aget_or_build(request, lambda: _aposts_batch_data(slugs, fields))
+    counters = wanted_counters(fields)
+    found = found_posts(data)
+    if counters and found:
+        rows = [row async for row in counters_query(counters, 'slug', list(found))]
+        set_counters(found, counters, rows)
+    likes = batch_likes_query(request, fields, data)
+    if likes is not None:
+        async for slug in likes:
+            data['posts'][slug]['is_liked'] = True
+    return JsonResponse(data)
+
+
+async def _acategories_list_data():
+    return {'categories': [category_summary(category) async for category in Category.objects.all()]}
+
+
+@budget(queries=4)
+@replica_reads
+async def api_categories_list(request):
+    return JsonResponse(await api_cache.aget_or_build(request, _acategories_list_data))
+
+
+@require_POST
+async def api_add_comment(request, slug):
+    user = await request.auser()
+    if not user or not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        post = await BlogPost.objects.aget(slug=slug, status='published')
+    except BlogPost.DoesNotExist:
+        raise Http404('No BlogPost matches the given query.')
+
+    try:
+        data = json.loads(request.body)
+        content = data.get('content')
+        parent_id = data.get('parent_id')
+
+        if not content:
+            return JsonResponse({'error': 'Content is required'}, status=400)
+
+        parent = None
+        if parent_id:
+            try:
+                parent = await Comment.objects.aget(id=parent_id)
+            except Comment.DoesNotExist:
+                raise Http404('No Comment matches the given query.')
+
+        comment = await write_queue.arun(
+            Comment.objects.create,
+            post=post,
+            author=user,
+            content=content,
+            parent=parent
+        )
+
+        return JsonResponse(comment_created_payload(comment))
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Http404:
+        raise
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
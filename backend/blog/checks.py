@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Cache backends whose entries live in one process only
+PER_PROCESS_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches, deploy=True)
+def check_api_cache_is_shared(app_configs, **kwargs):
+    """
+    The API cache generations have to be shared by every worker process: a
+    write only bumps them in the cache of the process that made it.
+    """
+    if not getattr(settings, 'BLOG_API_CACHE_ENABLED', True):
+        return []
+    alias = getattr(settings, 'BLOG_API_CACHE_ALIAS', 'default')
+    if settings.CACHES.get(alias, {}).get('BACKEND') not in PER_PROCESS_BACKENDS:
+        return []
+    return [
+        Warning(
+            f"The JSON API cache '{alias}' is local to each process.",
+            hint=(
+                'With more than one worker process, set BLOG_API_CACHE_BACKEND and BLOG_API_CACHE_LOCATION '
+                'to a shared cache, or other workers keep serving responses that a write has invalidated.'
+            ),
+            id='blog.W001',
+        )
+    ]
@@ -0,0 +1,105 @@
+import zlib
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+
+from .models import BlogPost
+
+DEFAULT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = (
+    'id', 'title', 'slug', 'excerpt', 'content', 'author__username', 'category__name',
+    'category__slug', 'featured_image', 'is_featured', 'view_count', 'like_count',
+    'created_at', 'updated_at',
+)
+
+
+def can_export(request):
+    """Staff, or clients sending BLOG_EXPORT_TOKEN as a bearer token."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    token = getattr(settings, 'BLOG_EXPORT_TOKEN', '')
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def parse_since(value):
+    """Parse an ISO 8601 `since` value; naive timestamps are taken as UTC."""
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f'Invalid timestamp: {value!r}')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def iter_published_posts(since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield one dict per published post, oldest update first.
+
+    Uses a values() projection and a server-side iterator so memory stays
+    flat regardless of how many posts there are. Pass the largest
+    updated_at seen so far as `since` to fetch only newer changes.
+    """
+    posts = BlogPost.objects.filter(status='published')
+    if since is not None:
+        posts = posts.filter(updated_at__gt=since)
+    rows = posts.order_by('updated_at', 'id').values(*EXPORT_FIELDS)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield {
+            'id': row['id'],
+            'title': row['title'],
+            'slug': row['slug'],
+            'excerpt': row['excerpt'],
+            'content': row['content'],
+            'author': row['author__username'],
+            'category': row['category__name'],
+            'category_slug': row['category__slug'],
+            'featured_image': default_storage.url(row['featured_image']) if row['featured_image'] else None,
+            'is_featured': row['is_featured'],
+            'view_count': row['view_count'],
+            'like_count': row['like_count'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows:
+        yield (encoder.encode(row) + '\n').encode()
+
+
+def gzip_stream(chunks, level=6, flush_every=64 * 1024):
+    """Gzip an iterable of bytes incrementally, yielding compressed blocks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_every:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def batch_bytes(chunks, size=64 * 1024):
+    """Group many small lines into larger writes."""
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b''.join(buffer)
@@ -0,0 +1,96 @@
+"""
+Sparse fieldsets for the posts API (?fields=id,title,slug).
+
+Each public field knows the BlogPost columns it is built from, so a
+queryset can be narrowed with only() to exactly those columns, and the
+author/category joins are skipped when nothing from them is asked for.
+"""
+from operator import attrgetter
+
+from . import images
+
+# Public field -> (columns it needs, value getter)
+POST_FIELDS = {
+    'id': (['id'], attrgetter('id')),
+    'title': (['title'], attrgetter('title')),
+    'slug': (['slug'], attrgetter('slug')),
+    'content': (['content'], attrgetter('content')),
+    'excerpt': (['excerpt'], attrgetter('excerpt')),
+    'author': (['author__username'], lambda post: post.author.username),
+    'category': (['category__name'], lambda post: post.category.name if post.category else None),
+    'featured_image': (['featured_image'], lambda post: post.featured_image.url if post.featured_image else None),
+    'featured_image_variants': (['featured_image', 'image_variants'], images.featured_image_variants),
+    'view_count': (['view_count'], attrgetter('view_count')),
+    'like_count': (['like_count'], attrgetter('like_count')),
+    'created_at': (['created_at'], lambda post: post.created_at.isoformat()),
+}
+
+# Detail-only fields come from separate queries; these are the post
+# columns those queries read.
+DETAIL_EXTRA_COLUMNS = {
+    'is_liked': [],
+    'attachments': [],
+    'comments': [],
+    'related_posts': ['category'],
+}
+
+# Sent only when asked for in `fields`, on top of the default fields
+OPT_IN_FIELDS = ('featured_image_variants',)
+
+# The fields sent by default
+LIST_FIELDS = tuple(name for name in POST_FIELDS if name not in ('content', *OPT_IN_FIELDS))
+DETAIL_FIELDS = (*(name for name in POST_FIELDS if name not in OPT_IN_FIELDS), *DETAIL_EXTRA_COLUMNS)
+
+# Always loaded: the primary key, and created_at for ordering and cursors
+ALWAYS_LOADED = ('id', 'created_at')
+
+_JOINS = ('author', 'category')
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value, allowed):
+    """
+    Parse a comma-separated `fields` value into a list of names, or None
+    (the default fields) when it is empty. Names may be among `allowed` or
+    OPT_IN_FIELDS; raises InvalidFields for any other.
+    """
+    fields = list(dict.fromkeys(name.strip() for name in (value or '').split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed and name not in OPT_IN_FIELDS]
+    if unknown:
+        raise InvalidFields(f'Unknown fields: {", ".join(unknown)}')
+    return fields or None
+
+
+def _columns(name):
+    if name in POST_FIELDS:
+        return POST_FIELDS[name][0]
+    return DETAIL_EXTRA_COLUMNS[name]
+
+
+def project(queryset, fields, defer=(), extra=()):
+    """
+    Select only what `fields` needs, plus the `extra` columns, from a
+    BlogPost queryset. With fields None, load every column except `defer`,
+    joining author and category.
+    """
+    if fields is None:
+        queryset = queryset.select_related(*_JOINS)
+        return queryset.defer(*defer) if defer else queryset
+    columns = {*ALWAYS_LOADED, *extra}
+    for name in fields:
+        columns.update(_columns(name))
+    joins = [join for join in _JOINS if any(column.startswith(f'{join}__') for column in columns)]
+    # Guarded because select_related() with no arguments follows every
+    # foreign key. A followed relation's own column has to be loaded too.
+    if joins:
+        columns.update(joins)
+        queryset = queryset.select_related(*joins)
+    return queryset.only(*columns)
+
+
+def serialize_post(post, fields):
+    """The values of the post fields among `fields`, in that order."""
+    return {name: POST_FIELDS[name][1](post) for name in fields if name in POST_FIELDS}
@@ -0,0 +1,243 @@
+"""
+Synthetic data for benchmarks: users, categories, posts, threaded comments
+and likes in bulk, at any scale.
+
+Activity is skewed like on a real site: with `skew` above 0, post authors,
+categories, commented posts and liked posts are drawn from a Zipf-like
+distribution (the item at rank r is picked with weight 1 / r**skew), so a
+few posts get most of the comments and likes. `skew=0` draws uniformly.
+The same `seed` always generates the same data.
+"""
+import itertools
+import random
+import time
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import api_cache
+from .importer import PostImporter
+from .models import BlogPost, Category, Comment, Like
+
+User = get_user_model()
+
+WORDS = (
+    'the of and a to in is you that it he was for on are as with his they at be this have from or one had by '
+    'word but not what all were we when your can said there use an each which she do how their if will up other '
+    'about out many then them these so some her would make like him into time has look two more write go see '
+    'number no way could people my than first water been call who oil its now find long down day did get come '
+    'made may part sourdough garden python travel coffee music recipe budget review'
+).split()
+
+# Most recent comments remembered per post as candidate parents for replies
+THREAD_MEMORY = 50
+
+
+def counts_for_rows(rows):
+    """Split a total of about `rows` rows across the tables the way a blog grows."""
+    return {
+        'users': max(rows // 20, 10),
+        'categories': min(max(rows // 1000, 5), 100),
+        'posts': max(rows // 5, 10),
+        'comments': rows * 9 // 20,
+        'likes': rows * 3 // 10,
+    }
+
+
+class Distribution:
+    """Picks indexes in range(n), uniformly or skewed towards the low ones."""
+
+    def __init__(self, n, skew, rng):
+        self.n = n
+        self.rng = rng
+        self.cumulative = None
+        if skew and n > 1:
+            self.cumulative = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, n + 1)))
+
+    def pick(self):
+        if self.cumulative is None:
+            return self.rng.randrange(self.n)
+        return min(bisect_right(self.cumulative, self.rng.random() * self.cumulative[-1]), self.n - 1)
+
+
+class FixtureGenerator:
+    """
+    Adds `users` users, `categories` categories, `posts` posts, `comments`
+    comments and `likes` likes on top of whatever the database holds.
+
+    Posts go in through PostImporter, so they get unique slugs, search index
+    entries and category counters like imported posts do. `published_ratio`
+    of them are published, with creation dates spread over the last `days`
+    days. Comments land on published posts; `reply_ratio` of them reply to
+    an earlier comment of the same post, nesting at most `max_depth` levels
+    deep, and `approved_ratio` of them are approved. Every row is written
+    with bulk_create in batches of `batch_size`.
+    """
+
+    def __init__(self, users=0, categories=0, posts=0, comments=0, likes=0, skew=1.0, reply_ratio=0.3,
+                 max_depth=3, published_ratio=0.9, approved_ratio=0.8, words=60, days=365, seed=0,
+                 batch_size=5000, prefix='fixture', progress=None):
+        self.users = users
+        self.categories = categories
+        self.posts = posts
+        self.comments = comments
+        self.likes = likes
+        self.skew = skew
+        self.reply_ratio = reply_ratio
+        self.max_depth = max_depth
+        self.published_ratio = published_ratio
+        self.approved_ratio = approved_ratio
+        self.words = words
+        self.days = days
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.progress = progress
+        self.rng = random.Random(seed)
+        self.created = {}
+        self.elapsed = 0.0
+
+    def run(self):
+        started = time.perf_counter()
+        user_ids = self.create_users()
+        category_names = self.create_categories()
+        post_ids = self.create_posts(user_ids, category_names)
+        self.create_comments(post_ids, user_ids)
+        self.create_likes(post_ids, user_ids)
+        api_cache.bump_generation()
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def create_users(self):
+        offset = User.objects.filter(username__startswith=f'{self.prefix}-user-').count()
+        password = make_password(None)
+        ids = []
+        for start in range(0, self.users, self.batch_size):
+            batch = [
+                User(username=f'{self.prefix}-user-{i}', email=f'{self.prefix}-user-{i}@example.com',
+                     password=password)
+                for i in range(offset + start, offset + min(start + self.batch_size, self.users))
+            ]
+            ids.extend(user.pk for user in User.objects.bulk_create(batch))
+        self._report('users', len(ids))
+        return ids or list(User.objects.values_list('pk', flat=True)[:1000])
+
+    def create_categories(self):
+        offset = Category.objects.filter(name__startswith=f'{self.prefix.title()} category ').count()
+        names = [f'{self.prefix.title()} category {i}' for i in range(offset, offset + self.categories)]
+        Category.objects.bulk_create(
+            [Category(name=name, slug=f'{self.prefix}-category-{i}') for i, name in enumerate(names, start=offset)],
+            batch_size=self.batch_size,
+        )
+        self._report('categories', len(names))
+        return names
+
+    def create_posts(self, user_ids, category_names):
+        rng = self.rng
+        # A tenth of the users write; a few of them write most of the posts
+        writers = list(
+            User.objects.filter(pk__in=user_ids[:max(len(user_ids) // 10, 1)]).values_list('username', flat=True)
+        )
+        pick_writer = Distribution(len(writers), self.skew, rng)
+        pick_category = Distribution(len(category_names), self.skew, rng) if category_names else None
+        now = timezone.now()
+        last_id = BlogPost.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        def records():
+            for i in range(self.posts):
+                title_words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+                created_at = now - timedelta(seconds=rng.random() * self.days * 86400)
+                yield {
+                    'title': f'{title_words.capitalize()} {i}',
+                    'content': ' '.join(rng.choice(WORDS) for _ in range(self.words)),
+                    'author': writers[pick_writer.pick()],
+                    'category': category_names[pick_category.pick()] if pick_category else None,
+                    'status': 'published' if rng.random() < self.published_ratio else 'draft',
+                    'is_featured': rng.random() < 0.02,
+                    'created_at': created_at.isoformat(),
+                }
+
+        importer = PostImporter(batch_size=self.batch_size, progress=self._import_progress).run(records())
+        self._report('posts', importer.created)
+        return list(
+            BlogPost.objects.filter(pk__gt=last_id, status='published').order_by('pk').values_list('pk', flat=True)
+        )
+
+    def create_comments(self, post_ids, user_ids):
+        if not post_ids or not user_ids:
+            return
+        rng = self.rng
+        pick_post = Distribution(len(post_ids), self.skew, rng)
+        threads = {}  # post id -> [(comment id, depth), ...]
+        created = 0
+        while created < self.comments:
+            batch = []
+            depths = []
+            for _ in range(min(self.batch_size, self.comments - created)):
+                post_id = post_ids[pick_post.pick()]
+                parent_id, depth = None, 0
+                thread = threads.get(post_id)
+                if thread and rng.random() < self.reply_ratio:
+                    parent_id, parent_depth = rng.choice(thread)
+                    if parent_depth < self.max_depth:
+                        depth = parent_depth + 1
+                    else:
+                        parent_id = None
+                batch.append(Comment(
+                    post_id=post_id, author_id=rng.choice(user_ids), parent_id=parent_id,
+                    content=' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))),
+                    status='approved' if rng.random() < self.approved_ratio else 'pending',
+                ))
+                depths.append(depth)
+            with transaction.atomic():
+                Comment.objects.bulk_create(batch)
+            for comment, depth in zip(batch, depths):
+                thread = threads.setdefault(comment.post_id, [])
+                thread.append((comment.pk, depth))
+                if len(thread) > THREAD_MEMORY:
+                    del thread[0]
+            created += len(batch)
+            self._report('comments', created)
+
+    def create_likes(self, post_ids, user_ids):
+        if not post_ids or not user_ids:
+            return
+        rng = self.rng
+        pick_post = Distribution(len(post_ids), self.skew, rng)
+        wanted = min(self.likes, len(post_ids) * len(user_ids))
+        before = Like.objects.count()
+        attempts = 0
+        # Duplicate pairs are dropped, so draw until enough likes stick
+        while Like.objects.count() - before < wanted and attempts < 10:
+            missing = wanted - (Like.objects.count() - before)
+            for start in range(0, missing, self.batch_size):
+                pairs = {
+                    (rng.choice(user_ids), post_ids[pick_post.pick()])
+                    for _ in range(min(self.batch_size, missing - start))
+                }
+                Like.objects.bulk_create(
+                    [Like(user_id=user_id, post_id=post_id) for user_id, post_id in pairs], ignore_conflicts=True,
+                )
+            attempts += 1
+        BlogPost.objects.filter(pk__gte=post_ids[0]).update(like_count=Coalesce(
+            Subquery(
+                Like.objects.filter(post=OuterRef('pk')).order_by().values('post')
+                .annotate(n=Count('pk')).values('n'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ))
+        self._report('likes', Like.objects.count() - before)
+
+    def _import_progress(self, created, elapsed):
+        self._report('posts', created)
+
+    def _report(self, table, count):
+        self.created[table] = count
+        if self.progress is not None:
+            self.progress(table, count)
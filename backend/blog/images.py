@@ -0,0 +1,229 @@
+"""
+Resized copies of BlogPost.featured_image for responsive <img srcset>.
+
+After a post's image changes, generate_for_post() renders every size in
+BLOG_IMAGE_VARIANTS in every format in BLOG_IMAGE_FORMATS and stores them
+next to the original through the image field's storage, so it works with
+both the local FileSystemStorage and S3. What was generated is recorded in
+BlogPost.image_variants, keyed by the original's name so variants of a
+replaced image are never served.
+
+Generation runs on a small thread pool (BLOG_IMAGE_WORKERS) once the saving
+transaction commits, so uploads don't wait for the resizing. Until it is
+done, ResponsiveImage falls back to the original URL.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import api_cache
+from .models import BlogPost
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {'thumbnail': 320, 'card': 640, 'hero': 1280}
+DEFAULT_FORMATS = ('webp', 'jpeg')
+DEFAULT_QUALITY = 80
+
+# Pillow format name and file extension for each output format
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _variant_widths():
+    return getattr(settings, 'BLOG_IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def _formats():
+    return getattr(settings, 'BLOG_IMAGE_FORMATS', DEFAULT_FORMATS)
+
+
+def variant_name(name, variant, fmt):
+    root, _ = posixpath.splitext(name)
+    return f'{root}_{variant}.{FORMATS[fmt][1]}'
+
+
+def render(image, width, fmt, quality=DEFAULT_QUALITY):
+    """Return (bytes, (width, height)) for `image` scaled down to `width`."""
+    resized = image.copy()
+    if resized.width > width:
+        height = max(1, round(resized.height * width / resized.width))
+        resized = resized.resize((width, height), Image.Resampling.LANCZOS)
+    if fmt == 'jpeg' and resized.mode != 'RGB':
+        # JPEG has no alpha channel; flatten transparent areas onto white
+        rgba = resized.convert('RGBA')
+        resized = Image.new('RGB', rgba.size, (255, 255, 255))
+        resized.paste(rgba, mask=rgba.getchannel('A'))
+    elif fmt == 'webp' and resized.mode not in ('RGB', 'RGBA'):
+        resized = resized.convert('RGBA' if 'A' in resized.getbands() else 'RGB')
+    out = BytesIO()
+    resized.save(out, FORMATS[fmt][0], quality=quality, optimize=True)
+    return out.getvalue(), resized.size
+
+
+def generate_variants(storage, name):
+    """Render and store every configured variant of the image `name`."""
+    quality = getattr(settings, 'BLOG_IMAGE_QUALITY', DEFAULT_QUALITY)
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    variants = {}
+    for variant, width in _variant_widths().items():
+        entry = {}
+        for fmt in _formats():
+            data, size = render(image, width, fmt, quality)
+            path = variant_name(name, variant, fmt)
+            if storage.exists(path):
+                storage.delete(path)
+            entry[fmt] = storage.save(path, ContentFile(data))
+            entry['width'], entry['height'] = size
+        variants[variant] = entry
+    return {'source': name, 'variants': variants}
+
+
+def _variant_paths(image_variants):
+    return {
+        path
+        for entry in image_variants.get('variants', {}).values()
+        for fmt, path in entry.items()
+        if fmt in FORMATS
+    }
+
+
+def generate_for_post(post_id):
+    """Bring a post's stored variants in line with its current image."""
+    row = BlogPost.objects.filter(pk=post_id).values('featured_image', 'image_variants').first()
+    if row is None:
+        return
+    name = row['featured_image'] or ''
+    previous = row['image_variants'] or {}
+    if previous.get('source', '') == name:
+        return
+    storage = BlogPost._meta.get_field('featured_image').storage
+    image_variants = generate_variants(storage, name) if name else {}
+    # Only record the result if the image wasn't replaced again meanwhile
+    updated = BlogPost.objects.filter(pk=post_id, featured_image=row['featured_image']).update(
+        image_variants=image_variants,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        return
+    for path in _variant_paths(previous) - _variant_paths(image_variants):
+        storage.delete(path)
+    api_cache.bump_generation()
+
+
+def generate_for_post_safely(post_id):
+    try:
+        generate_for_post(post_id)
+    except Exception:
+        logger.exception('Failed to generate image variants for post %s', post_id)
+
+
+def _run_in_worker(post_id):
+    try:
+        generate_for_post_safely(post_id)
+    finally:
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BLOG_IMAGE_WORKERS', 2),
+                thread_name_prefix='blog-images',
+            )
+        return _executor
+
+
+def schedule(post_id):
+    """Generate a post's variants in the background (or inline if disabled)."""
+    if not getattr(settings, 'BLOG_IMAGE_ASYNC', True):
+        generate_for_post_safely(post_id)
+        return None
+    return _get_executor().submit(_run_in_worker, post_id)
+
+
+def for_post(post):
+    return ResponsiveImage(post.featured_image, post.image_variants)
+
+
+def featured_image_variants(post):
+    """The `featured_image_variants` value of the JSON APIs, or None."""
+    return for_post(post).to_dict() if post.featured_image else None
+
+
+def needs_variants(post):
+    return (post.featured_image.name or '') != (post.image_variants or {}).get('source', '')
+
+
+class ResponsiveImage:
+    """Template and API helper for a post's featured image and its variants."""
+
+    def __init__(self, field, image_variants):
+        self.field = field
+        self.storage = field.storage
+        data = image_variants or {}
+        self.variants = data.get('variants', {}) if data.get('source') == field.name else {}
+
+    def __bool__(self):
+        return bool(self.field)
+
+    @property
+    def url(self):
+        return self.field.url
+
+    @property
+    def ready(self):
+        return bool(self.variants)
+
+    def src(self, variant='card', fmt='jpeg'):
+        entry = self.variants.get(variant)
+        if not entry or fmt not in entry:
+            return self.url
+        return self.storage.url(entry[fmt])
+
+    def srcset(self, fmt='jpeg'):
+        candidates = {}
+        for entry in self.variants.values():
+            if fmt in entry:
+                candidates.setdefault(entry['width'], self.storage.url(entry[fmt]))
+        return ', '.join(f'{url} {width}w' for width, url in sorted(candidates.items()))
+
+    @property
+    def webp_srcset(self):
+        return self.srcset('webp')
+
+    @property
+    def jpeg_srcset(self):
+        return self.srcset('jpeg')
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'variants': {
+                variant: {
+                    'width': entry['width'],
+                    'height': entry['height'],
+                    **{fmt: self.storage.url(entry[fmt]) for fmt in FORMATS if fmt in entry},
+                }
+                for variant, entry in self.variants.items()
+            },
+            'srcset': {fmt: self.srcset(fmt) for fmt in FORMATS if self.srcset(fmt)},
+        }
@@ -0,0 +1,353 @@
+import csv
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import api_cache, search
+from .export import parse_since
+from .models import BlogPost, Category
+
+User = get_user_model()
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Room left at the end of a slug for a "-<n>" collision suffix
+SLUG_SUFFIX_RESERVE = 8
+
+# Bases looked up per existence query; each adds two terms to the WHERE
+# clause and SQLite caps expression depth at 1000.
+SLUG_LOOKUP_CHUNK = 100
+
+# Rows per timestamp UPDATE, three parameters each
+TIMESTAMP_UPDATE_CHUNK = 300
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+_STATUSES = {value for value, _ in BlogPost.STATUS_CHOICES}
+
+
+class RowError(ValueError):
+    pass
+
+
+def iter_json_records(stream, buffer_size=64 * 1024):
+    """
+    Yield objects from a JSON array or from newline-delimited JSON without
+    reading the whole file, decoding one value at a time from a rolling
+    buffer.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    in_array = None
+    eof = False
+    while True:
+        # Skip separators, refilling the buffer as needed
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ',')):
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = stream.read(buffer_size), 0
+            eof = not buffer
+        if pos >= len(buffer):
+            if in_array:
+                raise ValueError('Unterminated JSON array')
+            return
+        if in_array is None:
+            in_array = buffer[pos] == '['
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buffer[pos] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # JSON values never hold a raw newline, so an error before one is
+            # malformed input rather than a value cut off by the buffer
+            complete = '\n' in buffer[e.pos:]
+            more = '' if eof or complete else stream.read(buffer_size)
+            if not more:
+                raise ValueError(f'Invalid JSON: {e}')
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        if not isinstance(value, dict):
+            raise ValueError('Expected a JSON object for every post')
+        yield value
+        pos = end
+
+
+def iter_csv_records(stream):
+    yield from csv.DictReader(stream)
+
+
+class SlugAllocator:
+    """
+    Hands out unique slugs for many titles at once: `title`, `title-2`, ...
+
+    reserve() loads, in a few indexed range queries per batch, every existing
+    slug that could collide with the batch's bases. allocate() then works
+    purely in memory, remembering the next free suffix per base and every
+    slug handed out during this run.
+    """
+
+    def __init__(self, max_length=None):
+        self.max_length = max_length or BlogPost._meta.get_field('slug').max_length
+        self._next_suffix = {}
+        self._taken = set()
+
+    def base_for(self, text):
+        base = slugify(text)[:self.max_length - SLUG_SUFFIX_RESERVE].strip('-')
+        return base or 'post'
+
+    def reserve(self, bases):
+        new = sorted({base for base in bases if base not in self._next_suffix})
+        for start in range(0, len(new), SLUG_LOOKUP_CHUNK):
+            condition = Q()
+            for base in new[start:start + SLUG_LOOKUP_CHUNK]:
+                # "-" sorts right before ".", so this range is every "base-..."
+                condition |= Q(slug=base) | Q(slug__gte=f'{base}-', slug__lt=f'{base}.')
+            self._taken.update(
+                BlogPost.objects.filter(condition).order_by().values_list('slug', flat=True)
+            )
+        for base in new:
+            self._next_suffix[base] = 1
+
+    def refresh(self, base):
+        """Forget what is known about `base`, so the next allocate() looks at the database again."""
+        self._next_suffix.pop(base, None)
+
+    def allocate(self, base):
+        if base not in self._next_suffix:
+            self.reserve([base])
+        n = self._next_suffix[base]
+        while True:
+            slug = base if n == 1 else f'{base}-{n}'
+            n += 1
+            if slug not in self._taken:
+                break
+        self._next_suffix[base] = n
+        self._taken.add(slug)
+        return slug
+
+
+def _update_timestamps(posts):
+    """Write the created_at/updated_at values of `posts` to their rows."""
+    if connection.vendor != 'sqlite':
+        BlogPost.objects.bulk_update(posts, ['created_at', 'updated_at'])
+        return
+    # One UPDATE ... FROM (VALUES ...) per chunk: bulk_update's CASE per
+    # column is evaluated against every row id and makes imports twice as slow
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        for start in range(0, len(posts), TIMESTAMP_UPDATE_CHUNK):
+            chunk = posts[start:start + TIMESTAMP_UPDATE_CHUNK]
+            params = []
+            for post in chunk:
+                params.extend((post.pk, adapt(post.created_at), adapt(post.updated_at)))
+            cursor.execute(
+                f"UPDATE {BlogPost._meta.db_table} SET created_at = v.column2, updated_at = v.column3 "
+                f"FROM (VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))}) AS v "
+                f"WHERE {BlogPost._meta.db_table}.id = v.column1",
+                params,
+            )
+
+
+def _text(record, key):
+    """The string under `key` in `record`, '' when missing."""
+    value = record.get(key)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise RowError(f'{key} must be a string, not {type(value).__name__}')
+    return value
+
+
+class PostImporter:
+    """
+    Bulk-loads posts from an iterable of dicts, as produced by
+    iter_json_records(), iter_csv_records() or the export_posts command.
+
+    Recognized keys: title, content (required), slug, excerpt, author
+    (username), category (name or slug), category_slug, status,
+    is_featured, created_at, updated_at. Invalid rows are skipped and
+    reported in `errors`.
+
+    Rows go in with bulk_create, one transaction per batch. bulk_create
+    skips model signals, so new rows are added to the search index per
+    batch and the category counters and API cache are refreshed at the end.
+    A batch that breaks a constraint, such as a slug taken by another
+    writer meanwhile, is retried row by row and only the failing rows are
+    skipped.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, default_author=None,
+                 default_status='draft', create_categories=False, progress=None):
+        self.batch_size = batch_size
+        self.default_status = default_status
+        self.create_categories = create_categories
+        self.progress = progress
+        self.slugs = SlugAllocator()
+        self.authors = dict(User.objects.values_list('username', 'id'))
+        self.default_author_id = None
+        if default_author is not None:
+            if default_author not in self.authors:
+                raise ValueError(f'Unknown default author: {default_author!r}')
+            self.default_author_id = self.authors[default_author]
+        self.categories = {}
+        for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            self.categories[name.lower()] = category_id
+            self.categories[slug] = category_id
+        self.touched_categories = set()
+        self.created = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def skipped(self):
+        return len(self.errors)
+
+    @property
+    def rows_per_second(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def run(self, records):
+        started = time.perf_counter()
+        batch = []
+        for line, record in enumerate(records, start=1):
+            try:
+                post = self.build_post(record)
+            except RowError as e:
+                self.errors.append((line, str(e)))
+            else:
+                post._import_line = line
+                batch.append(post)
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+                self._report(started)
+        if batch:
+            self._write(batch)
+        if self.touched_categories:
+            Category.recount_posts(Category.objects.filter(id__in=self.touched_categories))
+        if self.created:
+            api_cache.bump_generation()
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def build_post(self, record):
+        title = _text(record, 'title').strip()
+        content = _text(record, 'content')
+        if not title:
+            raise RowError('Missing title')
+        if len(title) > BlogPost._meta.get_field('title').max_length:
+            raise RowError('Title is too long')
+        if not content:
+            raise RowError('Missing content')
+
+        status = _text(record, 'status') or self.default_status
+        if status not in _STATUSES:
+            raise RowError(f'Unknown status {status!r}')
+
+        author = _text(record, 'author')
+        author_id = self.authors.get(author, self.default_author_id)
+        if author_id is None:
+            raise RowError(f'Unknown author {author!r}')
+
+        created = _text(record, 'created_at')
+        updated = _text(record, 'updated_at')
+        created_at = self._parse_timestamp(created) or timezone.now()
+        updated_at = self._parse_timestamp(updated) or created_at
+
+        post = BlogPost(
+            title=title,
+            slug=self.slugs.base_for(_text(record, 'slug') or title),
+            author_id=author_id,
+            category_id=self._resolve_category(record),
+            content=content,
+            excerpt=_text(record, 'excerpt') or BlogPost.make_excerpt(content),
+            status=status,
+            is_featured=str(record.get('is_featured', '')).strip().lower() in _TRUE_VALUES,
+        )
+        # bulk_create() stamps the auto_now fields; _insert() puts these back
+        post._import_timestamps = (created_at, updated_at) if created or updated else None
+        return post
+
+    def _resolve_category(self, record):
+        slug = _text(record, 'category_slug')
+        name = _text(record, 'category')
+        if slug and slug in self.categories:
+            return self.categories[slug]
+        if not name:
+            if slug:
+                raise RowError(f'Unknown category slug {slug!r}')
+            return None
+        category_id = self.categories.get(name.lower()) or self.categories.get(slugify(name))
+        if category_id is None:
+            if not self.create_categories:
+                raise RowError(f'Unknown category {name!r}')
+            category = Category.objects.create(name=name, slug=slug or '')
+            category_id = category.id
+            self.categories[name.lower()] = category_id
+            self.categories[category.slug] = category_id
+        return category_id
+
+    def _parse_timestamp(self, value):
+        if not value:
+            return None
+        try:
+            return parse_since(value)
+        except ValueError as e:
+            raise RowError(str(e))
+
+    def _write(self, posts):
+        # post.slug holds the base until now; allocate the whole batch at once
+        self.slugs.reserve(post.slug for post in posts)
+        for post in posts:
+            post._slug_base = post.slug
+            post.slug = self.slugs.allocate(post.slug)
+        try:
+            with transaction.atomic():
+                self._insert(posts)
+        except IntegrityError:
+            posts = [post for post in posts if self._write_one(post)]
+        self.created += len(posts)
+        self.touched_categories.update(post.category_id for post in posts if post.category_id)
+
+    def _write_one(self, post):
+        for attempt in range(2):
+            # The failed bulk_create may have assigned a primary key
+            post.pk = None
+            post._state.adding = True
+            try:
+                with transaction.atomic():
+                    self._insert([post])
+                return True
+            except IntegrityError as e:
+                error = e
+                # Maybe the slug was taken since reserve(); look again
+                self.slugs.refresh(post._slug_base)
+                post.slug = self.slugs.allocate(post._slug_base)
+        self.errors.append((post._import_line, f'Could not save: {error}'))
+        return False
+
+    def _insert(self, posts):
+        BlogPost.objects.bulk_create(posts)
+        # Set the timestamps with a plain UPDATE rather than switching off
+        # auto_now on the shared field definitions, which every thread uses
+        dated = [post for post in posts if post._import_timestamps]
+        for post in dated:
+            post.created_at, post.updated_at = post._import_timestamps
+        if dated:
+            _update_timestamps(dated)
+        search.index_posts(post.pk for post in posts)
+
+    def _report(self, started):
+        if self.progress is not None:
+            elapsed = time.perf_counter() - started
+            self.progress(self.created, elapsed)
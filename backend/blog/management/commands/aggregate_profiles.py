@@ -0,0 +1,50 @@
+import pstats
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend import profiling
+
+
+class Command(BaseCommand):
+    help = 'Sum up the top functions across the request profiles in REQUEST_PROFILING_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.REQUEST_PROFILING_DIR, help='Profile directory')
+        parser.add_argument('--name', help='Only profiles of URL names containing this, e.g. comment_management')
+        parser.add_argument('--sort', choices=('own', 'total'), default='total',
+                            help='Rank by time in the function itself or including its callees')
+        parser.add_argument('-n', '--limit', type=int, default=25, help='Functions to list')
+
+    def handle(self, *args, **options):
+        paths = profiling.profile_paths(options['dir'], options['name'])
+        if not paths:
+            raise CommandError(f'No profiles in {options["dir"]}.')
+        sampled = [path for path in paths if path.endswith(profiling.EXTENSIONS['sample'])]
+        traced = [path for path in paths if path.endswith(profiling.EXTENSIONS['cprofile'])]
+        if sampled:
+            self.show_samples(sampled, options['sort'], options['limit'])
+        if traced:
+            self.show_traces(traced, options['sort'], options['limit'])
+
+    def show_samples(self, paths, sort, limit):
+        samples, own, total = profiling.load_samples(paths)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{samples} samples from {len(paths)} sampled requests'))
+        self.stdout.write(f'{"own %":>7}{"total %":>9}  function')
+        ranked = own if sort == 'own' else total
+        for function, _ in ranked.most_common(limit):
+            self.stdout.write(
+                f'{100 * own[function] / samples:>7.1f}{100 * total[function] / samples:>9.1f}  {function}'
+            )
+
+    def show_traces(self, paths, sort, limit):
+        stats = pstats.Stats(*paths)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{stats.total_tt:.3f}s in {len(paths)} cProfile-traced requests'
+        ))
+        self.stdout.write(f'{"calls":>9}{"own s":>9}{"total s":>9}  function')
+        # Values are (primitive calls, calls, own time, total time, callers)
+        key = 2 if sort == 'own' else 3
+        ranked = sorted(stats.stats.items(), key=lambda item: item[1][key], reverse=True)
+        for (filename, line, function), (_, calls, own, total, _) in ranked[:limit]:
+            self.stdout.write(f'{calls:>9}{own:>9.3f}{total:>9.3f}  {filename}:{line}({function})')
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import images
+from blog.models import BlogPost
+
+
+class Command(BaseCommand):
+    help = 'Generate resized featured image variants for posts that are missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate variants for every post with an image')
+
+    def handle(self, *args, **options):
+        posts = BlogPost.objects.exclude(featured_image='').exclude(featured_image__isnull=True)
+        if options['all']:
+            posts.update(image_variants={})
+
+        started = time.perf_counter()
+        count = 0
+        for post in posts.only('featured_image', 'image_variants').iterator():
+            if images.needs_variants(post):
+                images.generate_for_post_safely(post.pk)
+                count += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated image variants for {count} posts in {elapsed:.1f}s.'
+        ))
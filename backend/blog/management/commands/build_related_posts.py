@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import related
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed related-posts table from TF-IDF similarity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, help='Neighbours to store per post')
+        parser.add_argument('--dimensions', type=int, help='Random projection dimensions')
+        parser.add_argument('--max-features', type=int, help='Vocabulary size limit')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = related.build(
+            top_k=options['top_k'],
+            dimensions=options['dimensions'],
+            max_features=options['max_features'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed related posts for {count} posts in {elapsed:.1f}s.'
+        ))
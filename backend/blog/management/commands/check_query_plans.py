@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.module_loading import autodiscover_modules
+
+from blog import query_plans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot querysets of the views and fail on full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', nargs='*', help='Only check queries whose label contains one of these')
+
+    def handle(self, *args, labels, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plans are only checked on SQLite.')
+        autodiscover_modules('query_plans')
+
+        failures = []
+        for label, build in query_plans.registry.items():
+            if labels and not any(part in label for part in labels):
+                continue
+            plan, scans = query_plans.check(build())
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {label}'))
+            else:
+                self.stdout.write(f'ok         {label}')
+            if scans or options['verbosity'] > 1:
+                for line in plan:
+                    self.stdout.write(f'           {line}')
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries scan a whole table: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('No hot query scans a whole table.'))
@@ -0,0 +1,52 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import export
+
+
+class Command(BaseCommand):
+    help = 'Export published posts as newline-delimited JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+        parser.add_argument('--since', help='Only posts updated after this ISO 8601 timestamp')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE,
+                            help='Rows fetched from the database per round trip')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = export.parse_since(options['since'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        rows = counted(export.iter_published_posts(since=since, chunk_size=options['chunk_size']))
+        body = export.batch_bytes(export.ndjson_lines(rows))
+        if options['gzip']:
+            body = export.gzip_stream(body)
+
+        started = time.perf_counter()
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in body:
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write(f'Exported {count} posts in {elapsed:.1f}s.')
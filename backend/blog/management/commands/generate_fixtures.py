@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import fixture_generator
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create synthetic users, categories, posts, comments and likes for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int,
+                            help='Total rows, split across the tables like a real blog (overridden per table below)')
+        for table in ('users', 'categories', 'posts', 'comments', 'likes'):
+            parser.add_argument(f'--{table}', type=int, help=f'Number of {table} to create')
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Zipf exponent for picking authors, categories and posts; 0 picks uniformly')
+        parser.add_argument('--reply-ratio', type=float, default=0.3, help='Share of comments that are replies')
+        parser.add_argument('--max-depth', type=int, default=3, help='Deepest reply nesting')
+        parser.add_argument('--published-ratio', type=float, default=0.9, help='Share of posts that are published')
+        parser.add_argument('--approved-ratio', type=float, default=0.8, help='Share of comments that are approved')
+        parser.add_argument('--words', type=int, default=60, help='Words per post')
+        parser.add_argument('--days', type=int, default=365, help='Spread post dates over this many days')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed generates the same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--prefix', default='fixture', help='Prefix of generated usernames and category names')
+
+    def handle(self, *args, **options):
+        counts = fixture_generator.counts_for_rows(options['rows']) if options['rows'] else {}
+        for table in ('users', 'categories', 'posts', 'comments', 'likes'):
+            if options[table] is not None:
+                counts[table] = options[table]
+        if not counts:
+            raise CommandError('Pass --rows or the number of rows of at least one table.')
+
+        generator = fixture_generator.FixtureGenerator(
+            **counts,
+            skew=options['skew'],
+            reply_ratio=options['reply_ratio'],
+            max_depth=options['max_depth'],
+            published_ratio=options['published_ratio'],
+            approved_ratio=options['approved_ratio'],
+            words=options['words'],
+            days=options['days'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            progress=self.report_progress if options['verbosity'] > 1 else None,
+        ).run()
+
+        summary = ', '.join(f'{count} {table}' for table, count in generator.created.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary} in {generator.elapsed:.1f}s.'))
+
+    def report_progress(self, table, count):
+        self.stderr.write(f'{count} {table} created')
@@ -0,0 +1,68 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import importer
+
+
+class Command(BaseCommand):
+    help = 'Bulk import posts from a JSON, NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - for stdin')
+        parser.add_argument('--format', choices=['json', 'csv'],
+                            help='Input format (default: from the file extension, else json)')
+        parser.add_argument('--batch-size', type=int, default=importer.DEFAULT_BATCH_SIZE,
+                            help='Rows written per bulk insert and transaction')
+        parser.add_argument('--default-author', help='Username used for rows without a known author')
+        parser.add_argument('--status', default='draft', choices=['draft', 'published'],
+                            help='Status for rows that do not specify one')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories that do not exist yet')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            fmt = 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'json'
+
+        try:
+            post_importer = importer.PostImporter(
+                batch_size=options['batch_size'],
+                default_author=options['default_author'],
+                default_status=options['status'],
+                create_categories=options['create_categories'],
+                progress=self.report_progress if options['verbosity'] > 1 else None,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        try:
+            if fmt == 'csv':
+                records = importer.iter_csv_records(stream)
+            else:
+                records = importer.iter_json_records(stream)
+            post_importer.run(records)
+        except ValueError as e:
+            raise CommandError(f'{e} ({post_importer.created} posts were imported before the error)')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for line, message in post_importer.errors[:20]:
+            self.stderr.write(f'Record {line}: {message}')
+        if post_importer.skipped > 20:
+            self.stderr.write(f'... and {post_importer.skipped - 20} more skipped records')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {post_importer.created} posts, skipped {post_importer.skipped}, '
+            f'in {post_importer.elapsed:.1f}s ({post_importer.rows_per_second:.0f} rows/s).'
+        ))
+        if post_importer.created:
+            self.stdout.write('Run build_related_posts to include the new posts in related posts.')
+
+    def report_progress(self, created, elapsed):
+        rate = created / elapsed if elapsed else 0
+        self.stderr.write(f'{created} posts imported ({rate:.0f} rows/s)')
@@ -0,0 +1,139 @@
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import endpoints, loadtest
+from benchmarks.api_load import BACKEND_DIR, free_port, wait_for_port
+
+
+class Command(BaseCommand):
+    help = 'Ramp up simulated visitors against a local server and report throughput, latency and errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000,
+                            help='Fixture rows to generate into the scratch database; 0 uses the dev data as it is')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the fixtures and of the visitors')
+        parser.add_argument('--cache-dir', default=os.path.join(BACKEND_DIR, 'var', 'benchmarks'),
+                            help='Where generated databases are kept between runs')
+        parser.add_argument('--server', choices=loadtest.SERVERS, default='runserver',
+                            help='Server to start: Django runserver (threaded), gunicorn or uvicorn')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='gunicorn/uvicorn processes')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+        parser.add_argument('--concurrency', default='1,5,10,20,40,80',
+                            help='Comma-separated numbers of concurrent visitors, one stage each')
+        parser.add_argument('--stage-seconds', type=float, default=15, help='Measured seconds per stage')
+        parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds at the start of each stage')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Mean pause in seconds between a visitor\'s actions; 0 sends the next one at once')
+        parser.add_argument('--mix', default=loadtest.DEFAULT_MIX,
+                            help=f'Weighted actions out of {", ".join(loadtest.ACTIONS)}')
+        parser.add_argument('--users', type=int,
+                            help='Load test accounts visitors log in as (default: one per visitor)')
+        parser.add_argument('--max-p95-ms', type=float, default=1000, help='p95 latency past saturation')
+        parser.add_argument('--max-error-rate', type=float, default=0.01, help='Error rate past saturation')
+        parser.add_argument('--output', help='Write the stages as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError as e:
+            raise CommandError(e)
+        if not levels or min(levels) < 1 or levels != sorted(levels):
+            raise CommandError('--concurrency takes increasing numbers of visitors, e.g. 1,5,10,20.')
+        server = options['server']
+        module = {'gunicorn': 'gunicorn', 'uvicorn': 'uvicorn'}.get(server)
+        if module and importlib.util.find_spec(module) is None:
+            raise CommandError(f'{server} is not installed: pip install {server}')
+
+        scratch = tempfile.mkdtemp(prefix='blog-loadtest-')
+        try:
+            db_path = os.path.join(scratch, 'db.sqlite3')
+            data = self.prepare(db_path, options, users=options['users'] or levels[-1])
+            if not data['slugs']:
+                raise CommandError('The database has no published posts; pass --rows.')
+            self.stdout.write(
+                f'{len(data["slugs"])} posts, {server}, {options["stage_seconds"]:g}s '
+                f'per stage, mix {", ".join(f"{name}={weight:g}" for name, weight in mix.items())}'
+            )
+            stages = self.run(server, db_path, data, mix, levels, options)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        self.report(stages, options)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump([stage.summary() for stage in stages], f, indent=2)
+
+    def prepare(self, db_path, options, users):
+        # A fresh process per step: Django reads BENCHMARK_DB once
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            source = os.path.join(BACKEND_DIR, 'db.sqlite3')
+            if options['rows']:
+                os.makedirs(options['cache_dir'], exist_ok=True)
+                source = pool.apply(endpoints.prepare_database, (options['rows'], options['seed'], options['cache_dir']))
+            return pool.apply(loadtest.prepare, (source, db_path, users))
+
+    def run(self, server, db_path, data, mix, levels, options):
+        port = free_port()
+        process = loadtest.start_server(server, port, db_path, options['workers'], options['threads'])
+        server_log = loadtest.ServerLog(process.stderr)
+        try:
+            try:
+                wait_for_port(port)
+            except RuntimeError as e:
+                raise CommandError(f'{e}:\n' + '\n'.join(server_log.tail))
+            self.stdout.write(f'{"visitors":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+                              f'{"errors":>8}{"locked":>8}')
+            return asyncio.run(loadtest.ramp(
+                port, data, mix, levels, options['stage_seconds'], options['warmup'], options['think_time'],
+                # runserver sends headers and body apart, so a reused connection waits
+                # out the client's delayed ACK (~40 ms) on every response
+                keep_alive=server != 'runserver', server_log=server_log, seed=options['seed'], progress=self.report_stage,
+            ))
+        finally:
+            process.terminate()
+            process.wait()
+
+    def report_stage(self, stage):
+        p50, p95, p99 = (f'{value:.1f}' if value is not None else '-' for value in stage.percentiles())
+        self.stdout.write(f'{stage.concurrency:>8}{stage.throughput:>9.1f}{p50:>9}{p95:>9}{p99:>9}'
+                          f'{stage.error_rate:>8.1%}{stage.locked:>8}')
+
+    def report(self, stages, options):
+        index, reason = loadtest.saturation_point(stages, options['max_p95_ms'], options['max_error_rate'])
+        if index is None:
+            self.stdout.write(self.style.WARNING(f'Saturated from the first stage: {reason}.'))
+        elif reason is None:
+            self.stdout.write(self.style.SUCCESS(
+                f'Not saturated at {stages[index].concurrency} visitors; add higher --concurrency levels.'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Saturation point: {stages[index].concurrency} visitors at {stages[index].throughput:.1f} req/s '
+                f'({reason}).'
+            ))
+
+        stage = stages[-1 if index is None else index]
+        self.stdout.write(f'\nAt {stage.concurrency} visitors:')
+        self.stdout.write(f'{"action":<10}{"requests":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+        errors = {}
+        for (action, _), count in stage.errors.items():
+            errors[action] = errors.get(action, 0) + count
+        for action in loadtest.ACTIONS:
+            requests = len(stage.latencies.get(action, ())) + errors.get(action, 0)
+            if not requests:
+                continue
+            p50, p95, p99 = (f'{value:.1f}' if value is not None else '-' for value in stage.percentiles(action))
+            self.stdout.write(f'{action:<10}{requests:>9}{p50:>9}{p95:>9}{p99:>9}{errors.get(action, 0):>8}')
+        if stage.errors:
+            self.stdout.write('errors: ' + ', '.join(
+                f'{action} {kind} x{count}' for (action, kind), count in stage.errors.most_common()
+            ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend import profiling
+
+
+class Command(BaseCommand):
+    help = 'Print a signed X-Profile header value that has a request profiled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=profiling.MODES, help='Profiler (default: REQUEST_PROFILING_MODE)')
+
+    def handle(self, *args, **options):
+        try:
+            token = profiling.make_token(options['mode'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'{profiling.HEADER}: {token}')
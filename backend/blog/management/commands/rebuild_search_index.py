@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for blog posts from scratch'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The full-text search index is only supported on SQLite.')
+
+        with transaction.atomic():
+            indexed = search.rebuild_index()
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts.'))
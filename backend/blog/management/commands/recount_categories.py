@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored published/total post counts of every category'
+
+    def handle(self, *args, **options):
+        updated = Category.recount_posts()
+        self.stdout.write(self.style.SUCCESS(f'Recounted posts for {updated} categories.'))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_post_counts(apps, schema_editor):
+    Category = apps.get_model('blog', 'Category')
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    counts = (
+        BlogPost.objects.filter(category__isnull=False)
+        .values('category')
+        .annotate(total=Count('pk'), published=Count('pk', filter=Q(status='published')))
+    )
+    for row in counts:
+        Category.objects.filter(pk=row['category']).update(
+            total_post_count=row['total'],
+            published_post_count=row['published'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_blogpost_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_post_counts, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils.text import slugify
@@ -12,6 +14,10 @@ class Category(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Denormalized counters, kept in sync by blog.signals
+    published_post_count = models.PositiveIntegerField(default=0, editable=False)
+    total_post_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
@@ -21,6 +27,26 @@ class Category(models.Model):
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
     
+    @classmethod
+    def recount_posts(cls, queryset=None):
+        """Recompute the stored post counters from BlogPost. Returns rows updated."""
+        if queryset is None:
+            queryset = cls.objects.all()
+        counts = BlogPost.objects.filter(category=OuterRef('pk')).order_by().values('category')
+        return queryset.update(
+            total_post_count=Coalesce(
+                Subquery(counts.annotate(n=Count('pk')).values('n'), output_field=IntegerField()),
+                Value(0),
+            ),
+            published_post_count=Coalesce(
+                Subquery(
+                    counts.annotate(n=Count('pk', filter=Q(status='published'))).values('n'),
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            ),
+        )
+    
     def __str__(self):
         return self.name
 
@@ -40,6 +66,8 @@ class BlogPost(models.Model):
     excerpt = models.TextField(max_length=300, blank=True, help_text="Brief description of the post")
     
     featured_image = models.ImageField(upload_to='blog/images/', blank=True, null=True)
+    # Resized copies of featured_image, maintained by blog.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     is_featured = models.BooleanField(default=False)
@@ -53,14 +81,40 @@ class BlogPost(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Published lists, newest first
+            models.Index(fields=['status', 'created_at'], name='blog_post_status_created_idx'),
+            # The latest change to a published post, for the API list ETag
+            models.Index(fields=['status', 'updated_at'], name='blog_post_status_updated_idx'),
+            # Unfiltered admin lists, newest first
+            models.Index(fields=['created_at'], name='blog_post_created_idx'),
+            # Category pages
+            models.Index(fields=['category', 'status', 'created_at'], name='blog_post_category_idx'),
+            # The few featured posts on the home page. The condition has no
+            # parameters: SQLite only uses a partial index when the query's
+            # WHERE clause contains the condition's terms literally.
+            models.Index(fields=['status', 'created_at'], condition=Q(is_featured=True), name='blog_post_featured_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the category counters currently reflect for this row
+        if 'category_id' in instance.__dict__ and 'status' in instance.__dict__:
+            instance._counted_as = (instance.category_id, instance.status)
+        return instance
     
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
         if not self.excerpt and self.content:
-            self.excerpt = self.content[:297] + "..." if len(self.content) > 300 else self.content
+            self.excerpt = self.make_excerpt(self.content)
         super().save(*args, **kwargs)
     
+    @staticmethod
+    def make_excerpt(content):
+        return content[:297] + "..." if len(content) > 300 else content
+    
     def get_absolute_url(self):
         return reverse('blog:post_detail', kwargs={'slug': self.slug})
     
@@ -98,6 +152,13 @@ class Comment(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Approved comments of a post, in thread order
+            models.Index(fields=['post', 'status', 'created_at'], name='blog_comment_post_status_idx'),
+            # Moderation queue, filtered by status or not
+            models.Index(fields=['status', 'created_at'], name='blog_comment_moderation_idx'),
+            models.Index(fields=['created_at'], name='blog_comment_created_idx'),
+        ]
     
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
@@ -113,3 +174,22 @@ class Like(models.Model):
     
     def __str__(self):
         return f"{self.user.username} likes {self.post.title}"
+
+
+
+class RelatedPost(models.Model):
+    """Precomputed content-similarity neighbours, built by blog.related."""
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='recommended_in')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['post', 'rank']
+        unique_together = ('post', 'related')
+        indexes = [
+            models.Index(fields=['post', 'rank'], name='blog_related_post_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.post_id} -> {self.related_id} ({self.score:.3f})"
@@ -0,0 +1,72 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+MAX_PAGE_SIZE = 100
+
+# Ids have to fit the database's 64-bit integer column
+_MAX_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(post):
+    payload = json.dumps([post.created_at.isoformat(), post.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at, post_id = datetime.fromisoformat(created_at), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError, OverflowError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+    if not 0 <= post_id <= _MAX_ID:
+        raise InvalidCursor('Invalid cursor')
+    return created_at, post_id
+
+
+def _cursor_queryset(queryset, cursor, per_page):
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, post_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) |
+            Q(created_at=created_at, id__lt=post_id)
+        )
+    # One extra row tells whether there is a next page
+    return queryset[:per_page + 1]
+
+
+def _split_page(posts, per_page):
+    next_cursor = None
+    if len(posts) > per_page:
+        posts = posts[:per_page]
+        next_cursor = encode_cursor(posts[-1])
+    return posts, next_cursor
+
+
+def paginate_by_cursor(queryset, cursor, per_page):
+    """
+    Keyset pagination over (created_at, id), newest first.
+
+    Returns (posts, next_cursor). No COUNT(*) and no OFFSET: each page is an
+    indexed range scan starting right after the last row of the previous one.
+    next_cursor is None on the last page.
+    """
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    posts = list(_cursor_queryset(queryset, cursor, per_page))
+    return _split_page(posts, per_page)
+
+
+async def apaginate_by_cursor(queryset, cursor, per_page):
+    """Async version of paginate_by_cursor()."""
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    posts = [post async for post in _cursor_queryset(queryset, cursor, per_page)]
+    return _split_page(posts, per_page)
@@ -0,0 +1,157 @@
+"""
+Query plan checks for the hot querysets of the views.
+
+Each app lists the querysets its views run on every request in a
+`query_plans` module, registered with @hot_query. `manage.py
+check_query_plans` runs EXPLAIN QUERY PLAN on each of them and fails when
+SQLite would read a whole table instead of searching an index.
+
+Substring searches (icontains) are left out on purpose: no B-tree index
+can serve them, and the public search goes through the FTS index.
+
+Plans depend on the statistics ANALYZE stores in sqlite_stat1. Check a
+database without statistics (such as the test database) or one with
+production-sized data: on tiny analyzed tables a scan is the right plan.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory
+from django.utils import timezone
+
+from .api_helpers import filter_published_posts, post_validators_query, posts_list_validators_query
+from .assemblers import PostBatchAssembler, PostDetailAssembler
+from .models import BlogPost, Category
+from .pagination import _cursor_queryset, encode_cursor
+from .views import _blog_list_posts, _category_posts, _featured_posts
+
+registry = {}
+
+# "SCAN blog_blogpost", optionally walking an index, as opposed to SEARCH
+SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)\S+(?: AS \S+)?(?P<index> USING (?:COVERING )?INDEX \S+)?$')
+
+# An FTS5 table probed by rowid with a MATCH ("=" and "M" in its index
+# string) runs the whole full-text query again for every outer row
+MATCH_PER_ROW = re.compile(r'^SCAN \S+ VIRTUAL TABLE INDEX \d+:\S*=\S*M')
+
+
+def hot_query(label):
+    """Register a function returning a queryset to check, under `label`."""
+    def register(func):
+        registry[label] = func
+        return func
+    return register
+
+
+def explain(queryset):
+    """The EXPLAIN QUERY PLAN detail lines for `queryset`."""
+    # SQLite rows come back as "<id> <parent> <notused> <detail>"
+    return [line.split(' ', 3)[-1] for line in queryset.explain().splitlines()]
+
+
+def full_scans(plan, limited=False):
+    """
+    The lines of `plan` that read a whole table, or the full-text index once
+    per row. Walking an index in order is fine when the query has a LIMIT,
+    which stops the walk early.
+    """
+    scans = []
+    for line in plan:
+        match = SCAN.match(line)
+        if match and not (limited and match.group('index')) or MATCH_PER_ROW.match(line):
+            scans.append(line)
+    return scans
+
+
+def check(queryset):
+    """(plan, full scans) for `queryset`."""
+    plan = explain(queryset)
+    return plan, full_scans(plan, limited=queryset.query.high_mark is not None)
+
+
+def _get(path='/', **params):
+    return RequestFactory().get(path, params)
+
+
+@hot_query('blog: published posts, newest first')
+def published_posts():
+    return _blog_list_posts(_get())[:6]
+
+
+@hot_query('blog: featured posts')
+def featured_posts():
+    return _featured_posts(_blog_list_posts(_get()))
+
+
+@hot_query('blog: search results')
+def search_results():
+    return _blog_list_posts(_get(search='python'))[:6]
+
+
+@hot_query('blog: rows of a search count')
+def search_count():
+    # count() drops the rank and snippet columns, which changes the plan
+    return filter_published_posts(_get(search='python')).order_by().values('id')
+
+
+@hot_query('blog: category page')
+def category_posts():
+    return _category_posts(Category(id=1))[:6]
+
+
+@hot_query('blog: API list by category slug')
+def api_posts_by_category():
+    posts = filter_published_posts(_get(category='travel'))
+    return posts[:10]
+
+
+@hot_query('blog: API list cursor page')
+def api_posts_cursor_page():
+    posts = filter_published_posts(_get())
+    cursor = encode_cursor(BlogPost(id=10, created_at=timezone.now()))
+    return _cursor_queryset(posts, cursor, 10)
+
+
+@hot_query('blog: rows of the API list count')
+def posts_list_count():
+    # count() returns no queryset; this reads the same rows the same way
+    return filter_published_posts(_get()).order_by().values('id')
+
+
+@hot_query('blog: API list validators')
+def posts_list_validators():
+    # What .first() runs
+    return posts_list_validators_query()[:1]
+
+
+@hot_query('blog: post detail validators')
+def post_validators():
+    return post_validators_query('some-post')
+
+
+def _detail_assembler():
+    assembler = PostDetailAssembler('some-post', user=get_user_model()(id=1))
+    assembler.post = BlogPost(id=1)
+    return assembler
+
+
+@hot_query('blog: approved comments of a post')
+def post_comments():
+    return _detail_assembler()._comments_queryset()
+
+
+@hot_query('blog: like state')
+def like_state():
+    return _detail_assembler()._like_queryset()
+
+
+@hot_query('blog: batch posts by slug')
+def batch_posts():
+    return PostBatchAssembler(['a', 'b', 'c'])._posts_queryset()
+
+
+@hot_query('blog: categories by slug')
+def category_by_slug():
+    # What get_object_or_404(Category, slug=...) runs
+    return Category.objects.filter(slug='travel')
+
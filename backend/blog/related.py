@@ -0,0 +1,451 @@
+"""
+Content-similarity index for "related posts".
+
+Posts are turned into TF-IDF vectors over title, excerpt and content, and
+each post's top-k cosine neighbours are stored in the RelatedPost table so
+detail pages only need one indexed lookup. The full build runs offline
+(manage.py build_related_posts); saves refresh the saved post's own list
+against the vectors persisted by the last build.
+
+Large vocabularies are reduced with a seeded Gaussian random projection to
+BLOG_RELATED_POSTS_DIMENSIONS dense dimensions before the all-pairs
+similarity search. Cosine similarities are approximately preserved, and it
+keeps memory at O(posts x dimensions) instead of O(posts x vocabulary).
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+import numpy as np
+
+from .models import BlogPost, RelatedPost
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 5
+DEFAULT_DIMENSIONS = 256
+DEFAULT_MAX_FEATURES = 50000
+
+# Field boosts applied to raw term counts
+FIELD_WEIGHTS = (('title', 3), ('excerpt', 2), ('content', 1))
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been
+before being below between both but by can could did do does doing down during
+each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no
+nor not now of off on once only or other our ours ourselves out over own same
+she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when
+where which while who whom why will with would you your yours yourself
+yourselves
+""".split())
+
+_TOKEN_RE = re.compile(r'[^\W\d_]{2,}', re.UNICODE)
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+def document_terms(title, excerpt, content):
+    counts = Counter()
+    for text, weight in zip((title, excerpt, content), (w for _, w in FIELD_WEIGHTS)):
+        for token in tokenize(text):
+            counts[token] += weight
+    return counts
+
+
+class TermTable:
+    """
+    Interns terms to integer ids so a corpus can be held as small numpy
+    arrays (term ids, counts) per document instead of one dict per post.
+    """
+
+    def __init__(self):
+        self.ids = {}
+
+    def encode(self, counts):
+        ids = np.fromiter(
+            (self.ids.setdefault(term, len(self.ids)) for term in counts),
+            dtype=np.int32, count=len(counts),
+        )
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return ids, tf
+
+    def terms(self):
+        return list(self.ids)
+
+
+class Vectorizer:
+    """TF-IDF with sublinear term frequency and optional random projection."""
+
+    def __init__(self, vocabulary=None, idf=None, dimensions=DEFAULT_DIMENSIONS, seed=0):
+        self.vocabulary = vocabulary or {}
+        self.idf = idf
+        self.dimensions = dimensions
+        self.seed = seed
+        self._projection = None
+        self._columns = None
+
+    @property
+    def projected(self):
+        return len(self.vocabulary) > self.dimensions
+
+    @property
+    def output_dimensions(self):
+        return self.dimensions if self.projected else len(self.vocabulary)
+
+    def fit(self, docs, terms, max_features=DEFAULT_MAX_FEATURES):
+        """Learn vocabulary and IDF from documents encoded by TermTable."""
+        n_docs = len(docs)
+        if docs:
+            df = np.bincount(np.concatenate([ids for ids, _ in docs]), minlength=len(terms))
+        else:
+            df = np.zeros(len(terms), dtype=np.int64)
+        min_df = 2 if n_docs >= 100 else 1
+        max_df = n_docs * 0.5 if n_docs >= 50 else n_docs
+        candidates = np.flatnonzero((df >= min_df) & (df <= max_df))
+        selected = candidates[np.argsort(-df[candidates], kind='stable')][:max_features]
+
+        self.vocabulary = {terms[i]: col for col, i in enumerate(selected.tolist())}
+        self.idf = (np.log((1 + n_docs) / (1 + df[selected])) + 1).astype(np.float32)
+        # Term id -> output column, -1 for terms left out of the vocabulary
+        self._columns = np.full(len(terms), -1, dtype=np.int64)
+        self._columns[selected] = np.arange(len(selected))
+        self._projection = None
+        return self
+
+    def _projection_matrix(self):
+        if self._projection is None:
+            rng = np.random.default_rng(self.seed)
+            self._projection = (
+                rng.standard_normal((len(self.vocabulary), self.dimensions), dtype=np.float32)
+                / np.float32(math.sqrt(self.dimensions))
+            )
+        return self._projection
+
+    def transform(self, docs):
+        """
+        Return an L2-normalized float32 matrix, one row per document. docs are
+        the TermTable-encoded documents passed to fit().
+        """
+        matrix = np.zeros((len(docs), self.output_dimensions), dtype=np.float32)
+        projection = self._projection_matrix() if self.projected else None
+        for row, (ids, tf) in enumerate(docs):
+            columns = self._columns[ids]
+            keep = columns >= 0
+            if not keep.any():
+                continue
+            columns = columns[keep]
+            weights = (1 + np.log(tf[keep])) * self.idf[columns]
+            if projection is None:
+                matrix[row, columns] = weights
+            else:
+                matrix[row] = weights @ projection[columns]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def transform_counts(self, term_counts):
+        """Like transform(), for raw document_terms() counters."""
+        table = TermTable()
+        table.ids = dict(self.vocabulary)
+        docs = []
+        for counts in term_counts:
+            known = Counter({t: c for t, c in counts.items() if t in self.vocabulary})
+            docs.append(table.encode(known))
+        self._columns = np.arange(len(self.vocabulary), dtype=np.int64)
+        return self.transform(docs)
+
+    def to_dict(self):
+        return {
+            'vocabulary': self.vocabulary,
+            'idf': self.idf.tolist(),
+            'dimensions': self.dimensions,
+            'seed': self.seed,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            vocabulary=data['vocabulary'],
+            idf=np.array(data['idf'], dtype=np.float32),
+            dimensions=data['dimensions'],
+            seed=data['seed'],
+        )
+
+
+# Bytes per similarity while a block is ranked: the float32 similarity
+# and the int64 position argpartition() returns for it
+_BYTES_PER_SIMILARITY = 12
+
+
+def top_k_neighbours(matrix, k, memory_budget=None):
+    """
+    Exact top-k cosine neighbours for every row of a normalized matrix.
+
+    Returns (indices, scores), both shaped (n, k); rows are sorted best first.
+    Similarities are computed and ranked one block of rows at a time, with
+    as many rows per block as fit in memory_budget bytes
+    (BLOG_RELATED_POSTS_BLOCK_MEMORY by default) at 12 bytes per row and
+    post, and at least one row.
+    """
+    if memory_budget is None:
+        memory_budget = getattr(settings, 'BLOG_RELATED_POSTS_BLOCK_MEMORY', 64 * 1024 * 1024)
+    n = matrix.shape[0]
+    k = min(k, max(n - 1, 0))
+    indices = np.zeros((n, k), dtype=np.int64)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return indices, scores
+    block_size = max(1, memory_budget // (n * _BYTES_PER_SIMILARITY))
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        sims = matrix[start:end] @ matrix.T
+        rows = np.arange(end - start)
+        sims[rows, rows + start] = -np.inf
+        # Negated in place, so ranking needs no second block of floats
+        np.negative(sims, out=sims)
+        # Copied so the full argpartition() result is freed with the block
+        part = np.argpartition(sims, k - 1, axis=1)[:, :k].copy()
+        part_scores = -np.take_along_axis(sims, part, axis=1)
+        del sims
+        order = np.argsort(-part_scores, axis=1)
+        indices[start:end] = np.take_along_axis(part, order, axis=1)
+        scores[start:end] = np.take_along_axis(part_scores, order, axis=1)
+    return indices, scores
+
+
+# Persisted index used for incremental updates
+
+def _index_dir():
+    return str(getattr(settings, 'BLOG_RELATED_POSTS_INDEX_DIR'))
+
+
+def _index_paths():
+    base = _index_dir()
+    return (
+        os.path.join(base, 'vectorizer.json'),
+        os.path.join(base, 'ids.npy'),
+        os.path.join(base, 'vectors.npy'),
+    )
+
+
+def _save_index(vectorizer, ids, matrix):
+    os.makedirs(_index_dir(), exist_ok=True)
+    vectorizer_path, ids_path, vectors_path = _index_paths()
+    for path, write in (
+        (ids_path, lambda f: np.save(f, ids)),
+        (vectors_path, lambda f: np.save(f, matrix)),
+        (vectorizer_path, lambda f: f.write(json.dumps(vectorizer.to_dict()).encode())),
+    ):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+
+_loaded = {'mtime': None, 'index': None}
+_load_lock = threading.Lock()
+
+
+def load_index():
+    """Return (vectorizer, ids, matrix) from the last build, or None."""
+    vectorizer_path, ids_path, vectors_path = _index_paths()
+    try:
+        mtime = os.path.getmtime(vectorizer_path)
+    except OSError:
+        return None
+    with _load_lock:
+        if _loaded['mtime'] != mtime:
+            with open(vectorizer_path) as f:
+                vectorizer = Vectorizer.from_dict(json.load(f))
+            ids = np.load(ids_path)
+            matrix = np.load(vectors_path, mmap_mode='r')
+            _loaded.update(mtime=mtime, index=(vectorizer, ids, matrix))
+        return _loaded['index']
+
+
+def _settings_top_k():
+    return getattr(settings, 'BLOG_RELATED_POSTS_TOP_K', DEFAULT_TOP_K)
+
+
+def build(top_k=None, dimensions=None, max_features=None, batch_size=1000):
+    """Rebuild every post's related list from scratch. Returns the post count."""
+    top_k = top_k or _settings_top_k()
+    dimensions = dimensions or getattr(settings, 'BLOG_RELATED_POSTS_DIMENSIONS', DEFAULT_DIMENSIONS)
+    max_features = max_features or DEFAULT_MAX_FEATURES
+
+    rows = BlogPost.objects.filter(status='published').order_by('id').values_list(
+        'id', 'title', 'excerpt', 'content'
+    )
+    ids = []
+    docs = []
+    table = TermTable()
+    for post_id, title, excerpt, content in rows.iterator(chunk_size=2000):
+        ids.append(post_id)
+        docs.append(table.encode(document_terms(title, excerpt, content)))
+
+    vectorizer = Vectorizer(dimensions=dimensions).fit(docs, table.terms(), max_features=max_features)
+    matrix = vectorizer.transform(docs)
+    del docs, table
+    ids = np.array(ids, dtype=np.int64)
+    neighbours, scores = top_k_neighbours(matrix, top_k)
+
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        batch = []
+        for row, post_id in enumerate(ids.tolist()):
+            rank = 0
+            for col, score in zip(neighbours[row].tolist(), scores[row].tolist()):
+                if score <= 0:
+                    continue
+                batch.append(RelatedPost(post_id=post_id, related_id=int(ids[col]), rank=rank, score=score))
+                rank += 1
+            if len(batch) >= batch_size:
+                RelatedPost.objects.bulk_create(batch)
+                batch = []
+        RelatedPost.objects.bulk_create(batch)
+
+    _save_index(vectorizer, ids, matrix)
+    return len(ids)
+
+
+def update_post(post_id):
+    """Recompute one post's related list against the last full build."""
+    index = load_index()
+    if index is None:
+        return
+    vectorizer, ids, matrix = index
+    post = BlogPost.objects.filter(id=post_id, status='published').values_list(
+        'title', 'excerpt', 'content'
+    ).first()
+    if post is None:
+        return
+    vector = vectorizer.transform_counts([document_terms(*post)])[0]
+    sims = np.asarray(matrix @ vector)
+    sims[ids == post_id] = -np.inf
+    top_k = min(_settings_top_k(), len(ids))
+    if top_k == 0:
+        return
+    best = np.argpartition(-sims, top_k - 1)[:top_k]
+    best = best[np.argsort(-sims[best])]
+    entries = [
+        RelatedPost(post_id=post_id, related_id=int(ids[i]), rank=rank, score=float(sims[i]))
+        for rank, i in enumerate(i for i in best.tolist() if sims[i] > 0)
+    ]
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id=post_id).delete()
+        RelatedPost.objects.bulk_create(entries)
+
+
+def update_post_safely(post_id):
+    try:
+        update_post(post_id)
+    except Exception:
+        logger.exception('Failed to refresh related posts for post %s', post_id)
+
+
+def _related_queries(post, limit):
+    # Related posts are shown as links and thumbnails, never with their body
+    precomputed = (
+        BlogPost.objects.filter(recommended_in__post=post, status='published')
+        .defer('content').order_by('recommended_in__rank')[:limit]
+    )
+    fallback = None
+    if post.category_id is not None:
+        fallback = (
+            BlogPost.objects.filter(category_id=post.category_id, status='published')
+            .defer('content').exclude(id=post.id)[:limit]
+        )
+    return precomputed, fallback
+
+
+def related_posts_for(post, limit=3):
+    """Precomputed neighbours, falling back to the same category before the first build."""
+    precomputed, fallback = _related_queries(post, limit)
+    related = list(precomputed)
+    if related or fallback is None:
+        return related
+    return list(fallback)
+
+
+async def arelated_posts_for(post, limit=3):
+    """Async version of related_posts_for()."""
+    precomputed, fallback = _related_queries(post, limit)
+    related = [p async for p in precomputed]
+    if related or fallback is None:
+        return related
+    return [p async for p in fallback]
+
+
+def _precomputed_many_query(post_ids):
+    return (
+        RelatedPost.objects.filter(post_id__in=post_ids, related__status='published')
+        .select_related('related').defer('related__content').order_by('post_id', 'rank')
+    )
+
+
+def _fallback_many_query(category_ids, limit):
+    # The newest limit + 1 posts of each category: enough to still have
+    # `limit` after leaving out the post itself
+    newest = Window(RowNumber(), partition_by=F('category_id'), order_by=F('created_at').desc())
+    return (
+        BlogPost.objects.filter(category_id__in=category_ids, status='published')
+        .defer('content').annotate(category_rank=newest).filter(category_rank__lte=limit + 1)
+    )
+
+
+def _group_precomputed(rows, limit):
+    related = {}
+    for row in rows:
+        neighbours = related.setdefault(row.post_id, [])
+        if len(neighbours) < limit:
+            neighbours.append(row.related)
+    return related
+
+
+def _needing_fallback(posts, related):
+    return [post for post in posts if post.id not in related and post.category_id is not None]
+
+
+def _add_fallback(related, posts, candidates, limit):
+    by_category = {}
+    for candidate in sorted(candidates, key=lambda p: p.created_at, reverse=True):
+        by_category.setdefault(candidate.category_id, []).append(candidate)
+    for post in posts:
+        related[post.id] = [p for p in by_category.get(post.category_id, []) if p.id != post.id][:limit]
+    return related
+
+
+def related_posts_for_many(posts, limit=3):
+    """
+    related_posts_for() for several posts in at most two queries. Returns a
+    dict of post id -> list of related posts.
+    """
+    related = _group_precomputed(_precomputed_many_query([post.id for post in posts]), limit)
+    fallback = _needing_fallback(posts, related)
+    if fallback:
+        candidates = _fallback_many_query({post.category_id for post in fallback}, limit)
+        _add_fallback(related, fallback, list(candidates), limit)
+    return related
+
+
+async def arelated_posts_for_many(posts, limit=3):
+    """Async version of related_posts_for_many()."""
+    rows = [row async for row in _precomputed_many_query([post.id for post in posts])]
+    related = _group_precomputed(rows, limit)
+    fallback = _needing_fallback(posts, related)
+    if fallback:
+        candidates = _fallback_many_query({post.category_id for post in fallback}, limit)
+        _add_fallback(related, fallback, [p async for p in candidates], limit)
+    return related
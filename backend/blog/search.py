@@ -0,0 +1,184 @@
+import re
+
+from django.db import connection, connections, router
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import BlogPost
+
+# SQLite FTS5 index over BlogPost. rowid is the BlogPost id so results can be
+# mapped straight back onto the ORM.
+FTS_TABLE = 'blog_blogpost_fts'
+
+# bm25() column weights for (title, excerpt, content)
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Control characters used as highlight markers inside snippet() so the text
+# can be HTML-escaped before the markers are swapped for <mark> tags.
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# (alias, database name) -> whether the index exists, so saves and searches
+# skip the introspection query; create_index() and drop_index() reset it.
+_available = {}
+
+
+def create_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, excerpt, content, "
+            "tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+    _available.clear()
+
+
+def drop_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _available.clear()
+
+
+def is_available(conn=connection):
+    if conn.vendor != 'sqlite':
+        return False
+    key = (conn.alias, conn.settings_dict['NAME'])
+    if key not in _available:
+        _available[key] = FTS_TABLE in conn.introspection.table_names()
+    return _available[key]
+
+
+def _write_connection(using=None):
+    # Signals pass the database the post was saved to
+    if using is None:
+        using = router.db_for_write(BlogPost)
+    return connections[using]
+
+
+def index_post(post, using=None):
+    conn = _write_connection(using)
+    if not is_available(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, excerpt, content) VALUES (%s, %s, %s, %s)",
+            [post.pk, post.title, post.excerpt, post.content],
+        )
+
+
+def index_posts(post_ids, batch_size=500, using=None):
+    """Index freshly inserted posts straight from blog_blogpost, in batches."""
+    post_ids = list(post_ids)
+    conn = _write_connection(using)
+    if not post_ids or not is_available(conn):
+        return
+    with conn.cursor() as cursor:
+        for start in range(0, len(post_ids), batch_size):
+            batch = post_ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, excerpt, content) "
+                f"SELECT id, title, excerpt, content FROM blog_blogpost WHERE id IN ({placeholders})",
+                batch,
+            )
+
+
+def unindex_post(post_id, using=None):
+    conn = _write_connection(using)
+    if not is_available(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+
+def rebuild_index(conn=connection):
+    """Drop every indexed row and re-read all posts from blog_blogpost."""
+    create_index(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, excerpt, content) "
+            "SELECT id, title, excerpt, content FROM blog_blogpost"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def build_match_expression(query):
+    """
+    Turn free text from the search box into a safe FTS5 MATCH expression.
+    Every word is quoted so FTS operators typed by users are treated as text,
+    and the last word is a prefix match to support search-as-you-type.
+    """
+    tokens = _TOKEN_RE.findall(query or '')
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(text):
+    return mark_safe(
+        escape(text)
+        .replace(_HIGHLIGHT_START, '<mark>')
+        .replace(_HIGHLIGHT_END, '</mark>')
+    )
+
+
+def search_posts(queryset, query):
+    """
+    Filter a BlogPost queryset down to the posts matching a search query,
+    best match first.
+
+    The queryset is joined with the FTS index, so its other filters, counts
+    and pages all run in the same SQL query, driven by the index: SQLite
+    reads the matching rowids once and looks each post up by primary key.
+    Every post carries its bm25 `search_rank` and the raw text of its snippet, which snippet() turns
+    into highlighted HTML. Falls back to the old icontains scan, with no
+    ranking or snippets, when the FTS index is not available on the database
+    the queryset reads from, which the returned queryset sticks to.
+    """
+    # The router may pick any replica; check and query the same one
+    queryset = queryset.using(queryset.db)
+    if not is_available(connections[queryset.db]):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query) |
+            Q(excerpt__icontains=query)
+        )
+
+    match = build_match_expression(query)
+    if not match:
+        return queryset.none()
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    return queryset.extra(
+        select={
+            'search_rank': f'bm25({FTS_TABLE}, {weights})',
+            'search_snippet_text': f"snippet({FTS_TABLE}, -1, %s, %s, '...', 24)",
+        },
+        select_params=[_HIGHLIGHT_START, _HIGHLIGHT_END],
+        tables=[FTS_TABLE],
+        # The unary + keeps SQLite from probing the index by rowid for every
+        # post, which re-runs the MATCH per row (COUNT(*) would otherwise
+        # plan it that way)
+        where=[f'+{FTS_TABLE}.rowid = {queryset.model._meta.db_table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    ).order_by('search_rank', 'id')
+
+
+def snippet(post):
+    """Highlighted HTML snippet of a post from search_posts(), or None."""
+    text = getattr(post, 'search_snippet_text', None)
+    return _highlight(text) if text is not None else None
+
+
+def attach_snippets(posts):
+    for post in posts:
+        post.search_snippet = snippet(post)
@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from backend import metrics
+
+from . import api_cache, images, related, search
+from .models import BlogPost, Category, Comment, Like
+
+
+@receiver(post_save, sender=BlogPost)
+def update_search_index(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    search.index_post(instance, using=using)
+
+
+@receiver(post_delete, sender=BlogPost)
+def remove_from_search_index(sender, instance, using=None, **kwargs):
+    search.unindex_post(instance.pk, using=using)
+
+
+def _adjust_category_counts(counted_as, delta):
+    category_id, status = counted_as
+    if category_id is None:
+        return
+    published_delta = delta if status == 'published' else 0
+    Category.objects.filter(id=category_id).update(
+        total_post_count=Greatest(F('total_post_count') + delta, Value(0)),
+        published_post_count=Greatest(F('published_post_count') + published_delta, Value(0)),
+    )
+
+
+@receiver(pre_save, sender=BlogPost)
+def remember_counted_state(sender, instance, raw=False, **kwargs):
+    # Instances built by hand or loaded with deferred fields don't know what
+    # the counters were computed from; look it up before the row changes.
+    if raw or instance.pk is None or hasattr(instance, '_counted_as'):
+        return
+    instance._counted_as = (
+        BlogPost.objects.filter(pk=instance.pk).values_list('category_id', 'status').first()
+    )
+
+
+@receiver(post_save, sender=BlogPost)
+def update_category_counts(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, '_counted_as', None)
+    new = (instance.category_id, instance.status)
+    if old != new:
+        if old is not None:
+            _adjust_category_counts(old, -1)
+        _adjust_category_counts(new, 1)
+    instance._counted_as = new
+
+
+@receiver(post_delete, sender=BlogPost)
+def release_category_counts(sender, instance, **kwargs):
+    counted_as = getattr(instance, '_counted_as', (instance.category_id, instance.status))
+    _adjust_category_counts(counted_as, -1)
+
+
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_api_cache(sender, **kwargs):
+    api_cache.bump_generation()
+
+
+def _bump_counters_generation():
+    api_cache.bump_generation(api_cache.COUNTERS_KEY)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def bump_counters_for_like(sender, raw=False, **kwargs):
+    # like_count is updated after the Like row, in the same transaction
+    if not raw:
+        transaction.on_commit(_bump_counters_generation)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_api_cache_for_comment(sender, instance, created=False, **kwargs):
+    # New comments start out pending and are invisible to the API; any other
+    # change may approve, reject or remove a visible comment.
+    if created and instance.status != 'approved':
+        return
+    api_cache.bump_generation()
+
+
+@receiver(post_save, sender=BlogPost)
+def refresh_related_posts(sender, instance, raw=False, **kwargs):
+    if raw or instance.status != 'published':
+        return
+    if not getattr(settings, 'BLOG_RELATED_POSTS_INCREMENTAL', True):
+        return
+    post_id = instance.pk
+    transaction.on_commit(lambda: related.update_post_safely(post_id))
+
+
+@receiver(post_save, sender=BlogPost)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or not images.needs_variants(instance):
+        return
+    post_id = instance.pk
+    transaction.on_commit(lambda: images.schedule(post_id))
+
+
+@receiver(post_save, sender=Like)
+def count_like(sender, created, raw=False, **kwargs):
+    if created and not raw:
+        metrics.LIKES.inc('like')
+
+
+@receiver(post_delete, sender=Like)
+def count_unlike(sender, **kwargs):
+    metrics.LIKES.inc('unlike')
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, created, raw=False, **kwargs):
+    if created and not raw:
+        metrics.COMMENTS.inc()
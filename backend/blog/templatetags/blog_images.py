@@ -0,0 +1,23 @@
+from django import template
+
+from blog import images
+
+register = template.Library()
+
+
+@register.inclusion_tag('blog/includes/responsive_image.html')
+def responsive_image(post, variant='card', sizes='100vw', css_class='', style='', loading='lazy'):
+    """
+    Render a post's featured image as a <picture> with WebP and JPEG srcsets,
+    using the `variant` size as the fallback src.
+    """
+    image = images.for_post(post)
+    return {
+        'image': image,
+        'src': image.src(variant) if image else '',
+        'alt': post.title,
+        'sizes': sizes,
+        'css_class': css_class,
+        'style': style,
+        'loading': loading,
+    }
@@ -1,3 +1,1643 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from types import ModuleType
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from backend import instrumentation, metrics, profiling
+from backend.db_router import PIN_COOKIE, PrimaryReplicaRouter, replica_reads
+from backend.instrumentation import budget
+from benchmarks import loadtest
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, models, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import JsonResponse
+from django.urls import include, path, reverse
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+
+from . import api_cache, async_views, checks, fixture_generator, images, importer, query_plans, related, search, views
+from .assemblers import PostDetailAssembler
+from .models import BlogPost, BlogPostAttachment, Category, Comment, Like, RelatedPost
+from .view_counter import ViewCounter, view_counter
+from .viewed_posts import COOKIE_NAME, ViewedPosts
+from .write_queue import WriteQueue, write_queue
+
+User = get_user_model()
+
+
+class BlogTestMixin:
+    def create_user(self, username='author', **kwargs):
+        return User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password='password123',
+            **kwargs
+        )
+
+    def create_post(self, title, content='Some content', **kwargs):
+        kwargs.setdefault('author', self.author)
+        kwargs.setdefault('status', 'published')
+        return BlogPost.objects.create(title=title, content=content, **kwargs)
+
+
+class SearchTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.category = Category.objects.create(name='Travel')
+
+    def matches(self, query):
+        posts = search.search_posts(BlogPost.objects.filter(status='published'), query)
+        return [(post.id, search.snippet(post)) for post in posts]
+
+    def test_index_follows_saves_and_deletes(self):
+        post = self.create_post('Mountain trip', 'We climbed a glacier.')
+        self.assertEqual(self.matches('glacier'), [(post.id, 'We climbed a <mark>glacier</mark>.')])
+
+        post.content = post.excerpt = 'We sailed across a lake.'
+        post.save()
+        self.assertEqual(self.matches('glacier'), [])
+        self.assertEqual(self.matches('lake'), [(post.id, 'We sailed across a <mark>lake</mark>.')])
+
+        post.delete()
+        self.assertEqual(self.matches('lake'), [])
+
+    def test_title_matches_rank_above_body_matches(self):
+        body_only = self.create_post('Notes', 'A short remark about python.')
+        in_title = self.create_post('Python tips', 'General advice.')
+        self.create_post('Python draft', 'Python', status='draft')
+        self.assertEqual([pid for pid, _ in self.matches('python')], [in_title.id, body_only.id])
+
+    def test_snippets_are_highlighted_and_escaped(self):
+        self.create_post('Markup', '<script>alert(1)</script> teapot brewing guide')
+        post = search.search_posts(BlogPost.objects.all(), 'teapot').get()
+        snippet = search.snippet(post)
+        self.assertIn('<mark>teapot</mark>', snippet)
+        self.assertNotIn('<script>', snippet)
+
+    def test_operators_in_query_are_treated_as_text(self):
+        self.assertEqual(search.build_match_expression('cats OR "dogs'), '"cats" "OR" "dogs"*')
+        self.assertEqual(search.build_match_expression('  ?! '), '')
+
+    def test_api_search_returns_snippets(self):
+        self.create_post('Garden diary', 'Tomatoes ripened early this year.', category=self.category)
+        self.create_post('Draft tomatoes', 'Tomatoes', status='draft')
+        response = self.client.get(reverse('blog:api-posts-list'), {'search': 'tomato'})
+        posts = response.json()['posts']
+        self.assertEqual([p['title'] for p in posts], ['Garden diary'])
+        self.assertIn('<mark>', posts[0]['snippet'])
+
+    def test_list_view_shows_highlighted_snippet(self):
+        self.create_post('Bread', 'Sourdough needs a lively starter.')
+        response = self.client.get(reverse('blog:post_list'), {'search': 'sourdough'})
+        self.assertContains(response, '<mark>Sourdough</mark>', html=False)
+
+    def test_filters_and_pages_apply_to_all_matches(self):
+        niche = Category.objects.create(name='Niche')
+        for i in range(12):
+            self.create_post(f'Python {i}', 'Python everywhere.', category=self.category)
+        self.create_post('Python draft', 'Python', status='draft', category=niche)
+        wanted = [self.create_post(f'Python niche {i}', 'Snakes.', category=niche) for i in range(2)]
+        url = reverse('blog:api-posts-list')
+
+        data = self.client.get(url, {'search': 'python', 'category': niche.slug}).json()
+        self.assertEqual(sorted(p['title'] for p in data['posts']), sorted(p.title for p in wanted))
+        data = self.client.get(url, {'search': 'python', 'per_page': 5, 'page': 3}).json()
+        self.assertEqual((data['total_pages'], len(data['posts'])), (3, 4))
+
+    def test_availability_is_checked_once(self):
+        search.is_available()
+        post = self.create_post('Cached', 'No introspection.')
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+            search.search_posts(BlogPost.objects.all(), 'cached').count()
+        self.assertFalse([q for q in queries.captured_queries if 'sqlite_master' in q['sql']])
+
+    def test_rebuild_command_restores_missing_rows(self):
+        post = self.create_post('Lost entry', 'Forgotten words')
+        search.unindex_post(post.id)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.matches('forgotten'), [(post.id, '<mark>Forgotten</mark> words')])
+
+
+class CursorPaginationTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.posts = [self.create_post(f'Post {i}') for i in range(5)]
+        # Two posts sharing a timestamp must still page deterministically by id
+        BlogPost.objects.filter(id__in=[self.posts[1].id, self.posts[2].id]).update(
+            created_at=self.posts[1].created_at
+        )
+
+    def fetch(self, **params):
+        response = self.client.get(reverse('blog:api-posts-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walks_every_post_once_without_totals(self):
+        seen = []
+        data = self.fetch(cursor='', per_page=2)
+        while True:
+            self.assertNotIn('total_pages', data)
+            seen.extend(p['id'] for p in data['posts'])
+            if not data['next_cursor']:
+                break
+            data = self.fetch(cursor=data['next_cursor'], per_page=2)
+        self.assertEqual(sorted(seen), sorted(p.id for p in self.posts))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_offset_mode_is_unchanged(self):
+        data = self.fetch(page=2, per_page=2)
+        self.assertEqual(data['total_pages'], 3)
+        self.assertEqual(data['current_page'], 2)
+
+    def test_rejects_tampered_cursor(self):
+        response = self.client.get(reverse('blog:api-posts-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        huge_id = base64.urlsafe_b64encode(json.dumps(['2024-01-01T00:00:00', 10 ** 30]).encode()).decode()
+        response = self.client.get(reverse('blog:api-posts-list'), {'cursor': huge_id})
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    def test_rejects_cursor_with_search(self):
+        response = self.client.get(reverse('blog:api-posts-list'), {'cursor': '', 'search': 'post'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not available with search', response.json()['error'])
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, BLOG_VIEW_COUNT_BATCH_SIZE=10)
+class ViewCounterTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.post = self.create_post('Counted')
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def test_detail_view_buffers_until_flush(self):
+        self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.client.get(reverse('blog:api-post-detail', args=[self.post.slug]))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 0)
+        self.assertEqual(view_counter.pending(self.post.id), 1)
+
+        view_counter.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 1)
+
+    def test_flushes_in_one_query_when_batch_is_full(self):
+        counter = ViewCounter()
+        other = self.create_post('Other')
+        for _ in range(4):
+            counter.increment(self.post.id)
+        with self.assertNumQueries(1):
+            for _ in range(6):
+                counter.increment(other.id)
+        self.assertEqual(counter.pending(), 0)
+        self.assertEqual(BlogPost.objects.get(id=self.post.id).view_count, 4)
+        self.assertEqual(BlogPost.objects.get(id=other.id).view_count, 6)
+
+
+class ViewedPostsTests(BlogTestMixin, TestCase):
+    def test_remembers_posts_for_one_to_two_windows(self):
+        viewed = ViewedPosts(window=100, now=1000)
+        viewed.add(7)
+        self.assertIn(7, viewed)
+        self.assertNotIn(8, viewed)
+
+        later = ViewedPosts(window=100, now=1150)
+        later.load(viewed.dumps())
+        self.assertIn(7, later)
+        expired = ViewedPosts(window=100, now=1250)
+        expired.load(later.dumps())
+        self.assertNotIn(7, expired)
+
+    def test_cookie_size_is_bounded(self):
+        viewed = ViewedPosts()
+        for post_id in range(5000):
+            viewed.add(post_id)
+        # Two 256-byte filters, base64-encoded, whatever the number of posts
+        self.assertLess(len(viewed.dumps()), 800)
+        # Unreadable cookies start an empty filter
+        restored = ViewedPosts()
+        restored.load('1:not-base64!')
+        self.assertNotIn(1, restored)
+
+    @override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+    def test_views_count_once_without_touching_the_session(self):
+        self.author = self.create_user()
+        post = self.create_post('Once')
+        for name in ('blog:post_detail', 'blog:api-post-detail', 'blog:post_detail'):
+            response = self.client.get(reverse(name, args=[post.slug]))
+        self.assertIn(COOKIE_NAME, self.client.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        view_counter.flush()
+        post.refresh_from_db()
+        self.assertEqual(post.view_count, 1)
+        self.assertNotIn(COOKIE_NAME, response.cookies)
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0.01, BLOG_VIEW_COUNT_BATCH_SIZE=7)
+class ConcurrentViewCounterTests(BlogTestMixin, TransactionTestCase):
+    WORKERS = 3
+    THREADS_PER_WORKER = 4
+    VIEWS_PER_THREAD = 200
+
+    def test_no_increments_lost_across_workers(self):
+        self.author = self.create_user()
+        posts = [self.create_post(f'Hot {i}') for i in range(3)]
+        # One ViewCounter per simulated worker process, each with its own
+        # timer thread racing the size-triggered flushes of request threads.
+        counters = [ViewCounter() for _ in range(self.WORKERS)]
+        self.addCleanup(write_queue.stop)
+        errors = []
+
+        def handle_requests(counter, offset):
+            try:
+                for i in range(self.VIEWS_PER_THREAD):
+                    counter.increment(posts[(i + offset) % len(posts)].id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=handle_requests, args=(counter, t))
+            for counter in counters
+            for t in range(self.THREADS_PER_WORKER)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for counter in counters:
+            counter.stop()
+            counter.flush()
+
+        self.assertEqual(errors, [])
+        total = sum(BlogPost.objects.filter(id__in=[p.id for p in posts]).values_list('view_count', flat=True))
+        self.assertEqual(total, self.WORKERS * self.THREADS_PER_WORKER * self.VIEWS_PER_THREAD)
+
+
+class WriteQueueTests(BlogTestMixin, TransactionTestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.post = self.create_post('Queued')
+        self.queue = WriteQueue()
+        self.addCleanup(self.queue.stop)
+
+    def block_writer(self):
+        """
+        Hold the writer thread, outside any transaction, until the returned
+        event is set. self.batches records the size of every batch written.
+        """
+        started, release = threading.Event(), threading.Event()
+        write_batch = self.queue._write_batch
+        self.batches = []
+
+        def gated(batch):
+            started.set()
+            release.wait(5)
+            self.batches.append(len(batch))
+            write_batch(batch)
+
+        self.addCleanup(release.set)
+        self.queue._write_batch = gated
+        self.queue.submit(lambda: None)
+        started.wait(5)
+        return release
+
+    def test_queued_writes_commit_together(self):
+        release = self.block_writer()
+        futures = [
+            self.queue.submit(Comment.objects.create, post=self.post, author=self.author, content=f'#{i}')
+            for i in range(5)
+        ]
+        futures.append(self.queue.submit(Comment.objects.create, post=self.post, author=None, content='bad'))
+        release.set()
+        comments = [future.result(5) for future in futures[:5]]
+        with self.assertRaises(IntegrityError):
+            futures[5].result(5)
+        self.assertEqual(self.batches, [1, 6])
+        self.assertEqual([comment.content for comment in comments], [f'#{i}' for i in range(5)])
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 5)
+
+    def test_writes_inline_after_timeout(self):
+        release = self.block_writer()
+        writers = []
+        with override_settings(BLOG_WRITE_QUEUE_TIMEOUT=0.05):
+            self.queue.run(lambda: writers.append(threading.current_thread()))
+        release.set()
+        self.queue.stop()
+        # Written once, inline; the writer skips the cancelled write
+        self.assertEqual(writers, [threading.current_thread()])
+
+    def test_writes_inline_inside_a_transaction(self):
+        with transaction.atomic():
+            writer = self.queue.run(lambda: threading.current_thread())
+        self.assertIs(writer, threading.current_thread())
+
+    def test_like_and_comment_views(self):
+        self.addCleanup(write_queue.stop)
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('blog:toggle_like', args=[self.post.slug]), headers={'X-Requested-With': 'XMLHttpRequest'}
+        )
+        self.assertEqual(response.json()['liked'], True)
+        response = self.client.post(
+            reverse('blog:api-add-comment', args=[self.post.slug]),
+            json.dumps({'content': 'Hello'}), content_type='application/json',
+        )
+        self.assertEqual(response.json()['comment']['content'], 'Hello')
+        self.assertIsNotNone(write_queue._thread)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertTrue(Like.objects.filter(user=self.author, post=self.post).exists())
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, BLOG_API_CACHE_ENABLED=False)
+class PostDetailAssemblerTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.reader = self.create_user('reader')
+        self.post = self.create_post('Detailed', category=Category.objects.create(name='Misc'))
+        BlogPostAttachment.objects.create(post=self.post, file='blog/attachments/a.pdf', title='A')
+        Like.objects.create(user=self.reader, post=self.post)
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def add_comments(self, count):
+        for i in range(count):
+            top = Comment.objects.create(post=self.post, author=self.reader, content=f'c{i}', status='approved')
+            Comment.objects.create(post=self.post, author=self.author, parent=top, content=f'r{i}', status='approved')
+            Comment.objects.create(post=self.post, author=self.author, parent=top, content=f'p{i}', status='pending')
+
+    def test_query_count_does_not_grow_with_comments(self):
+        self.add_comments(1)
+        with self.assertNumQueries(4):
+            PostDetailAssembler(self.post.slug, user=self.reader).assemble()
+
+        self.add_comments(20)
+        with self.assertNumQueries(4):
+            detail = PostDetailAssembler(self.post.slug, user=self.reader).assemble()
+            data = detail.to_dict()
+
+        self.assertEqual(len(data['comments']), 21)
+        self.assertTrue(all(len(c['replies']) == 1 for c in data['comments']))
+        self.assertTrue(data['is_liked'])
+        self.assertEqual(len(data['attachments']), 1)
+
+    def test_anonymous_user_skips_like_query(self):
+        with self.assertNumQueries(3):
+            detail = PostDetailAssembler(self.post.slug).assemble()
+        self.assertFalse(detail.is_liked)
+
+    def test_views_use_a_fixed_number_of_queries(self):
+        self.client.force_login(self.reader)
+        self.add_comments(1)
+        # validators, session and user lookups, the assembler's four queries,
+        # and related posts (empty table, so also the same-category fallback)
+        for name in ('blog:post_detail', 'blog:api-post-detail'):
+            url = reverse(name, args=[self.post.slug])
+            self.client.get(url)
+            with self.assertNumQueries(9):
+                self.client.get(url)
+            self.add_comments(15)
+            with self.assertNumQueries(9):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+
+class CategoryPostCountTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.travel = Category.objects.create(name='Travel')
+        self.food = Category.objects.create(name='Food')
+
+    def assertCounts(self, category, published, total):
+        category.refresh_from_db()
+        self.assertEqual(
+            (category.published_post_count, category.total_post_count),
+            (published, total),
+        )
+
+    def test_counts_follow_post_lifecycle(self):
+        post = self.create_post('Trip', category=self.travel, status='draft')
+        self.assertCounts(self.travel, 0, 1)
+
+        post.status = 'published'
+        post.save()
+        self.assertCounts(self.travel, 1, 1)
+
+        post = BlogPost.objects.get(pk=post.pk)
+        post.category = self.food
+        post.save()
+        self.assertCounts(self.travel, 0, 0)
+        self.assertCounts(self.food, 1, 1)
+
+        BlogPost.objects.get(pk=post.pk).delete()
+        self.assertCounts(self.food, 0, 0)
+
+    def test_save_of_unloaded_instance_uses_stored_state(self):
+        post = self.create_post('Recipe', category=self.food)
+        stale = BlogPost(pk=post.pk, title=post.title, slug=post.slug, content=post.content,
+                         author=self.author, category=self.travel, status='draft',
+                         created_at=post.created_at)
+        stale.save()
+        self.assertCounts(self.food, 0, 0)
+        self.assertCounts(self.travel, 0, 1)
+
+    def test_recount_command_repairs_drift(self):
+        self.create_post('Trip', category=self.travel)
+        Category.objects.update(published_post_count=7, total_post_count=9)
+        call_command('recount_categories', stdout=StringIO())
+        self.assertCounts(self.travel, 1, 1)
+        self.assertCounts(self.food, 0, 0)
+
+    def test_categories_api_reads_stored_counts(self):
+        self.create_post('Trip', category=self.travel)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('blog:api-categories-list'))
+        counts = {c['slug']: c['post_count'] for c in response.json()['categories']}
+        self.assertEqual(counts, {'travel': 1, 'food': 0})
+
+    def test_sidebar_counts_only_published_posts(self):
+        self.create_post('Trip', category=self.travel)
+        self.create_post('Draft trip', category=self.travel, status='draft')
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertContains(response, '<span class="badge bg-secondary">1</span>', html=True)
+        self.assertNotContains(response, '<span class="badge bg-secondary">2</span>', html=True)
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class ApiCacheTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        api_cache.get_cache().clear()
+        api_cache.stats.reset()
+        self.author = self.create_user()
+        self.category = Category.objects.create(name='News')
+        self.post = self.create_post('Headline', category=self.category)
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def test_repeat_requests_are_served_from_cache(self):
+        url = reverse('blog:api-posts-list')
+        first = self.client.get(url, {'per_page': 5, 'page': 1})
+        # Only the ETag's aggregate and the page's counters are queried
+        with self.assertNumQueries(2):
+            # Same query in a different parameter order
+            second = self.client.get(url, {'page': 1, 'per_page': 5})
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(api_cache.stats.snapshot()['hits'], 1)
+        self.assertEqual(api_cache.stats.snapshot()['misses'], 1)
+
+    def test_post_change_invalidates(self):
+        url = reverse('blog:api-post-detail', args=[self.post.slug])
+        self.client.get(url)
+        self.post.title = 'Updated headline'
+        self.post.save()
+        self.assertEqual(self.client.get(url).json()['title'], 'Updated headline')
+
+    def test_comment_approval_invalidates(self):
+        url = reverse('blog:api-post-detail', args=[self.post.slug])
+        comment = Comment.objects.create(post=self.post, author=self.author, content='Hi')
+        self.assertEqual(self.client.get(url).json()['comments'], [])
+        comment.status = 'approved'
+        comment.save(update_fields=['status'])
+        self.assertEqual(len(self.client.get(url).json()['comments']), 1)
+
+    def test_category_change_invalidates(self):
+        url = reverse('blog:api-categories-list')
+        self.client.get(url)
+        Category.objects.create(name='Sports')
+        self.assertEqual(len(self.client.get(url).json()['categories']), 2)
+
+    def test_likes_and_view_counts_are_current_without_invalidating(self):
+        fan = self.create_user('fan')
+        self.client.force_login(fan)
+        detail = reverse('blog:api-post-detail', args=[self.post.slug])
+        listing = reverse('blog:api-posts-list')
+        batch = reverse('blog:api-posts-batch') + f'?slugs={self.post.slug}'
+        self.client.get(detail)
+        self.client.get(listing)
+        self.client.get(batch)
+        generation = api_cache.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('blog:toggle_like', args=[self.post.slug]))
+        data = self.client.get(detail).json()
+        self.assertEqual((data['like_count'], data['is_liked']), (1, True))
+        self.assertEqual(self.client.get(listing).json()['posts'][0]['like_count'], 1)
+        self.assertEqual(self.client.get(batch).json()['posts'][self.post.slug]['like_count'], 1)
+
+        # The detail views are still buffered
+        self.assertEqual(self.client.get(listing).json()['posts'][0]['view_count'], 0)
+        view_counter.flush()
+        self.assertEqual(self.client.get(listing).json()['posts'][0]['view_count'], 1)
+        self.assertEqual(api_cache.get_generation(), generation)
+        self.assertEqual(api_cache.stats.snapshot()['misses'], 3)
+
+    def test_list_payloads_do_not_expose_post_ids(self):
+        data = self.client.get(reverse('blog:api-posts-list'), {'fields': 'title'}).json()
+        self.assertNotIn('post_ids', data)
+        self.assertEqual(data['posts'], [{'title': 'Headline'}])
+
+    def test_cached_detail_of_an_unpublished_post_is_not_found(self):
+        url = reverse('blog:api-post-detail', args=[self.post.slug])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with override_settings(ROOT_URLCONF=async_api_urls):
+            self.assertEqual(async_to_sync(self.async_client.get)(url).status_code, 200)
+        # Unpublished without signals, as seen by a process whose cache was
+        # not invalidated
+        BlogPost.objects.filter(id=self.post.id).update(status='draft')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with override_settings(ROOT_URLCONF=async_api_urls):
+            self.assertEqual(async_to_sync(self.async_client.get)(url).status_code, 404)
+
+    def test_cached_bodies_follow_the_validators_of_their_etags(self):
+        detail = reverse('blog:api-post-detail', args=[self.post.slug])
+        listing = reverse('blog:api-posts-list')
+        self.client.get(detail)
+        self.client.get(listing)
+        # Edited by another process: this one's generation is unchanged
+        BlogPost.objects.filter(id=self.post.id).update(title='Edited elsewhere', updated_at=timezone.now())
+        self.assertEqual(self.client.get(detail).json()['title'], 'Edited elsewhere')
+        self.assertEqual(self.client.get(listing).json()['posts'][0]['title'], 'Edited elsewhere')
+
+    @override_settings(BLOG_API_CACHE_ALIAS='blog_api')
+    def test_deploy_check_warns_about_per_process_cache(self):
+        local = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/api'}
+        with override_settings(CACHES={'default': local, 'blog_api': local}):
+            self.assertEqual([w.id for w in checks.check_api_cache_is_shared(None)], ['blog.W001'])
+        with override_settings(CACHES={'default': local, 'blog_api': shared}):
+            self.assertEqual(checks.check_api_cache_is_shared(None), [])
+
+    def test_is_liked_is_not_shared_between_users(self):
+        fan = self.create_user('fan')
+        Like.objects.create(user=fan, post=self.post)
+        url = reverse('blog:api-post-detail', args=[self.post.slug])
+        self.client.force_login(fan)
+        self.assertTrue(self.client.get(url).json()['is_liked'])
+        self.client.logout()
+        self.assertFalse(self.client.get(url).json()['is_liked'])
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class ConditionalGetTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.post = self.create_post('Cached page')
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_detail_returns_304_until_a_comment_is_approved(self):
+        for name in ('blog:post_detail', 'blog:api-post-detail'):
+            url = reverse(name, args=[self.post.slug])
+            first = self.client.get(url)
+            self.assertTrue(first.has_header('Last-Modified'))
+            # Only the validator query: no rendering, and counting the view
+            # gave this anonymous client a cookie rather than a session
+            with self.assertNumQueries(1):
+                self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        url = reverse('blog:api-post-detail', args=[self.post.slug])
+        first = self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.author, content='Yes', status='approved')
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_detail_etag_differs_per_user(self):
+        url = reverse('blog:post_detail', args=[self.post.slug])
+        anonymous = self.client.get(url)
+        self.client.force_login(self.author)
+        self.assertEqual(self.revalidate(url, anonymous).status_code, 200)
+
+    def test_list_changes_when_filtered_set_changes(self):
+        url = reverse('blog:api-posts-list')
+        first = self.client.get(url, {'per_page': 5})
+        self.assertEqual(self.revalidate(url, first, per_page=5).status_code, 304)
+        self.assertEqual(self.revalidate(url, first, per_page=6).status_code, 200)
+
+        self.create_post('Another one')
+        self.assertEqual(self.revalidate(url, first, per_page=5).status_code, 200)
+
+        latest = self.client.get(url, {'per_page': 5})
+        BlogPost.objects.get(title='Another one').delete()
+        self.assertEqual(self.revalidate(url, latest, per_page=5).status_code, 200)
+
+    def test_list_changes_when_counters_change(self):
+        url = reverse('blog:api-posts-list')
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            views._toggle_like(self.author, self.post.id)
+        liked = self.revalidate(url, first)
+        self.assertEqual(liked.status_code, 200)
+        view_counter.increment(self.post.id)
+        view_counter.flush()
+        self.assertEqual(self.revalidate(url, liked).status_code, 200)
+
+    def test_list_etag_follows_writes_of_other_processes(self):
+        url = reverse('blog:api-posts-list')
+        first = self.client.get(url)
+        generation = api_cache.get_generation()
+        self.create_post('Written elsewhere')
+        # Another process wrote, and bumped only its own cache's generation
+        api_cache.get_cache().set(api_cache.GENERATION_KEY, generation, timeout=None)
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_search_is_filtered_once(self):
+        self.create_post('Search me', 'Findable words')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:api-posts-list'), {'search': 'findable'})
+        fts = [q['sql'] for q in queries.captured_queries if search.FTS_TABLE in q['sql']]
+        self.assertEqual(len(response.json()['posts']), 1)
+        # The paginator's count and the page. The ETag's aggregate covers all
+        # published posts, so it runs no search of its own.
+        self.assertEqual(len(fts), 2)
+        self.assertIn('COUNT(*)', fts[0])
+        self.assertIn('search_rank', fts[1])
+
+
+class RelatedPostsTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        settings = override_settings(BLOG_RELATED_POSTS_INDEX_DIR=index_dir, BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(view_counter.flush)
+
+        self.author = self.create_user()
+        self.bread = self.create_post('Baking sourdough bread', 'Flour, water, salt and a sourdough starter.')
+        self.pizza = self.create_post('Pizza dough', 'Flour and water dough, proofed like bread.')
+        self.engine = self.create_post('Engine maintenance', 'Change the oil and check the spark plugs.')
+        self.draft = self.create_post('Draft bread', 'Flour water bread sourdough', status='draft')
+
+    def test_build_stores_most_similar_posts_first(self):
+        self.assertEqual(related.build(top_k=2), 3)
+        self.assertEqual(related.related_posts_for(self.bread)[0], self.pizza)
+        self.assertFalse(RelatedPost.objects.filter(related=self.draft).exists())
+        self.assertFalse(RelatedPost.objects.filter(post=self.engine, related=self.bread).exists())
+
+    def test_neighbours_do_not_depend_on_the_memory_budget(self):
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((50, 8)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        # One row per block, then every row in one block
+        indices, scores = related.top_k_neighbours(matrix, 3, memory_budget=1)
+        expected = np.argsort(-(matrix @ matrix.T - 2 * np.eye(50)), axis=1)[:, :3]
+        np.testing.assert_array_equal(indices, expected)
+        for budget in (50 * 12 * 7, 50 * 12 * 50):
+            np.testing.assert_array_equal(related.top_k_neighbours(matrix, 3, memory_budget=budget)[0], indices)
+        self.assertTrue(np.all(scores[:, :-1] >= scores[:, 1:]))
+
+    def test_saved_post_is_matched_against_last_build(self):
+        related.build(top_k=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            focaccia = self.create_post('Focaccia', 'Bread dough with flour, water and olive oil.')
+        self.assertIn(self.bread, related.related_posts_for(focaccia))
+
+    def test_falls_back_to_category_before_first_build(self):
+        category = Category.objects.create(name='Food')
+        BlogPost.objects.filter(id__in=[self.bread.id, self.pizza.id]).update(category=category)
+        self.bread.refresh_from_db()
+        self.assertEqual(related.related_posts_for(self.bread), [self.pizza])
+
+    def test_detail_api_includes_related_posts(self):
+        related.build(top_k=2)
+        response = self.client.get(reverse('blog:api-post-detail', args=[self.bread.slug]))
+        self.assertEqual(response.json()['related_posts'][0]['slug'], self.pizza.slug)
+
+
+class ExportTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.client.force_login(self.create_user('editor', is_staff=True))
+        self.first = self.create_post('First export')
+        self.second = self.create_post('Second export')
+        self.create_post('Hidden draft', status='draft')
+
+    def read_lines(self, response):
+        body = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return [json.loads(line) for line in body.decode().splitlines()]
+
+    def test_streams_published_posts_as_ndjson(self):
+        response = self.client.get(reverse('blog:api-posts-export'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = self.read_lines(response)
+        self.assertEqual([r['title'] for r in rows], ['First export', 'Second export'])
+        self.assertEqual(rows[0]['author'], 'author')
+        self.assertIn('content', rows[0])
+
+    def test_since_returns_only_newer_updates(self):
+        self.first.title = 'First export, edited'
+        self.first.save()
+        response = self.client.get(reverse('blog:api-posts-export'), {
+            'since': self.second.updated_at.isoformat(),
+        })
+        self.assertEqual([r['id'] for r in self.read_lines(response)], [self.first.id])
+
+    def test_gzip_when_accepted(self):
+        response = self.client.get(reverse('blog:api-posts-export'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(self.read_lines(response)), 2)
+
+    def test_invalid_since(self):
+        response = self.client.get(reverse('blog:api-posts-export'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(BLOG_EXPORT_TOKEN='s3cret')
+    def test_requires_staff_or_token(self):
+        url = reverse('blog:api-posts-export')
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(len(self.read_lines(response)), 2)
+
+    def test_command_writes_gzipped_file(self):
+        fd, path = tempfile.mkstemp(suffix='.ndjson.gz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command('export_posts', output=path, gzip=True, stderr=StringIO())
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+
+class ImportTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.category = Category.objects.create(name='Travel')
+        self.create_post('Hello World')
+
+    def write_file(self, suffix, text):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_duplicate_titles_get_unique_slugs(self):
+        records = [{'title': 'Hello World', 'content': 'x'} for _ in range(3)]
+        records.append({'title': 'Hello World 2', 'content': 'x'})
+        post_importer = importer.PostImporter(batch_size=2, default_author='author').run(records)
+        self.assertEqual(post_importer.created, 4)
+        slugs = set(BlogPost.objects.values_list('slug', flat=True))
+        self.assertEqual(slugs, {
+            'hello-world', 'hello-world-2', 'hello-world-3', 'hello-world-4', 'hello-world-2-2',
+        })
+
+    def test_allocator_skips_slugs_taken_by_other_titles(self):
+        self.create_post('Hello World 2')
+        allocator = importer.SlugAllocator()
+        allocator.reserve(['hello-world'])
+        self.assertEqual(allocator.allocate('hello-world'), 'hello-world-3')
+
+    def test_timestamps_leave_field_definitions_alone(self):
+        flags = []
+        records = ({'title': f'Old {i}', 'content': 'x', 'created_at': '2019-05-01T10:00:00',
+                    'updated_at': '2020-01-01T00:00:00'} for i in range(3))
+
+        def progress(created, elapsed):
+            field = BlogPost._meta.get_field('updated_at')
+            flags.append((field.auto_now, BlogPost._meta.get_field('created_at').auto_now_add))
+
+        importer.PostImporter(batch_size=2, default_author='author', progress=progress).run(records)
+        self.assertEqual(flags, [(True, True)])
+        self.assertEqual(
+            {(p.created_at.year, p.updated_at.year) for p in BlogPost.objects.filter(title__startswith='Old')},
+            {(2019, 2020)},
+        )
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        post_importer = importer.PostImporter(default_author='author')
+        post_importer.slugs.reserve(['race'])
+        # Taken by another writer after the slugs were reserved
+        self.create_post('Race')
+        post_importer.run([
+            {'title': 'Race', 'content': 'x'},
+            {'title': 'Lost', 'content': 'x', 'category_slug': 'no-such-category'},
+        ])
+        self.assertEqual(post_importer.created, 1)
+        self.assertTrue(BlogPost.objects.filter(slug='race-2').exists())
+        self.assertEqual(post_importer.errors, [(2, "Unknown category slug 'no-such-category'")])
+
+    def test_values_of_the_wrong_type_reject_their_row(self):
+        post_importer = importer.PostImporter(default_author='author').run([
+            {'title': 123, 'content': 'x'},
+            {'title': 'Listed', 'content': 'x', 'author': ['x']},
+            {'title': 'Kept', 'content': 'x', 'is_featured': True},
+        ])
+        self.assertEqual(post_importer.created, 1)
+        self.assertTrue(BlogPost.objects.get(title='Kept').is_featured)
+        self.assertEqual(post_importer.errors, [
+            (1, 'title must be a string, not int'), (2, 'author must be a string, not list'),
+        ])
+
+    def test_json_array_import_updates_index_and_counts(self):
+        path = self.write_file('.json', json.dumps([
+            {'title': 'Lisbon trams', 'content': 'y' * 400, 'author': 'author',
+             'category': 'travel', 'status': 'published', 'created_at': '2019-05-01T10:00:00'},
+            {'title': '', 'content': 'no title'},
+            {'title': 'Porto', 'content': 'z', 'author': 'nobody'},
+        ]))
+        stderr = StringIO()
+        call_command('import_posts', path, stdout=StringIO(), stderr=stderr)
+        post = BlogPost.objects.get(title='Lisbon trams')
+        self.assertEqual(post.excerpt, 'y' * 297 + '...')
+        self.assertEqual(post.created_at.year, 2019)
+        self.assertIn('Record 2: Missing title', stderr.getvalue())
+        self.assertIn("Record 3: Unknown author 'nobody'", stderr.getvalue())
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.published_post_count, 1)
+        qs = search.search_posts(BlogPost.objects.all(), 'trams')
+        self.assertEqual(list(qs), [post])
+
+    def test_csv_and_ndjson_streams(self):
+        csv_path = self.write_file('.csv', 'title,content,category,is_featured\nCSV post,Body,Food,true\n')
+        call_command('import_posts', csv_path, default_author='author', create_categories=True,
+                     stdout=StringIO())
+        self.assertTrue(BlogPost.objects.get(title='CSV post', category__name='Food').is_featured)
+
+        lines = '\n'.join(json.dumps({'title': f'Line {i}', 'content': 'c' * 5000}) for i in range(30))
+        stream = StringIO(lines)
+        records = list(importer.iter_json_records(stream, buffer_size=1024))
+        self.assertEqual([r['title'] for r in records], [f'Line {i}' for i in range(30)])
+
+    def test_malformed_json_fails_without_reading_on(self):
+        good = json.dumps({'title': 'Fine', 'content': 'c'}) + '\n'
+        for text in (good + '{"title": oops}\n' + good * 1000, '[' + good + ', {"title": oops}\n' + good * 1000):
+            stream = StringIO(text)
+            records = importer.iter_json_records(stream, buffer_size=256)
+            self.assertEqual(next(records)['title'], 'Fine')
+            with self.assertRaisesMessage(ValueError, 'Invalid JSON'):
+                next(records)
+            self.assertLessEqual(stream.tell(), 512)
+
+
+@override_settings(BLOG_IMAGE_ASYNC=False)
+class ImageVariantTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = self.create_user()
+
+    def upload(self, name='photo.png', size=(2000, 1000)):
+        out = BytesIO()
+        Image.new('RGBA', size, (200, 40, 40, 128)).save(out, 'PNG')
+        return SimpleUploadedFile(name, out.getvalue(), content_type='image/png')
+
+    def create_post_with_image(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = self.create_post('Pictured', featured_image=self.upload(**kwargs))
+        post.refresh_from_db()
+        return post
+
+    def test_variants_are_generated_after_commit(self):
+        post = self.create_post_with_image()
+        variants = post.image_variants['variants']
+        self.assertEqual(post.image_variants['source'], post.featured_image.name)
+        self.assertEqual((variants['card']['width'], variants['card']['height']), (640, 320))
+        storage = post.featured_image.storage
+        with storage.open(variants['hero']['webp']) as f:
+            self.assertEqual(Image.open(f).format, 'WEBP')
+        with storage.open(variants['thumbnail']['jpeg']) as f:
+            self.assertEqual(Image.open(f).mode, 'RGB')
+
+    def test_small_images_are_not_upscaled(self):
+        post = self.create_post_with_image(size=(500, 300))
+        image = images.for_post(post)
+        widths = [candidate.split()[1] for candidate in image.srcset('webp').split(', ')]
+        self.assertEqual(widths, ['320w', '500w'])
+
+    def test_replacing_image_removes_old_variants(self):
+        post = self.create_post_with_image()
+        old_path = post.image_variants['variants']['card']['jpeg']
+        post.featured_image = self.upload('other.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        post.refresh_from_db()
+        self.assertIn('other', post.image_variants['source'])
+        self.assertFalse(post.featured_image.storage.exists(old_path))
+
+    def test_api_and_templates_expose_srcsets(self):
+        post = self.create_post_with_image()
+        api_cache.get_cache().clear()
+        url = reverse('blog:api-posts-list')
+        data = self.client.get(url).json()
+        self.assertEqual(data['posts'][0]['featured_image'], post.featured_image.url)
+        self.assertNotIn('featured_image_variants', data['posts'][0])
+
+        data = self.client.get(url, {'fields': 'featured_image,featured_image_variants'}).json()
+        featured = data['posts'][0]['featured_image_variants']
+        self.assertEqual(featured['url'], post.featured_image.url)
+        self.assertIn('640w', featured['srcset']['webp'])
+        self.assertTrue(featured['variants']['hero']['jpeg'].endswith('_hero.jpg'))
+
+        response = self.client.get(reverse('blog:post_list'))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, images.for_post(post).src('card'))
+
+    def test_images_fall_back_to_original_until_generated(self):
+        # on_commit callbacks never run inside a TestCase transaction
+        post = self.create_post('Pending', featured_image=self.upload())
+        image = images.for_post(post)
+        self.assertFalse(image.ready)
+        self.assertEqual(image.src('card'), post.featured_image.url)
+
+
+# Mounts the async API views at the same paths the sync ones use in
+# production, so both can be compared request for request.
+async_api_urls = ModuleType('async_api_urls')
+async_api_urls.urlpatterns = [
+    path('api/blog/api/', include(([
+        path('posts/', async_views.api_posts_list, name='api-posts-list'),
+        path('posts-batch/', async_views.api_posts_batch, name='api-posts-batch'),
+        path('posts/<slug:slug>/', async_views.api_post_detail, name='api-post-detail'),
+        path('categories/', async_views.api_categories_list, name='api-categories-list'),
+        path('posts/<slug:slug>/comment/', async_views.api_add_comment, name='api-add-comment'),
+    ], 'blog'))),
+]
+
+
+class SqliteTuningTests(TestCase):
+    def test_new_connections_apply_pragmas(self):
+        scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        wrapper = connections['default'].__class__(
+            {**connection.settings_dict, 'NAME': os.path.join(scratch, 'tuned.sqlite3')}, alias='tuned',
+        )
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'cache_size', 'busy_timeout', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {
+            # WAL is opt-in so the checked-in database is not rewritten
+            'journal_mode': 'wal' if settings.SQLITE_WAL else 'delete',
+            'synchronous': 1 if settings.SQLITE_WAL else 2, 'cache_size': settings.SQLITE_PRAGMAS['cache_size'],
+            'busy_timeout': int(settings.SQLITE_BUSY_TIMEOUT * 1000), 'temp_store': 2,
+        })
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('No hot query scans a whole table.', out.getvalue())
+        self.assertIn('adminpanel: comment moderation by status', query_plans.registry)
+
+    def test_list_validators_read_one_index_entry(self):
+        plan, _ = query_plans.check(query_plans.registry['blog: API list validators']())
+        self.assertEqual(plan, ['SEARCH blog_blogpost USING COVERING INDEX blog_post_status_updated_idx (status=?)'])
+
+    def test_reports_full_table_scans(self):
+        _, scans = query_plans.check(Comment.objects.filter(content='spam'))
+        self.assertEqual(scans, ['SCAN blog_comment USING INDEX blog_comment_created_idx'])
+        _, scans = query_plans.check(Comment.objects.order_by('-created_at')[:20])
+        self.assertEqual(scans, [])
+        # The FTS index probed by rowid, under posts read through an index
+        per_row = BlogPost.objects.filter(status='published').extra(
+            tables=[search.FTS_TABLE],
+            where=[f'{search.FTS_TABLE}.rowid = blog_blogpost.id', f'{search.FTS_TABLE} MATCH %s'], params=['x'],
+        ).values('id')
+        _, scans = query_plans.check(per_row)
+        self.assertEqual(len(scans), 1)
+        self.assertRegex(scans[0], r'^SCAN blog_blogpost_fts VIRTUAL TABLE INDEX 0:=M')
+        query_plans.registry['test: unindexed'] = lambda: Comment.objects.filter(content='spam')
+        self.addCleanup(query_plans.registry.pop, 'test: unindexed')
+        with self.assertRaisesMessage(CommandError, 'test: unindexed'):
+            call_command('check_query_plans', 'test:', stdout=StringIO())
+
+
+@override_settings(BLOG_API_CACHE_ENABLED=False, BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class SparseFieldsetTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.category = Category.objects.create(name='Travel')
+        self.post = self.create_post('Lisbon', content='Trams ' * 500, category=self.category)
+        BlogPostAttachment.objects.create(post=self.post, title='Map', file='blog_attachments/map.pdf')
+        Comment.objects.create(post=self.post, author=self.author, content='Nice', status='approved')
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def list_queries(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:api-posts-list') + query)
+        self.assertEqual(response.status_code, 200)
+        # The validators aggregate runs first; the page query is the last one
+        return response.json()['posts'], queries.captured_queries[-1]['sql']
+
+    def test_list_loads_only_requested_columns(self):
+        posts, sql = self.list_queries('?fields=id,title,like_count')
+        self.assertEqual(posts, [{'id': self.post.id, 'title': 'Lisbon', 'like_count': 0}])
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"content"', sql)
+        self.assertNotIn('"excerpt"', sql)
+
+        posts, sql = self.list_queries('?cursor=&fields=slug,category')
+        self.assertEqual(posts, [{'slug': 'lisbon', 'category': 'Travel'}])
+        self.assertIn('"blog_category"', sql)
+        self.assertNotIn('"userapp_customuser"', sql)
+
+    def test_list_defers_content_by_default(self):
+        posts, sql = self.list_queries('')
+        self.assertEqual(posts[0]['author'], 'author')
+        self.assertIn('excerpt', posts[0])
+        self.assertNotIn('"blog_blogpost"."content"', sql)
+
+    def test_detail_skips_queries_for_fields_not_requested(self):
+        path = reverse('blog:api-post-detail', args=[self.post.slug])
+        full = self.client.get(path).json()
+        self.assertEqual(len(full['attachments']), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path + '?fields=title,content')
+        self.assertEqual(response.json(), {'title': 'Lisbon', 'content': self.post.content})
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('blog_blogpostattachment', sql)
+        self.assertNotIn('"blog_comment"."content"', sql)
+        self.assertNotIn('blog_relatedpost', sql)
+
+        view_counter.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 1)
+
+    def test_unknown_fields_are_rejected(self):
+        for path in (
+            reverse('blog:api-posts-list') + '?fields=id,content',
+            reverse('blog:api-post-detail', args=[self.post.slug]) + '?fields=title,password',
+        ):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 400, path)
+            self.assertIn('Unknown fields', response.json()['error'])
+
+
+@override_settings(BLOG_API_CACHE_ENABLED=False, BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class BatchApiTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.category = Category.objects.create(name='Music')
+        self.posts = [self.create_post(f'Album {i}', category=self.category) for i in range(6)]
+        for post in self.posts:
+            BlogPostAttachment.objects.create(post=post, title='Cover', file='blog_attachments/cover.jpg')
+            parent = Comment.objects.create(post=post, author=self.author, content='Great', status='approved')
+            Comment.objects.create(post=post, author=self.author, content='Agreed', parent=parent, status='approved')
+        RelatedPost.objects.create(post=self.posts[0], related=self.posts[2], rank=1, score=0.9)
+
+    def fetch(self, slugs, query=''):
+        return self.client.get(reverse('blog:api-posts-batch') + f'?slugs={",".join(slugs)}{query}')
+
+    def test_matches_detail_api_with_not_found_markers(self):
+        slugs = [self.posts[0].slug, 'missing', self.posts[1].slug]
+        data = self.fetch(slugs).json()['posts']
+        self.assertEqual(list(data), slugs)
+        self.assertEqual(data['missing'], {'error': 'Not found'})
+        for post in self.posts[:2]:
+            detail = self.client.get(reverse('blog:api-post-detail', args=[post.slug])).json()
+            self.assertEqual(data[post.slug], detail)
+        self.assertEqual(data[self.posts[0].slug]['related_posts'][0]['slug'], self.posts[2].slug)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        slugs = [post.slug for post in self.posts]
+        # posts, attachments, comments, precomputed and fallback related
+        # posts, and the counters, which are read on every request
+        with self.assertNumQueries(6):
+            self.fetch(slugs[:2])
+        with self.assertNumQueries(6):
+            self.fetch(slugs)
+        with self.assertNumQueries(2):
+            self.fetch(slugs, '&fields=title,like_count')
+
+    def test_likes_and_views(self):
+        Like.objects.create(user=self.author, post=self.posts[1])
+        self.client.force_login(self.author)
+        data = self.fetch([self.posts[0].slug, self.posts[1].slug]).json()['posts']
+        self.assertEqual([post['is_liked'] for post in data.values()], [False, True])
+        view_counter.flush()
+        # Batch reads are not page views
+        self.assertEqual(BlogPost.objects.filter(view_count__gt=0).count(), 0)
+
+    def test_posts_named_like_api_endpoints_stay_reachable(self):
+        for title in ('Export', 'Batch'):
+            post = self.create_post(title)
+            self.assertEqual(
+                self.client.get(reverse('blog:api-post-detail', args=[post.slug])).json()['title'], title,
+            )
+            self.client.force_login(self.author)
+            response = self.client.post(reverse('blog:api-add-comment', args=[post.slug]),
+                                        json.dumps({'content': 'Found it'}), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.fetch(['export', 'batch']).json()['posts']), ['export', 'batch'])
+
+    @override_settings(BLOG_API_BATCH_MAX_SLUGS=2)
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.fetch([]).status_code, 400)
+        response = self.fetch([post.slug for post in self.posts[:3]])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'At most 2 slugs per request')
+        self.assertEqual(self.fetch([self.posts[0].slug], '&fields=secret').status_code, 400)
+
+
+@override_settings(BLOG_API_CACHE_ENABLED=False, BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, REQUEST_BUDGET_STRICT=True)
+class AsyncApiTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.category = Category.objects.create(name='Food')
+        self.posts = [self.create_post(f'Recipe {i}', category=self.category) for i in range(3)]
+        self.post = self.posts[0]
+        Comment.objects.create(post=self.post, author=self.author, content='Tasty', status='approved')
+        self.paths = [
+            reverse('blog:api-posts-list'),
+            reverse('blog:api-posts-list') + '?per_page=2&page=2',
+            reverse('blog:api-posts-list') + '?cursor=&per_page=2',
+            reverse('blog:api-posts-list') + '?search=recipe',
+            reverse('blog:api-posts-list') + '?fields=id,title,category&per_page=2',
+            reverse('blog:api-post-detail', args=[self.post.slug]),
+            reverse('blog:api-post-detail', args=[self.post.slug]) + '?fields=title,comments',
+            reverse('blog:api-posts-batch') + f'?slugs={self.posts[1].slug},missing,{self.post.slug}',
+            reverse('blog:api-categories-list'),
+        ]
+
+    def tearDown(self):
+        view_counter.flush()
+
+    async def fetch_async(self, path, **extra):
+        with override_settings(ROOT_URLCONF=async_api_urls):
+            return await self.async_client.get(path, **extra)
+
+    async def test_responses_match_sync_views(self):
+        for path in self.paths:
+            sync_response = await sync_to_async(self.client.get)(path)
+            async_response = await self.fetch_async(path)
+            self.assertEqual(async_response.status_code, 200, path)
+            self.assertEqual(async_response.json(), sync_response.json(), path)
+            self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'), path)
+
+    async def test_conditional_get_and_not_found(self):
+        path = reverse('blog:api-post-detail', args=[self.post.slug])
+        response = await self.fetch_async(path)
+        revalidated = await self.fetch_async(path, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        missing = await self.fetch_async(reverse('blog:api-post-detail', args=['missing']))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_add_comment(self):
+        path = reverse('blog:api-add-comment', args=[self.post.slug])
+        with override_settings(ROOT_URLCONF=async_api_urls):
+            anonymous = await self.async_client.post(path, '{}', content_type='application/json')
+            await self.async_client.aforce_login(self.author)
+            response = await self.async_client.post(
+                path, json.dumps({'content': 'Async hello'}), content_type='application/json',
+            )
+            orphan = await self.async_client.post(
+                path, json.dumps({'content': 'Reply', 'parent_id': 999999}), content_type='application/json',
+            )
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(orphan.status_code, 404)
+        await sync_to_async(self.client.force_login)(self.author)
+        sync_orphan = await sync_to_async(self.client.post)(
+            path, json.dumps({'content': 'Reply', 'parent_id': 999999}), content_type='application/json',
+        )
+        self.assertEqual(sync_orphan.status_code, 404)
+        data = response.json()
+        self.assertEqual((data['comment']['author'], data['comment']['status']), ('author', 'pending'))
+        self.assertTrue(await Comment.objects.filter(content='Async hello', post=self.post).aexists())
+
+
+@override_settings(BLOG_API_CACHE_ENABLED=False, BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The replica is a second SQLite file with the test database's
+        # schema, copied before the test transaction starts
+        cls.scratch = tempfile.mkdtemp()
+        replica_path = os.path.join(cls.scratch, 'replica.sqlite3')
+        connection.ensure_connection()
+        with closing(sqlite3.connect(replica_path)) as replica:
+            connection.connection.backup(replica)
+        super().setUpClass()
+        connections.settings['replica'] = {**connection.settings_dict, 'NAME': replica_path}
+        cls.databases = {*cls.databases, 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        del cls.databases
+        shutil.rmtree(cls.scratch, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.author = self.create_user()
+        replicated = self.create_post('Replicated')
+        User.objects.using('replica').bulk_create([self.author])
+        BlogPost.objects.using('replica').bulk_create([replicated])
+        # Not on the replica, as if replication lagged behind
+        self.post = self.create_post('Not replicated yet')
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def titles(self, **params):
+        response = self.client.get(reverse('blog:api-posts-list'), params)
+        return [post['title'] for post in response.json()['posts']]
+
+    def test_search_index_follows_the_database(self):
+        replicated = BlogPost.objects.using('replica').get()
+        replicated.title = 'Replicated glacier'
+        replicated.save(using='replica')
+        self.assertEqual(self.titles(search='glacier'), ['Replicated glacier'])
+
+        # Without an index on the replica, searches there fall back to a scan
+        search.drop_index(connections['replica'])
+        self.addCleanup(search._available.clear)
+        self.assertEqual(self.titles(search='replicated'), ['Replicated glacier'])
+
+    def test_reads_from_replica_until_visitor_writes(self):
+        self.assertEqual(self.titles(), ['Replicated'])
+        self.assertEqual(self.client.get(reverse('blog:post_list')).context['page_obj'].paginator.count, 1)
+
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('blog:api-add-comment', args=[self.post.slug]),
+            json.dumps({'content': 'Fresh'}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # The comment went to the primary, and its author now reads from there
+        self.assertTrue(Comment.objects.filter(post=self.post, content='Fresh').exists())
+        self.assertEqual(self.titles(), ['Not replicated yet', 'Replicated'])
+
+    def test_writes_pin_rest_of_request_to_primary(self):
+        router = PrimaryReplicaRouter()
+
+        @replica_reads
+        def view(request):
+            return [router.db_for_read(BlogPost), router.db_for_read(User), router.db_for_write(Like),
+                    router.db_for_read(BlogPost)]
+
+        self.assertEqual(view(RequestFactory().get('/')), ['replica', 'default', 'default', 'default'])
+        self.assertEqual(view(RequestFactory().post('/')), ['default', 'default', 'default', 'default'])
+        self.assertEqual(router.db_for_read(BlogPost), 'default')
+
+
+@budget(queries=2)
+def _comments_one_by_one(request):
+    return JsonResponse({'comments': [Comment.objects.get(id=comment_id).content for comment_id in request.GET.getlist('id')]})
+
+
+@budget(queries=0, ms=0)
+def _count_comments(request):
+    return JsonResponse({'count': Comment.objects.count()})
+
+
+n_plus_one_urls = ModuleType('n_plus_one_urls')
+n_plus_one_urls.urlpatterns = [
+    path('comments/', _comments_one_by_one, name='comments-one-by-one'),
+    path('comments/count/', _count_comments, name='count-comments'),
+]
+
+
+@override_settings(BLOG_API_CACHE_ENABLED=False, BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, REQUEST_BUDGET_STRICT=True)
+class RequestInstrumentationTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.author = self.create_user()
+        self.categories = [Category.objects.create(name=f'Topic {i}') for i in range(5)]
+        self.posts = [self.create_post(f'Post {i}', category=self.categories[i % 5]) for i in range(12)]
+        self.post = self.posts[0]
+        for i in range(10):
+            comment = Comment.objects.create(post=self.post, author=self.author, content=f'#{i}', status='approved')
+            Comment.objects.create(post=self.post, author=self.author, content=f'Re #{i}', status='approved',
+                                   parent=comment)
+        instrumentation.stats.reset()
+
+    def tearDown(self):
+        view_counter.flush()
+
+    def test_views_stay_within_their_budgets(self):
+        self.client.force_login(self.author)
+        slugs = ','.join(post.slug for post in self.posts)
+        for path in [
+            reverse('blog:post_list'),
+            reverse('blog:post_detail', args=[self.post.slug]),
+            reverse('blog:category_posts', args=[self.categories[0].slug]),
+            reverse('blog:api-posts-list'),
+            reverse('blog:api-post-detail', args=[self.post.slug]),
+            reverse('blog:api-posts-batch') + f'?slugs={slugs}',
+            reverse('blog:api-categories-list'),
+        ]:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+$')
+        routes = instrumentation.stats.snapshot()
+        self.assertEqual(routes['blog:api-post-detail']['requests'], 1)
+        self.assertEqual({name for name, route in routes.items() if route['duplicated']}, set())
+
+    def test_reports_repeated_queries(self):
+        comments = Comment.objects.filter(parent=None)[:5]
+        path = '/comments/?' + '&'.join(f'id={comment.id}' for comment in comments)
+        with override_settings(ROOT_URLCONF=n_plus_one_urls):
+            with self.assertRaisesMessage(instrumentation.BudgetExceeded, 'ran 5 queries, over its budget of 2'):
+                self.client.get(path)
+            with override_settings(REQUEST_BUDGET_STRICT=False), self.assertLogs(instrumentation.logger) as logs:
+                self.client.get(path)
+        self.assertIn('comments-one-by-one): 5 queries (budget 2)', logs.output[0])
+        self.assertIn('5x SELECT "blog_comment"."id"', logs.output[0])
+        self.assertIn('WHERE "blog_comment"."id" = %s LIMIT ?', logs.output[0])
+        self.assertEqual(instrumentation.stats.snapshot()['comments-one-by-one']['over_budget'], 2)
+
+    @override_settings(ROOT_URLCONF=n_plus_one_urls, REQUEST_BUDGET_STRICT=False)
+    def test_zero_budgets_are_declared_budgets(self):
+        with self.assertLogs(instrumentation.logger) as logs:
+            self.client.get('/comments/count/')
+        self.assertIn('count-comments): 1 queries (budget 0), ', logs.output[0])
+        self.assertIn(' ms (budget 0 ms)', logs.output[0])
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            instrumentation.fingerprint("SELECT * FROM t WHERE id IN (%s, %s,\n %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+
+class ProfilingTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        settings = override_settings(
+            REQUEST_PROFILING_ENABLED=True, REQUEST_PROFILING_DIR=self.profile_dir,
+            REQUEST_PROFILING_INTERVAL=0.0005, BLOG_VIEW_COUNT_FLUSH_INTERVAL=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(view_counter.flush)
+        self.author = self.create_user()
+        self.post = self.create_post('Profiled post')
+
+    def profiles(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_signed_header_selects_request(self):
+        url = reverse('blog:post_detail', args=[self.post.slug])
+        self.assertNotIn('X-Profile-Id', self.client.get(url))
+        self.assertNotIn('X-Profile-Id', self.client.get(url, headers={'X-Profile': 'sample:forged'}))
+        self.assertEqual(self.profiles(), [])
+
+        response = self.client.get(url, headers={'X-Profile': profiling.make_token('sample')})
+        self.assertEqual(self.profiles(), [response['X-Profile-Id']])
+        self.assertRegex(response['X-Profile-Id'], r'-blog\.post_detail-\d+ms-\d+-[0-9a-f]{4}\.stacks$')
+
+    @override_settings(REQUEST_PROFILING_MODE='cprofile', REQUEST_PROFILING_MAX_FILES=2)
+    def test_url_names_and_sample_rate_select_requests(self):
+        with override_settings(REQUEST_PROFILING_URL_NAMES=['blog:post_detail']):
+            self.client.get(reverse('blog:post_list'))
+            self.assertEqual(self.profiles(), [])
+            self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+            response = self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(len(self.profiles()), 2)
+
+        with override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0):
+            self.client = self.client_class()
+            self.client.get(reverse('blog:api-categories-list'))
+        profiles = self.profiles()
+        self.assertEqual([name.split('-')[2] for name in profiles], ['blog.api', 'blog.post_detail'])
+        self.assertTrue(all(name.endswith('.prof') for name in profiles))
+
+    def test_aggregate_profiles(self):
+        self.client.get(
+            reverse('blog:post_detail', args=[self.post.slug]), headers={'X-Profile': profiling.make_token('cprofile')}
+        )
+        with open(os.path.join(self.profile_dir, 'hand-blog.post_detail.stacks'), 'w') as f:
+            f.write('handler;post_detail;render 3\nhandler;post_detail 1\n')
+
+        out = StringIO()
+        call_command('aggregate_profiles', name='post_detail', sort='own', limit=2, stdout=out)
+        output = out.getvalue()
+        self.assertIn('4 samples from 1 sampled requests', output)
+        self.assertRegex(output, r'own %  total %  function\n +75\.0 +75\.0  render\n +25\.0 +100\.0  post_detail\n')
+        self.assertIn('cProfile-traced requests', output)
+
+        out = StringIO()
+        call_command('aggregate_profiles', name='post_detail', limit=10, stdout=out)
+        self.assertRegex(out.getvalue(), r'\n +1 +[\d.]+ +[\d.]+  \S+blog/views\.py:\d+\(blog_detail_view\)\n')
+
+        with self.assertRaisesMessage(CommandError, 'No profiles'):
+            call_command('aggregate_profiles', name='comment_management', stdout=StringIO())
+
+    def test_disabled_middleware_removes_itself(self):
+        with override_settings(REQUEST_PROFILING_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, METRICS_DIR='', METRICS_TOKEN='s3cret')
+class MetricsTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        self.addCleanup(view_counter.flush)
+        metrics.registry.reset()
+        self.author = self.create_user()
+        self.post = self.create_post('Measured post')
+
+    def scrape(self, **kwargs):
+        kwargs.setdefault('headers', {'Authorization': 'Bearer s3cret'})
+        response = self.client.get(reverse('metrics'), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_exposes_request_and_blog_counters(self):
+        self.client.force_login(self.author)
+        self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.client.get(reverse('blog:post_detail', args=['missing']))
+        self.client.post(reverse('blog:toggle_like', args=[self.post.slug]))
+        self.client.post(reverse('blog:api-add-comment', args=[self.post.slug]),
+                         json.dumps({'content': 'Counted'}), content_type='application/json')
+        self.client.get(reverse('blog:api-categories-list'))
+        self.client.get(reverse('blog:api-categories-list'))
+        self.client.get('/admin/login/')
+
+        text = self.scrape()
+        for line in [
+            '# TYPE django_http_requests_total counter',
+            'django_http_requests_total{view="blog:post_detail",method="GET",status="200"} 1',
+            'django_http_requests_total{view="blog:post_detail",method="GET",status="404"} 1',
+            'django_http_requests_total{view="blog:toggle_like",method="POST",status="302"} 1',
+            'django_http_requests_total{view="other",method="GET",status="200"} 1',
+            '# TYPE django_http_request_duration_seconds histogram',
+            'django_http_request_duration_seconds_bucket{view="blog:post_detail",method="GET",le="+Inf"} 2',
+            'django_http_request_duration_seconds_count{view="blog:post_detail",method="GET"} 2',
+            'blog_post_views_total 1',
+            'blog_likes_total{action="like"} 1',
+            'blog_comments_total 1',
+            'blog_api_cache_requests_total{result="hit"} 1',
+            'blog_api_cache_requests_total{result="miss"} 1',
+        ]:
+            self.assertIn(line + '\n', text)
+        self.assertRegex(text, r'django_db_queries_total\{view="blog:post_detail"\} [1-9]\d*\n')
+        self.assertRegex(text, r'django_http_request_duration_seconds_bucket\{view="blog:post_detail",method="GET",le="10\.0"\} 2\n')
+
+    @override_settings(REQUEST_INSTRUMENTATION_ENABLED=False)
+    def test_counts_requests_without_instrumentation(self):
+        self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        text = self.scrape()
+        self.assertIn('django_http_requests_total{view="blog:post_detail",method="GET",status="200"} 1\n', text)
+        self.assertIn('django_http_request_duration_seconds_count{view="blog:post_detail",method="GET"} 1\n', text)
+        self.assertNotIn('django_db_queries_total{view="blog:post_detail"}', text)
+
+    def test_adds_up_the_files_of_every_process(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        with open(os.path.join(metrics_dir, '1-1.json'), 'w') as f:
+            json.dump({
+                'blog_likes_total': [[['like'], 4], [['unlike'], 1]],
+                'django_http_request_duration_seconds': [
+                    [['blog:post_detail', 'GET'], [1] + [0] * 11 + [0.5]],
+                ],
+                'retired_metric_total': [[[], 7]],
+            }, f)
+
+        with override_settings(METRICS_DIR=metrics_dir):
+            metrics.LIKES.inc('like')
+            metrics.REQUEST_LATENCY.observe(0.25, 'blog:post_detail', 'GET')
+            text = metrics.exposition()
+            self.assertEqual(len(os.listdir(metrics_dir)), 2)
+        self.assertIn('blog_likes_total{action="like"} 5\n', text)
+        self.assertIn('blog_likes_total{action="unlike"} 1\n', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{view="blog:post_detail",method="GET",le="0.005"} 1\n', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{view="blog:post_detail",method="GET",le="0.25"} 2\n', text)
+        self.assertIn('django_http_request_duration_seconds_sum{view="blog:post_detail",method="GET"} 0.75\n', text)
+        self.assertNotIn('retired_metric_total', text)
+
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer guess'}).status_code, 403)
+        self.assertIn('# TYPE blog_comments_total counter', self.scrape())
+
+    @override_settings(METRICS_TOKEN='')
+    def test_only_staff_can_read_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.author.is_staff = True
+        self.author.save(update_fields=['is_staff'])
+        self.assertIn('# TYPE blog_comments_total counter', self.scrape(headers={}))
+
+
+class FixtureGeneratorTests(TestCase):
+    def generate(self, **kwargs):
+        options = dict(users=30, categories=4, posts=60, comments=300, likes=200, batch_size=50, seed=7)
+        options.update(kwargs)
+        return fixture_generator.FixtureGenerator(**options).run()
+
+    def test_generates_consistent_rows(self):
+        generator = self.generate(max_depth=2)
+        self.assertEqual(generator.created, {'users': 30, 'categories': 4, 'posts': 60, 'comments': 300,
+                                             'likes': 200})
+        self.assertEqual(Like.objects.count(), 200)
+        self.assertEqual(Comment.objects.exclude(post__status='published').count(), 0)
+        self.assertTrue(Comment.objects.filter(parent__parent__isnull=False).exists())
+        self.assertFalse(Comment.objects.filter(parent__parent__parent__isnull=False).exists())
+        self.assertFalse(Comment.objects.exclude(parent=None).exclude(parent__post=models.F('post')).exists())
+        for post in BlogPost.objects.all():
+            self.assertEqual(post.like_count, post.likes.count())
+        for category in Category.objects.all():
+            self.assertEqual(category.total_post_count, category.posts.count())
+
+    def test_skew_and_seed(self):
+        self.generate(skew=1.5)
+        likes = list(BlogPost.objects.order_by('-like_count').values_list('like_count', flat=True))
+        self.assertGreater(likes[0], 5 * likes[len(likes) // 2])
+
+        titles = list(BlogPost.objects.order_by('pk').values_list('title', flat=True))
+        self.generate(skew=1.5, prefix='again')
+        self.assertEqual(list(BlogPost.objects.order_by('pk').values_list('title', flat=True)[60:]), titles)
+
+    def test_counts_for_rows(self):
+        counts = fixture_generator.counts_for_rows(1_000_000)
+        self.assertEqual(counts, {'users': 50_000, 'categories': 100, 'posts': 200_000, 'comments': 450_000,
+                                  'likes': 300_000})
+        self.assertEqual(sum(counts.values()), 1_000_100)
+
+        out = StringIO()
+        call_command('generate_fixtures', rows=200, likes=10, stdout=out)
+        self.assertIn('Created 10 users, 5 categories, 40 posts, 90 comments, 10 likes', out.getvalue())
+        with self.assertRaisesMessage(CommandError, 'Pass --rows'):
+            call_command('generate_fixtures', stdout=StringIO())
+
+
+class LoadTestTests(TestCase):
+    def stage(self, concurrency, responses, latency, errors=0):
+        stage = loadtest.Stage(concurrency, duration=10)
+        for _ in range(responses):
+            stage.add('read', latency, 200)
+        for _ in range(errors):
+            stage.add('like', latency, 500)
+        return stage
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('read=3, like=0.5'), {'read': 3.0, 'like': 0.5})
+        self.assertEqual(set(loadtest.parse_mix(loadtest.DEFAULT_MIX)), set(loadtest.ACTIONS))
+        for mix, message in (('stare=1', 'Unknown action'), ('read=x', 'not a number'), ('read=0', 'no action')):
+            with self.assertRaisesMessage(ValueError, message):
+                loadtest.parse_mix(mix)
+
+    def test_saturation_point(self):
+        growing = [self.stage(1, 100, 0.01), self.stage(5, 400, 0.02), self.stage(10, 700, 0.05)]
+        self.assertEqual(loadtest.saturation_point(growing, 500, 0.01), (2, None))
+
+        flat = growing[:2] + [self.stage(10, 410, 0.1)]
+        index, reason = loadtest.saturation_point(flat, 500, 0.01)
+        self.assertEqual(index, 1)
+        self.assertIn('grew less than 5% from 5 to 10 visitors', reason)
+
+        slow = growing[:2] + [self.stage(10, 900, 0.8)]
+        self.assertEqual(loadtest.saturation_point(slow, 500, 0.01), (1, 'p95 of 800 ms at 10 visitors'))
+
+        failing = [self.stage(1, 90, 0.01, errors=10)]
+        self.assertEqual(loadtest.saturation_point(failing, 500, 0.01), (None, '10.0% errors at 1 visitors'))
+        self.assertEqual(failing[0].summary()['errors'], {'like 500': 10})
+
+    def test_server_log_counts_lock_errors(self):
+        log = loadtest.ServerLog(BytesIO(
+            b'Internal Server Error: /post/a/like/\n'
+            b'sqlite3.OperationalError: database is locked\n'
+            b'django.db.utils.OperationalError: database is locked\n'
+            b'django.db.utils.OperationalError: database table is locked: blog_like\n'
+            b'django.db.utils.OperationalError: no such table: blog_like\n'
+        ))
+        log._thread.join()
+        self.assertEqual(log.locked, 2)
+        self.assertEqual(len(log.tail), 5)
@@ -1,14 +1,24 @@
+from django.conf import settings
 from django.urls import path, include
 from . import views
 
+# Native async API views for ASGI deployments
+if getattr(settings, 'BLOG_ASYNC_API', False):
+    from . import async_views as api_views
+else:
+    api_views = views
+
 app_name = 'blog'
 
 # API URLs
 api_urlpatterns = [
-    path('posts/', views.api_posts_list, name='api-posts-list'),
-    path('posts/<slug:slug>/', views.api_post_detail, name='api-post-detail'),
-    path('categories/', views.api_categories_list, name='api-categories-list'),
-    path('posts/<slug:slug>/comment/', views.api_add_comment, name='api-add-comment'),
+    path('posts/', api_views.api_posts_list, name='api-posts-list'),
+    # Kept out of posts/<slug>/, where they would shadow posts with those slugs
+    path('export/posts/', views.api_posts_export, name='api-posts-export'),
+    path('posts-batch/', api_views.api_posts_batch, name='api-posts-batch'),
+    path('posts/<slug:slug>/', api_views.api_post_detail, name='api-post-detail'),
+    path('categories/', api_views.api_categories_list, name='api-categories-list'),
+    path('posts/<slug:slug>/comment/', api_views.api_add_comment, name='api-add-comment'),
 ]
 
 # Frontend Template URLs
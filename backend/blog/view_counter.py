@@ -0,0 +1,134 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from backend import metrics
+
+from . import api_cache
+from .models import BlogPost
+from .write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    Write-behind buffer for BlogPost.view_count.
+
+    Views call increment() which only touches an in-process dict. Pending
+    increments are written back in one UPDATE when the buffer reaches
+    BLOG_VIEW_COUNT_BATCH_SIZE, every BLOG_VIEW_COUNT_FLUSH_INTERVAL seconds
+    from a background thread, and once more at interpreter shutdown. The
+    UPDATE goes through the write queue like any other small write. It
+    leaves cached JSON API payloads alone, as API views read current view
+    counts per request, and only bumps the counters generation of the list
+    ETag.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._size = 0
+        self._timer = None
+        self._stopped = threading.Event()
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'BLOG_VIEW_COUNT_BATCH_SIZE', 100)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'BLOG_VIEW_COUNT_FLUSH_INTERVAL', 5.0)
+
+    def increment(self, post_id, amount=1):
+        metrics.POST_VIEWS.inc(amount=amount)
+        with self._lock:
+            self._pending[post_id] += amount
+            self._size += amount
+            should_flush = self._size >= self.batch_size
+        self._ensure_timer()
+        if should_flush:
+            try:
+                self.flush()
+            except Exception:
+                # The increments stay buffered; never fail the request over it
+                logger.exception('Failed to flush buffered view counts')
+
+    def pending(self, post_id=None):
+        with self._lock:
+            if post_id is None:
+                return self._size
+            return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """Write all pending increments to the database. Returns rows updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._size = 0
+            if not pending:
+                return 0
+            try:
+                updated = write_queue.run(self._write, pending)
+            except Exception:
+                # Put the increments back so the next flush retries them
+                with self._lock:
+                    self._pending.update(pending)
+                    self._size += sum(pending.values())
+                raise
+            if updated:
+                api_cache.bump_generation(api_cache.COUNTERS_KEY)
+            return updated
+
+    @staticmethod
+    def _write(pending):
+        return BlogPost.objects.filter(id__in=list(pending)).update(
+            view_count=F('view_count') + Case(
+                *[When(id=post_id, then=Value(count)) for post_id, count in pending.items()],
+                output_field=PositiveIntegerField(),
+            )
+        )
+
+    def stop(self):
+        self._stopped.set()
+        timer = self._timer
+        if timer is not None and timer is not threading.current_thread():
+            timer.join()
+        self._timer = None
+        self._stopped.clear()
+
+    def _ensure_timer(self):
+        if self._timer is not None or not self.flush_interval:
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Thread(
+                    target=self._run_timer, name='blog-view-counter', daemon=True
+                )
+                self._timer.start()
+
+    def _run_timer(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush buffered view counts')
+            finally:
+                connection.close()
+
+
+view_counter = ViewCounter()
+
+
+@atexit.register
+def _flush_on_shutdown():
+    try:
+        view_counter.flush()
+    except Exception:
+        logger.exception('Failed to flush buffered view counts at shutdown')
@@ -0,0 +1,126 @@
+"""
+Per-visitor record of recently viewed posts, used to count each view once.
+
+Stored in a signed cookie as two Bloom filters of BLOG_VIEWED_POSTS_BITS
+bits: the current window and the previous one. Every
+BLOG_VIEWED_POSTS_WINDOW seconds the current filter becomes the previous
+one and a fresh filter starts, so a post counts again after one to two
+windows. The cookie stays the same size however many posts a visitor
+reads, and the session is never written. A false positive only means a
+view goes uncounted; with the defaults that is under 1% of views until a
+visitor reads about 200 posts in one window.
+"""
+import base64
+import binascii
+import hashlib
+import time
+import zlib
+
+from django.conf import settings
+
+from .view_counter import view_counter
+
+COOKIE_NAME = 'viewed_posts'
+COOKIE_SALT = 'blog.viewed_posts'
+HASHES = 7
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ViewedPosts:
+    """Two-window Bloom filter of post ids, loaded from and saved to a cookie."""
+
+    def __init__(self, bits=None, window=None, now=None):
+        self.bits = bits or _setting('BLOG_VIEWED_POSTS_BITS', 2048)
+        self.window = window or _setting('BLOG_VIEWED_POSTS_WINDOW', 86400)
+        self.now = int(now if now is not None else time.time())
+        self.started = self.now
+        self.current = bytearray(self.bits // 8)
+        self.previous = bytearray(self.bits // 8)
+        self.changed = False
+
+    @classmethod
+    def from_request(cls, request, **kwargs):
+        viewed = cls(**kwargs)
+        value = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        if value:
+            viewed.load(value)
+        return viewed
+
+    def load(self, value):
+        """Restore from a cookie value; anything unreadable starts afresh."""
+        try:
+            started, data = value.split(':', 1)
+            filters = zlib.decompress(base64.urlsafe_b64decode(data))
+            started = int(started)
+        except (ValueError, binascii.Error, zlib.error):
+            return
+        size = self.bits // 8
+        if len(filters) != 2 * size:
+            # BLOG_VIEWED_POSTS_BITS changed since the cookie was set
+            return
+        self.started = started
+        self.current[:] = filters[:size]
+        self.previous[:] = filters[size:]
+        self._rotate()
+
+    def _rotate(self):
+        elapsed = self.now - self.started
+        if elapsed < self.window:
+            return
+        if elapsed < 2 * self.window:
+            self.previous[:] = self.current
+        else:
+            self.previous[:] = bytes(len(self.previous))
+        self.current[:] = bytes(len(self.current))
+        self.started = self.now
+        self.changed = True
+
+    def _positions(self, post_id):
+        digest = hashlib.blake2b(str(post_id).encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit hashes
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(HASHES)]
+
+    @staticmethod
+    def _has(bitset, positions):
+        return all(bitset[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def __contains__(self, post_id):
+        positions = self._positions(post_id)
+        return self._has(self.current, positions) or self._has(self.previous, positions)
+
+    def add(self, post_id):
+        for p in self._positions(post_id):
+            self.current[p >> 3] |= 1 << (p & 7)
+        self.changed = True
+
+    def dumps(self):
+        data = base64.urlsafe_b64encode(zlib.compress(bytes(self.current + self.previous), 9)).decode()
+        return f'{self.started}:{data}'
+
+    def save(self, response):
+        """Set the cookie on `response` if anything changed."""
+        if not self.changed:
+            return response
+        response.set_signed_cookie(
+            COOKIE_NAME, self.dumps(), salt=COOKIE_SALT,
+            max_age=2 * self.window, httponly=True, samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+        return response
+
+
+def record_view(request, post_id):
+    """
+    Count a view of `post_id` unless this visitor viewed it recently.
+    Returns the ViewedPosts to save() on the response.
+    """
+    viewed = ViewedPosts.from_request(request)
+    if post_id not in viewed:
+        view_counter.increment(post_id)
+        viewed.add(post_id)
+    return viewed
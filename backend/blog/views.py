@@ -1,14 +1,28 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator
-from django.db.models import Q, F
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from django.views.decorators.http import require_GET
 import json
+from backend.db_router import replica_reads
+from backend.instrumentation import budget
 from .models import Category, BlogPost, BlogPostAttachment, Comment, Like
+from . import api_cache, export, fieldsets, related, search
+from .api_helpers import (
+    batch_likes_query, category_summary, comment_created_payload, counters_query, cursor_page_payload,
+    filter_published_posts, found_posts, numbered_page_payload, parse_fields, parse_slugs, post_cache_validators,
+    post_etag, post_last_modified, post_summary, post_validators, posts_batch_payload, posts_list_cache_validators,
+    posts_list_etag, related_summary, set_counters, set_post_counters, wanted_counters,
+)
+from .assemblers import PostBatchAssembler, PostDetailAssembler
+from .pagination import InvalidCursor, paginate_by_cursor
+from .viewed_posts import record_view
+from .write_queue import write_queue
 
 User = get_user_model()
 
@@ -22,27 +36,38 @@ def get_client_ip(request):
     return ip
 
 
-def blog_list_view(request):
+def _blog_list_posts(request):
     posts = BlogPost.objects.filter(status='published').select_related('author', 'category')
     
     search_query = request.GET.get('search')
     if search_query:
-        posts = posts.filter(
-            Q(title__icontains=search_query) | 
-            Q(content__icontains=search_query) |
-            Q(excerpt__icontains=search_query)
-        )
+        posts = search.search_posts(posts, search_query)
     
     # Category filter
     category_slug = request.GET.get('category')
     if category_slug:
         posts = posts.filter(category__slug=category_slug)
+    return posts
+
+
+def _featured_posts(posts):
+    return posts.filter(is_featured=True)[:3]
+
+
+@budget(queries=10)
+@replica_reads
+def blog_list_view(request):
+    posts = _blog_list_posts(request)
+    search_query = request.GET.get('search')
+    category_slug = request.GET.get('category')
     
-    featured_posts = posts.filter(is_featured=True)[:3]
+    featured_posts = _featured_posts(posts)
     
     paginator = Paginator(posts, 6)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    if search_query:
+        search.attach_snippets(page_obj)
     
     categories = Category.objects.all()
     
@@ -56,41 +81,28 @@ def blog_list_view(request):
     return render(request, 'blog/post_list.html', context)
 
 
+@budget(queries=12)
+@replica_reads
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def blog_detail_view(request, slug):
-    post = get_object_or_404(BlogPost, slug=slug, status='published')
-    
-    # Increment view count once per session for this post
-    viewed_posts = request.session.get('viewed_posts', [])
-    if post.id not in viewed_posts:
-        BlogPost.objects.filter(id=post.id).update(view_count=F('view_count') + 1)
-        viewed_posts.append(post.id)
-        request.session['viewed_posts'] = viewed_posts
-    
-    # Get approved comments
-    comments = Comment.objects.filter(
-        post=post, 
-        status='approved', 
-        parent=None
-    ).select_related('author').prefetch_related('replies')
+    detail = PostDetailAssembler(slug, user=request.user).assemble()
+    post = detail.post
+    viewed = record_view(request, post.id)
     
-    # Check if user liked the post
-    is_liked = False
-    if request.user.is_authenticated:
-        is_liked = Like.objects.filter(user=request.user, post=post).exists()
-    
-    # Get related posts
-    related_posts = BlogPost.objects.filter(
-        category=post.category, 
-        status='published'
-    ).exclude(id=post.id)[:3]
-    
-    context = {
-        'post': post,
-        'comments': comments,
-        'is_liked': is_liked,
-        'related_posts': related_posts,
-    }
-    return render(request, 'blog/post_detail.html', context)
+    context = detail.get_context()
+    context['related_posts'] = related.related_posts_for(post)
+    return viewed.save(render(request, 'blog/post_detail.html', context))
+
+
+def _toggle_like(user, post_id):
+    """Like the post, or unlike it if already liked. Returns whether it is now liked."""
+    like, created = Like.objects.get_or_create(user=user, post_id=post_id)
+    if created:
+        BlogPost.objects.filter(id=post_id).update(like_count=F('like_count') + 1)
+    else:
+        like.delete()
+        BlogPost.objects.filter(id=post_id).update(like_count=F('like_count') - 1)
+    return created
 
 
 @login_required
@@ -105,7 +117,8 @@ def add_comment(request, slug):
         if parent_id:
             parent = get_object_or_404(Comment, id=parent_id)
         
-        Comment.objects.create(
+        write_queue.run(
+            Comment.objects.create,
             post=post,
             author=request.user,
             content=content,
@@ -123,21 +136,10 @@ def add_comment(request, slug):
 def toggle_like(request, slug):
     post = get_object_or_404(BlogPost, slug=slug, status='published')
     
-    like, created = Like.objects.get_or_create(
-        user=request.user,
-        post=post
-    )
-    
-    if created:
-        # Increment like count
-        BlogPost.objects.filter(id=post.id).update(like_count=F('like_count') + 1)
-        liked = True
+    liked = write_queue.run(_toggle_like, request.user, post.id)
+    if liked:
         message = 'Post liked successfully'
     else:
-        # Remove like and decrement count
-        like.delete()
-        BlogPost.objects.filter(id=post.id).update(like_count=F('like_count') - 1)
-        liked = False
         message = 'Post unliked successfully'
     
     # Return JSON response for AJAX requests
@@ -153,12 +155,18 @@ def toggle_like(request, slug):
     return redirect('blog:post_detail', slug=slug)
 
 
-def category_view(request, slug):
-    category = get_object_or_404(Category, slug=slug)
-    posts = BlogPost.objects.filter(
+def _category_posts(category):
+    return BlogPost.objects.filter(
         category=category, 
         status='published'
     ).select_related('author')
+
+
+@budget(queries=7)
+@replica_reads
+def category_view(request, slug):
+    category = get_object_or_404(Category, slug=slug)
+    posts = _category_posts(category)
     
     paginator = Paginator(posts, 6)
     page_number = request.GET.get('page')
@@ -172,119 +180,157 @@ def category_view(request, slug):
 
 
 # Simple JSON API Endpoints
-def api_posts_list(request):
-    posts = BlogPost.objects.filter(status='published').select_related('author', 'category')
+def _posts_list_data(request, fields):
+    posts = filter_published_posts(request, fields)
+    with_snippet = bool(request.GET.get('search'))
     
-    # Apply filters
-    category = request.GET.get('category')
-    if category:
-        posts = posts.filter(category__slug=category)
+    per_page = int(request.GET.get('per_page', 10))
     
-    search = request.GET.get('search')
-    if search:
-        posts = posts.filter(
-            Q(title__icontains=search) | 
-            Q(content__icontains=search)
+    # Cursor mode (?cursor=, empty for the first page) uses keyset pagination
+    # and skips the COUNT(*) and OFFSET scan that page mode needs.
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        if with_snippet:
+            # Keyset pages follow (created_at, id), which would lose the search ranking
+            raise InvalidCursor('Cursor pagination is not available with search')
+        page_posts, next_cursor = paginate_by_cursor(posts, cursor, per_page)
+        return cursor_page_payload(
+            [post_summary(post, fields, with_snippet) for post in page_posts], next_cursor,
+            [post.id for post in page_posts],
         )
     
     page = int(request.GET.get('page', 1))
-    per_page = int(request.GET.get('per_page', 10))
-    
     paginator = Paginator(posts, per_page)
     page_obj = paginator.get_page(page)
-    
-    posts_data = []
-    for post in page_obj:
-        posts_data.append({
-            'id': post.id,
-            'title': post.title,
-            'slug': post.slug,
-            'excerpt': post.excerpt,
-            'author': post.author.username,
-            'category': post.category.name if post.category else None,
-            'featured_image': post.featured_image.url if post.featured_image else None,
-            'view_count': post.view_count,
-            'like_count': post.like_count,
-            'created_at': post.created_at.isoformat(),
-        })
-    
-    return JsonResponse({
-        'posts': posts_data,
-        'total_pages': paginator.num_pages,
-        'current_page': page_obj.number,
-        'has_next': page_obj.has_next(),
-        'has_previous': page_obj.has_previous(),
-    })
+    return numbered_page_payload(
+        [post_summary(post, fields, with_snippet) for post in page_obj], page_obj,
+        [post.id for post in page_obj],
+    )
+
+
+@budget(queries=8)
+@replica_reads
+@condition(etag_func=posts_list_etag)
+def api_posts_list(request):
+    fields, error = parse_fields(request, fieldsets.LIST_FIELDS)
+    if error:
+        return error
+    try:
+        data = api_cache.get_or_build(
+            request, lambda: _posts_list_data(request, fields), posts_list_cache_validators(request),
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    post_ids = data.pop('post_ids')
+    counters = wanted_counters(fields)
+    if counters and post_ids:
+        set_counters(dict(zip(post_ids, data['posts'])), counters, counters_query(counters, 'id', post_ids))
+    return JsonResponse(data)
 
 
+def _post_detail_data(slug, fields):
+    detail = PostDetailAssembler(slug, fields=fields).assemble()
+    post_data = detail.to_dict()
+    if detail.wants('related_posts'):
+        post_data['related_posts'] = related_summary(related.related_posts_for(detail.post))
+    return post_data
+
+
+@budget(queries=10)
+@replica_reads
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def api_post_detail(request, slug):
-    post = get_object_or_404(BlogPost, slug=slug, status='published')
-    
-    # Increment view count once per session for this post (API)
-    viewed_posts = request.session.get('viewed_posts', [])
-    if post.id not in viewed_posts:
-        BlogPost.objects.filter(id=post.id).update(view_count=F('view_count') + 1)
-        viewed_posts.append(post.id)
-        request.session['viewed_posts'] = viewed_posts
-    
-    # Get comments
-    comments = Comment.objects.filter(
-        post=post, 
-        status='approved', 
-        parent=None
-    ).select_related('author')
-    
-    comments_data = []
-    for comment in comments:
-        replies_data = []
-        for reply in comment.replies.filter(status='approved'):
-            replies_data.append({
-                'id': reply.id,
-                'author': reply.author.username,
-                'content': reply.content,
-                'created_at': reply.created_at.isoformat(),
-            })
-        
-        comments_data.append({
-            'id': comment.id,
-            'author': comment.author.username,
-            'content': comment.content,
-            'created_at': comment.created_at.isoformat(),
-            'replies': replies_data,
-        })
+    fields, error = parse_fields(request, fieldsets.DETAIL_FIELDS)
+    if error:
+        return error
+    row = post_validators(request, slug)
+    if row is None:
+        # Checked before the cache, which may still hold an unpublished or
+        # deleted post
+        raise Http404('No BlogPost matches the given query.')
+    # The cached payload is shared by all callers; is_liked is per user and
+    # filled in below, the counters come from the validators row.
+    post_data = api_cache.get_or_build(
+        request, lambda: _post_detail_data(slug, fields), post_cache_validators(row),
+    )
+    set_post_counters(post_data, row)
+    # The payload may leave out the id; the validators row always has it
+    post_id = row['id']
+    viewed = record_view(request, post_id)
     
-    post_data = {
-        'id': post.id,
-        'title': post.title,
-        'slug': post.slug,
-        'content': post.content,
-        'excerpt': post.excerpt,
-        'author': post.author.username,
-        'category': post.category.name if post.category else None,
-        'featured_image': post.featured_image.url if post.featured_image else None,
-        'view_count': post.view_count,
-        'like_count': post.like_count,
-        'created_at': post.created_at.isoformat(),
-        'comments': comments_data,
-    }
+    if request.user.is_authenticated and 'is_liked' in post_data:
+        post_data['is_liked'] = Like.objects.filter(user=request.user, post_id=post_id).exists()
     
-    return JsonResponse(post_data)
+    return viewed.save(JsonResponse(post_data))
+
+
+def _posts_batch_data(slugs, fields):
+    batch = PostBatchAssembler(slugs, fields=fields).assemble()
+    related_posts = related.related_posts_for_many(batch.posts()) if batch.wants('related_posts') else {}
+    return posts_batch_payload(batch, related_posts)
+
+
+@budget(queries=10)
+@replica_reads
+@require_GET
+def api_posts_batch(request):
+    """
+    Several posts in one request: ?slugs=a,b,c (up to BLOG_API_BATCH_MAX_SLUGS)
+    returns {'posts': {slug: post}}, with {'error': 'Not found'} for slugs
+    that do not match a published post. Posts are serialized like the detail
+    API and accept the same `fields`. Batch reads are for feed consumers and
+    do not count as views.
+    """
+    slugs, error = parse_slugs(request)
+    if error:
+        return error
+    fields, error = parse_fields(request, fieldsets.DETAIL_FIELDS)
+    if error:
+        return error
+    data = api_cache.get_or_build(request, lambda: _posts_batch_data(slugs, fields))
+    counters = wanted_counters(fields)
+    found = found_posts(data)
+    if counters and found:
+        set_counters(found, counters, counters_query(counters, 'slug', list(found)))
+    likes = batch_likes_query(request, fields, data)
+    if likes is not None:
+        for slug in likes:
+            data['posts'][slug]['is_liked'] = True
+    return JsonResponse(data)
+
+
+@require_GET
+def api_posts_export(request):
+    """Stream every published post as NDJSON, optionally gzipped. Staff or token only."""
+    if not export.can_export(request):
+        return JsonResponse({'error': 'Export requires staff access or an export token'}, status=403)
+    since = request.GET.get('since')
+    if since:
+        try:
+            since = export.parse_since(since)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid since timestamp'}, status=400)
+    else:
+        since = None
+    
+    body = export.batch_bytes(export.ndjson_lines(export.iter_published_posts(since=since)))
+    response = StreamingHttpResponse(content_type='application/x-ndjson')
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body = export.gzip_stream(body)
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    response.streaming_content = body
+    return response
 
 
+def _categories_list_data():
+    return {'categories': [category_summary(category) for category in Category.objects.all()]}
+
+
+@budget(queries=4)
+@replica_reads
 def api_categories_list(request):
-    categories = Category.objects.all()
-    categories_data = []
-    
-    for category in categories:
-        categories_data.append({
-            'id': category.id,
-            'name': category.name,
-            'slug': category.slug,
-            'description': category.description,
-            'post_count': category.posts.filter(status='published').count(),
-        })
-    
-    return JsonResponse({'categories': categories_data})
+    return JsonResponse(api_cache.get_or_build(request, _categories_list_data))
 
 
 @require_POST
@@ -306,26 +352,20 @@ def api_add_comment(request, slug):
         if parent_id:
             parent = get_object_or_404(Comment, id=parent_id)
         
-        comment = Comment.objects.create(
+        comment = write_queue.run(
+            Comment.objects.create,
             post=post,
             author=request.user,
             content=content,
             parent=parent
         )
         
-        return JsonResponse({
-            'success': True,
-            'message': 'Comment submitted successfully',
-            'comment': {
-                'id': comment.id,
-                'author': comment.author.username,
-                'content': comment.content,
-                'status': comment.status,
-                'created_at': comment.created_at.isoformat(),
-            }
-        })
+        return JsonResponse(comment_created_payload(comment))
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Http404:
+        raise
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
@@ -0,0 +1,202 @@
+"""
+Single-writer queue for the small writes of hot endpoints.
+
+SQLite lets one connection write at a time, so likes, comments and view
+count flushes from every request thread queue up on the database lock.
+Instead they are handed to one writer thread per process, which takes
+whatever has queued up since its last commit and writes it all in one
+transaction: while one batch commits, the next one gathers. Each write
+runs in its own savepoint, so a failing write only fails its own caller.
+Callers block on a Future until the batch holding their write commits.
+The writer threads of a server's processes take turns through a lock file
+next to the database.
+
+A write runs inline in the calling thread instead when the queue is
+disabled (BLOG_WRITE_QUEUE_ENABLED), when the caller is inside a
+transaction (its write has to be part of it), when the queue already holds
+BLOG_WRITE_QUEUE_MAX_SIZE writes, or when it is still waiting after
+BLOG_WRITE_QUEUE_TIMEOUT seconds. A write the writer has already started
+is always waited for, so nothing is written twice.
+"""
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Write:
+    __slots__ = ('func', 'args', 'kwargs', 'future')
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+
+class WriteQueue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._lock_file = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'BLOG_WRITE_QUEUE_ENABLED', True)
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'BLOG_WRITE_QUEUE_BATCH_SIZE', 100)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'BLOG_WRITE_QUEUE_MAX_SIZE', 1000)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'BLOG_WRITE_QUEUE_TIMEOUT', 5.0)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) for the writer thread and return its
+        Future. Raises queue.Full when BLOG_WRITE_QUEUE_MAX_SIZE writes are
+        already waiting.
+        """
+        write = _Write(func, args, kwargs)
+        self._ensure_writer().put_nowait(write)
+        return write.future
+
+    def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the writer thread and return its result."""
+        if not self.enabled or connection.in_atomic_block or threading.current_thread() is self._thread:
+            return self._run_inline(func, args, kwargs)
+        try:
+            future = self.submit(func, *args, **kwargs)
+        except queue.Full:
+            logger.warning('Write queue is full; writing inline')
+            return self._run_inline(func, args, kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Already running (or it raised TimeoutError itself)
+                return future.result()
+        logger.warning('Write queue timed out after %ss; writing inline', self.timeout)
+        return self._run_inline(func, args, kwargs)
+
+    async def arun(self, func, *args, **kwargs):
+        return await sync_to_async(self.run)(func, *args, **kwargs)
+
+    def stop(self):
+        """Write everything queued so far and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+            self._queue = None
+        thread.join()
+
+    @staticmethod
+    def _run_inline(func, args, kwargs):
+        if connection.in_atomic_block:
+            return func(*args, **kwargs)
+        with transaction.atomic():
+            return func(*args, **kwargs)
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue(self.max_size)
+                self._thread = threading.Thread(
+                    target=self._run_writer, args=(self._queue,), name='blog-write-queue', daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def _run_writer(self, writes):
+        try:
+            stopping = False
+            while not stopping:
+                batch = [writes.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(writes.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    stopping = True
+                    batch = [write for write in batch if write is not None]
+                self._write_batch(batch)
+        finally:
+            connection.close()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _write_batch(self, batch):
+        # Writes whose callers gave up waiting have been run inline instead
+        batch = [write for write in batch if write.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        connection.close_if_unusable_or_obsolete()
+        try:
+            with self._process_lock(), transaction.atomic():
+                outcomes = [self._attempt(write) for write in batch]
+        except Exception:
+            # The batch rolled back as a whole (e.g. the commit failed);
+            # give every write a transaction of its own
+            logger.exception('Failed to commit a batch of %s writes; retrying one by one', len(batch))
+            outcomes = [self._attempt(write) for write in batch]
+        for write, (ok, value) in zip(batch, outcomes):
+            if ok:
+                write.future.set_result(value)
+            else:
+                write.future.set_exception(value)
+
+    @contextmanager
+    def _process_lock(self):
+        """
+        Take turns with the writer threads of other processes. Waiting on
+        SQLite's busy handler instead, which polls with growing sleeps, the
+        writer that just committed would win the lock again and again.
+        """
+        if fcntl is None or connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(f'{connection.settings_dict["NAME"]}-writer.lock', 'a')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _attempt(write):
+        try:
+            with transaction.atomic():
+                return True, write()
+        except Exception as e:
+            return False, e
+
+
+write_queue = WriteQueue()
+atexit.register(write_queue.stop)
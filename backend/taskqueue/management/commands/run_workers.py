@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from taskqueue.worker import EXECUTORS, Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Tasks run at the same time')
+        parser.add_argument('--executor', choices=EXECUTORS, default='thread',
+                            help='Run tasks in a thread pool or a process pool')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no task is due instead of waiting for more')
+        parser.add_argument('--max-tasks', type=int, help='Exit after running this many tasks')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'],
+            executor=options['executor'],
+            poll_interval=options['poll_interval'],
+        )
+        worker.install_signal_handlers()
+        processed = worker.run(burst=options['burst'], max_tasks=options['max_tasks'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} tasks.'))
@@ -0,0 +1,24 @@
+"""
+Entry points for process-pool workers. Pool processes are spawned fresh, so
+this module must be importable before Django is set up: it imports nothing
+that touches models at module level.
+"""
+import signal
+
+import django
+
+
+def init_process():
+    # Ctrl-C reaches the whole process group; let the parent worker decide
+    # when to stop so running tasks are not killed halfway.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+
+def run_task(task_id):
+    from django.db import close_old_connections
+
+    from .queue import run_task
+
+    close_old_connections()
+    return run_task(task_id)
@@ -0,0 +1,182 @@
+"""
+A small durable task queue stored in the database.
+
+Functions decorated with @task in an app's tasks.py can be enqueued from a
+view, which only inserts a Task row and returns. `manage.py run_workers`
+claims due rows and runs them in a thread or process pool, retrying
+failures with exponential backoff. Nothing but the database is needed, so
+it runs on SQLite alone.
+
+Claiming is a single conditional UPDATE tagging rows with a random token,
+so several worker processes never run the same task twice. Rows left
+`running` by a crashed worker are queued again after TASKS_LEASE_TIMEOUT.
+"""
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class TaskNotRegistered(LookupError):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """
+    Register a function as a task. The function gets the enqueued keyword
+    arguments, which must be JSON serializable, and should be safe to run
+    more than once: a worker can crash after the work but before the
+    task is marked done.
+    """
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        registry[task_name] = func
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.enqueue = lambda idempotency_key=None, delay=None, **kwargs: enqueue(
+            task_name, idempotency_key=idempotency_key, delay=delay, **kwargs
+        )
+        return func
+    return register(func) if func is not None else register
+
+
+def enqueue(name, idempotency_key=None, delay=None, **kwargs):
+    """
+    Queue `name` (a task name or @task function) to run with `kwargs`.
+
+    With an idempotency key, enqueueing the same key again returns the
+    existing task instead of adding another one; a task with that key that
+    has permanently failed is queued again. delay (seconds or timedelta)
+    postpones the first run. With TASKS_EAGER the task runs right away.
+    """
+    if callable(name):
+        name = name.task_name
+    func = registry.get(name)
+    if func is None:
+        raise TaskNotRegistered(name)
+    if isinstance(delay, (int, float)):
+        delay = timedelta(seconds=delay)
+    fields = {
+        'name': name,
+        'kwargs': kwargs,
+        'max_attempts': func.max_attempts or _setting('TASKS_MAX_ATTEMPTS', 3),
+        'run_after': timezone.now() + (delay or timedelta()),
+    }
+
+    if idempotency_key is None:
+        queued = Task.objects.create(**fields)
+    else:
+        try:
+            with transaction.atomic():
+                queued, created = Task.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+        except IntegrityError:
+            # Lost a race with another enqueue of the same key
+            queued, created = Task.objects.get(idempotency_key=idempotency_key), False
+        if not created:
+            requeued = Task.objects.filter(pk=queued.pk, status='failed').update(
+                status='queued', attempts=0, last_error='', finished_at=None,
+                run_after=fields['run_after'], kwargs=kwargs,
+            )
+            if requeued:
+                queued.refresh_from_db()
+            elif not _setting('TASKS_EAGER', False):
+                return queued
+
+    if _setting('TASKS_EAGER', False) and queued.status == 'queued':
+        run_task(queued.pk)
+        queued.refresh_from_db()
+    return queued
+
+
+def claim(limit, now=None):
+    """Atomically take up to `limit` due tasks. Returns their ids."""
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    due = Task.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id')
+    candidates = list(due.values_list('id', flat=True)[:limit])
+    if not candidates:
+        return []
+    # Tasks another worker claimed in between no longer match status='queued'
+    Task.objects.filter(id__in=candidates, status='queued').update(
+        status='running',
+        claim_token=token,
+        locked_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(claim_token=token).values_list('id', flat=True))
+
+
+def requeue_stale(now=None):
+    """Queue again tasks whose worker died while running them."""
+    now = now or timezone.now()
+    lease = timedelta(seconds=_setting('TASKS_LEASE_TIMEOUT', 600))
+    stale = Task.objects.filter(status='running', locked_at__lt=now - lease)
+    count = stale.filter(attempts__lt=F('max_attempts')).update(
+        status='queued', claim_token='', locked_at=None, run_after=now,
+        last_error='Worker lease expired',
+    )
+    count += stale.update(
+        status='failed', claim_token='', locked_at=None, finished_at=now,
+        last_error='Worker lease expired',
+    )
+    return count
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retry number `attempts`: exponential, jittered."""
+    base = _setting('TASKS_RETRY_BACKOFF', 5)
+    cap = _setting('TASKS_RETRY_BACKOFF_MAX', 600)
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_task(task_id):
+    """Run one task and record the outcome. Returns the final status."""
+    queued = Task.objects.filter(pk=task_id).first()
+    if queued is None:
+        return None
+    if queued.status == 'queued':
+        # Eager mode runs tasks without going through claim()
+        Task.objects.filter(pk=task_id).update(
+            status='running', attempts=F('attempts') + 1, locked_at=timezone.now(),
+        )
+        queued.refresh_from_db()
+
+    try:
+        func = registry.get(queued.name)
+        if func is None:
+            raise TaskNotRegistered(queued.name)
+        func(**queued.kwargs)
+    except Exception as e:
+        permanent = isinstance(e, TaskNotRegistered) or queued.attempts >= queued.max_attempts
+        logger.warning('Task %s #%s failed (attempt %s of %s)', queued.name, queued.pk,
+                       queued.attempts, queued.max_attempts, exc_info=True)
+        now = timezone.now()
+        update = {'claim_token': '', 'locked_at': None, 'last_error': traceback.format_exc()}
+        if permanent:
+            update.update(status='failed', finished_at=now)
+        else:
+            update.update(status='queued', run_after=now + timedelta(seconds=backoff_delay(queued.attempts)))
+        Task.objects.filter(pk=task_id).update(**update)
+        return update['status']
+
+    Task.objects.filter(pk=task_id).update(
+        status='succeeded', claim_token='', locked_at=None, last_error='', finished_at=timezone.now(),
+    )
+    return 'succeeded'
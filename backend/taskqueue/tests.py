@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import backoff_delay, claim, enqueue, requeue_stale, run_task, task
+from .worker import Worker
+
+calls = []
+
+
+@task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task(name='tests.flaky', max_attempts=2)
+def flaky(fail_times):
+    calls.append('flaky')
+    if calls.count('flaky') <= fail_times:
+        raise RuntimeError('boom')
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_claim_and_run(self):
+        queued = record.enqueue(value=1)
+        self.assertEqual(queued.status, 'queued')
+        self.assertEqual(claim(10), [queued.id])
+        self.assertEqual(claim(10), [])
+        self.assertEqual(run_task(queued.id), 'succeeded')
+        self.assertEqual(calls, [1])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('succeeded', 1))
+
+    def test_idempotency_key_deduplicates(self):
+        first = enqueue('tests.record', idempotency_key='only-once', value=1)
+        second = enqueue('tests.record', idempotency_key='only-once', value=2)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_delayed_tasks_are_not_claimed_early(self):
+        record.enqueue(value=1, delay=60)
+        self.assertEqual(claim(10), [])
+        self.assertEqual(len(claim(10, now=timezone.now() + timedelta(minutes=2))), 1)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        queued = flaky.enqueue(fail_times=5)
+        claim(1)
+        before = timezone.now()
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            self.assertEqual(run_task(queued.id), 'queued')
+        queued.refresh_from_db()
+        self.assertGreater(queued.run_after, before)
+        self.assertIn('RuntimeError: boom', queued.last_error)
+
+        claim(1, now=queued.run_after)
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            self.assertEqual(run_task(queued.id), 'failed')
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+
+    def test_backoff_grows_exponentially(self):
+        with override_settings(TASKS_RETRY_BACKOFF=2, TASKS_RETRY_BACKOFF_MAX=10):
+            self.assertLessEqual(backoff_delay(1), 2)
+            self.assertGreaterEqual(backoff_delay(3), 4)
+            self.assertLessEqual(backoff_delay(10), 10)
+
+    def test_stale_running_tasks_are_requeued(self):
+        queued = record.enqueue(value=1)
+        claim(1)
+        self.assertEqual(requeue_stale(), 0)
+        self.assertEqual(requeue_stale(now=timezone.now() + timedelta(hours=1)), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'queued')
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode_runs_inline(self):
+        queued = record.enqueue(value='now')
+        self.assertEqual(queued.status, 'succeeded')
+        self.assertEqual(calls, ['now'])
+
+
+@override_settings(TASKS_EAGER=False)
+class WorkerTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_burst_run_drains_the_queue(self):
+        for i in range(10):
+            record.enqueue(value=i)
+        worker = Worker(concurrency=3, poll_interval=0.01)
+        self.assertEqual(worker.run(burst=True), 10)
+        self.assertEqual(sorted(calls), list(range(10)))
+        self.assertEqual(Task.objects.filter(status='succeeded').count(), 10)
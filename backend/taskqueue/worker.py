@@ -0,0 +1,102 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.db import connection
+
+from . import process, queue
+
+logger = logging.getLogger(__name__)
+
+EXECUTORS = ('thread', 'process')
+
+
+def _run_in_thread(task_id):
+    try:
+        return queue.run_task(task_id)
+    finally:
+        connection.close()
+
+
+class Worker:
+    """
+    Polls the task table and keeps up to `concurrency` tasks running in a
+    thread pool (I/O-bound work such as storage uploads and deletes) or a
+    process pool (CPU-bound work that would hold the GIL).
+    """
+
+    def __init__(self, concurrency=4, executor='thread', poll_interval=1.0, stale_check_interval=60.0):
+        if executor not in EXECUTORS:
+            raise ValueError(f'Unknown executor {executor!r}')
+        self.concurrency = concurrency
+        self.executor = executor
+        self.poll_interval = poll_interval
+        self.stale_check_interval = stale_check_interval
+        self.processed = 0
+        self._stopping = threading.Event()
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def _make_pool(self):
+        if self.executor == 'process':
+            return ProcessPoolExecutor(
+                max_workers=self.concurrency,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=process.init_process,
+            ), process.run_task
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='taskqueue'), _run_in_thread
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def run(self, burst=False, max_tasks=None):
+        """
+        Process tasks until stop() is called. With burst=True, return as
+        soon as no task is due and none is running. Tasks already running
+        are always allowed to finish.
+        """
+        pool, run = self._make_pool()
+        in_flight = set()
+        next_stale_check = 0.0
+        logger.info('Task worker %s started with %s %s workers', os.getpid(), self.concurrency, self.executor)
+        try:
+            while not self._stopping.is_set():
+                if time.monotonic() >= next_stale_check:
+                    queue.requeue_stale()
+                    next_stale_check = time.monotonic() + self.stale_check_interval
+
+                free = self.concurrency - len(in_flight)
+                if max_tasks is not None:
+                    free = min(free, max_tasks - self.processed - len(in_flight))
+                claimed = queue.claim(free) if free > 0 else []
+                for task_id in claimed:
+                    in_flight.add(pool.submit(run, task_id))
+
+                if not in_flight:
+                    if burst or (max_tasks is not None and self.processed >= max_tasks):
+                        break
+                    self._stopping.wait(self.poll_interval)
+                    continue
+
+                done, in_flight = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                self._collect(done)
+            self._collect(wait(in_flight).done)
+        finally:
+            pool.shutdown(wait=True)
+            connection.close()
+        return self.processed
+
+    def _collect(self, futures):
+        for future in futures:
+            self.processed += 1
+            try:
+                future.result()
+            except Exception:
+                # run_task records task errors itself; this is the worker failing
+                logger.exception('Task worker failed to run a task')